@@ -0,0 +1,142 @@
+"""So sánh throughput khi nhiều request đồng thời gọi vào endpoint `async def`:
+
+- before: `async def` + Session đồng bộ (pymysql) -> mỗi query chặn cả event loop
+- after:  `async def` + AsyncSession (aiomysql / aiosqlite) -> query không chặn loop
+
+Dùng SQLite file tạm + 1 query chậm giả lập mỗi request (giống MySQL qua mạng),
+gọi thẳng app qua httpx.ASGITransport nên không cần chạy uvicorn.
+
+    pip install fastapi httpx sqlalchemy aiosqlite
+    python benchmarks/bench_async_db.py --requests 200 --concurrency 10 --latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import Column, Integer, create_engine, event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+Base = declarative_base()
+
+
+class CartItem(Base):
+    __tablename__ = "cart_items"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    food_id = Column(Integer)
+    quantity = Column(Integer)
+    branch_id = Column(Integer)
+
+
+# Giả lập query chậm ở phía DB server: hàm SQL sleep_ms() chạy trong thread của driver
+# (pymysql: chính thread đang gọi; aiosqlite/aiomysql: không phải event loop)
+SLOW_QUERY = text("SELECT sleep_ms(:ms)")
+
+
+def add_latency(engine):
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("sleep_ms", 1, lambda ms: time.sleep(ms / 1000) or 0)
+
+
+def build_app(db_path: str, latency_ms: float, pool_size: int, mode: str) -> FastAPI:
+    app = FastAPI()
+
+    if mode == "before":
+        engine = create_engine(f"sqlite:///{db_path}", pool_size=pool_size, connect_args={"check_same_thread": False})
+        add_latency(engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def get_db():
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        @app.get("/cart")
+        async def get_my_cart(user_id: int, db: Session = Depends(get_db)):
+            db.execute(SLOW_QUERY, {"ms": latency_ms})
+            return db.query(CartItem).filter(CartItem.user_id == user_id).all()
+    else:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", pool_size=pool_size)
+        add_latency(engine.sync_engine)
+        AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        async def get_async_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        @app.get("/cart")
+        async def get_my_cart(user_id: int, db: AsyncSession = Depends(get_async_db)):
+            await db.execute(SLOW_QUERY, {"ms": latency_ms})
+            return (await db.scalars(select(CartItem).where(CartItem.user_id == user_id))).all()
+
+    return app
+
+
+async def run(app: FastAPI, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.get("/cart", params={"user_id": i % 100 + 1})
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        await one(0)  # warm-up: mở kết nối đầu tiên
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def seed(db_path: str):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add_all(
+            CartItem(user_id=u, food_id=f, quantity=1, branch_id=1)
+            for u in range(1, 101) for f in range(1, 6)
+        )
+        db.commit()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed(db_path)
+        print(f"{args.requests} requests, concurrency {args.concurrency}, "
+              f"{args.latency_ms:g}ms/query, pool {args.pool_size}")
+        for mode in ("before", "after"):
+            app = build_app(db_path, args.latency_ms, args.pool_size, mode)
+            result = asyncio.run(run(app, args.requests, args.concurrency))
+            print(f"  {mode:6}  {result['rps']:8.1f} req/s   "
+                  f"p50 {result['p50_ms']:7.1f}ms   p99 {result['p99_ms']:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+
+import models
+
+# --- CẤU HÌNH ---
+CART_STORE = os.getenv("CART_STORE", "db")  # db | memory | redis | fake-redis
+CART_TTL = float(os.getenv("CART_TTL", 3 * 24 * 3600))  # giỏ không sửa quá lâu -> coi như bỏ, xóa
+CART_FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", 1))  # write-behind: bao lâu ghi xuống MySQL 1 lần
+CART_FLUSH_BATCH = int(os.getenv("CART_FLUSH_BATCH", 500))  # số giỏ tối đa / lần ghi
+CART_CLEANUP_INTERVAL = float(os.getenv("CART_CLEANUP_INTERVAL", 600))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# food_id -> (quantity, branch_id)
+Items = Dict[int, Tuple[int, int]]
+
+
+def apply_ops(items: Items, ops) -> Items:
+    """Áp dụng lô thao tác lên bản sao giỏ, lỗi ở bất kỳ thao tác nào -> raise, giỏ gốc không đổi.
+
+    ops: các object có .op (add | update | remove | clear), .food_id, .quantity, .branch_id
+    """
+    items = dict(items)
+    for op in ops:
+        if op.op == "clear":
+            items.clear()
+        elif op.op == "add":
+            qty = items.get(op.food_id, (0, op.branch_id))[0]
+            items[op.food_id] = (qty + op.quantity, op.branch_id)
+        elif op.op == "update":
+            if op.food_id not in items:
+                raise HTTPException(status_code=404, detail=f"Item not found: {op.food_id}")
+            if op.quantity <= 0:
+                del items[op.food_id]
+            else:
+                items[op.food_id] = (op.quantity, items[op.food_id][1])
+        else:  # remove
+            items.pop(op.food_id, None)
+    if len({branch_id for _, branch_id in items.values()}) > 1:
+        raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
+    return items
+
+
+def to_rows(user_id: int, items: Items) -> List[dict]:
+    return [
+        {"user_id": user_id, "food_id": food_id, "quantity": qty, "branch_id": branch_id}
+        for food_id, (qty, branch_id) in items.items()
+    ]
+
+
+class CartStore:
+    """Nơi lưu giỏ hàng của cart_service.
+
+    - get(user_id): các dòng giỏ [{user_id, food_id, quantity, branch_id}]
+    - apply(user_id, ops): 1 lô thao tác, nguyên tử (lỗi -> không đổi gì)
+    """
+
+    backend = "base"
+
+    def __init__(self, session_factory, ttl: float = CART_TTL, cleanup_interval: float = CART_CLEANUP_INTERVAL):
+        self.session_factory = session_factory  # AsyncSessionLocal
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._tasks: List[asyncio.Task] = []
+        self.expired_rows = 0
+
+    async def get(self, user_id: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def apply(self, user_id: int, ops):
+        raise NotImplementedError
+
+    # --- CHẠY NỀN ---
+    async def start(self):
+        self._tasks.append(asyncio.create_task(self._every(self.cleanup_interval, self.cleanup)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _every(self, interval: float, fn):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[cart_store] Lỗi {fn.__name__}: {e}")
+
+    async def cleanup(self):
+        # Giỏ bị bỏ quá CART_TTL -> xóa khỏi MySQL
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        async with self.session_factory() as db:
+            result = await db.execute(delete(models.CartItem).where(models.CartItem.updated_at < cutoff))
+            await db.commit()
+        self.expired_rows += result.rowcount or 0
+
+    async def stats(self) -> dict:
+        return {"backend": self.backend, "ttl": self.ttl, "expired_rows": self.expired_rows}
+
+
+# ==========================================
+# DB: mỗi thao tác là câu SQL trên cart_items (như cũ)
+# ==========================================
+def upsert_item_stmt(dialect: str, values: dict):
+    """INSERT 1 dòng giỏ; đã có (user_id, food_id) thì cộng dồn quantity ngay trong DB."""
+    Item = models.CartItem
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(Item).values(**values)
+        return stmt.on_duplicate_key_update(
+            quantity=Item.quantity + stmt.inserted.quantity, updated_at=stmt.inserted.updated_at
+        )
+    # SQLite (dev/test): INSERT ... ON CONFLICT DO UPDATE
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(Item).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "food_id"],
+        set_={"quantity": Item.quantity + stmt.excluded.quantity, "updated_at": stmt.excluded.updated_at},
+    )
+
+
+class DbCartStore(CartStore):
+    backend = "db"
+
+    async def get(self, user_id: int) -> List[dict]:
+        async with self.session_factory() as db:
+            rows = (await db.scalars(
+                select(models.CartItem).where(models.CartItem.user_id == user_id).order_by(models.CartItem.id)
+            )).all()
+        return [
+            {"user_id": r.user_id, "food_id": r.food_id, "quantity": r.quantity, "branch_id": r.branch_id}
+            for r in rows
+        ]
+
+    async def apply(self, user_id: int, ops):
+        Item = models.CartItem
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            dialect = db.bind.dialect.name
+            branches = set()
+            for op in ops:
+                mine = Item.user_id == user_id
+                if op.op == "clear":
+                    await db.execute(delete(Item).where(mine))
+                elif op.op == "add":
+                    await db.execute(upsert_item_stmt(dialect, {
+                        "user_id": user_id, "food_id": op.food_id, "quantity": op.quantity,
+                        "branch_id": op.branch_id, "updated_at": now,
+                    }))
+                    branches.add(op.branch_id)
+                else:
+                    where = (mine, Item.food_id == op.food_id)
+                    if op.op == "remove" or op.quantity <= 0:
+                        result = await db.execute(delete(Item).where(*where))
+                    else:
+                        result = await db.execute(update(Item).where(*where).values(quantity=op.quantity, updated_at=now))
+                    if op.op == "update" and not result.rowcount:
+                        raise HTTPException(status_code=404, detail=f"Item not found: {op.food_id}")
+
+            # Kiểm tra SAU khi ghi, trong cùng transaction: lỗi thì không commit -> rollback cả lô
+            if len(branches) > 1:
+                raise HTTPException(status_code=409, detail="Các món phải cùng 1 quán")
+            if branches:
+                other = await db.scalar(
+                    select(Item.branch_id).where(Item.user_id == user_id, Item.branch_id != branches.pop()).limit(1)
+                )
+                if other is not None:
+                    raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
+            await db.commit()
+
+
+# ==========================================
+# HOT STORE (RAM / Redis) + WRITE-BEHIND xuống cart_items
+# ==========================================
+class HotCartStore(CartStore):
+    """Đọc/ghi giỏ trong RAM hoặc Redis, MySQL chỉ nhận các lô ghi gom lại.
+
+    - giỏ chưa có trong hot store -> nạp từ cart_items 1 lần (sau restart / Redis mất dữ liệu)
+    - mỗi lần sửa: đánh dấu user "dirty"; flusher chạy mỗi CART_FLUSH_INTERVAL ghi đè
+      các giỏ dirty xuống cart_items trong 1 transaction
+    - giỏ không sửa quá CART_TTL: hết hạn trong hot store, cleanup() xóa ở MySQL
+    Mất tối đa ~CART_FLUSH_INTERVAL thay đổi nếu process chết (backend memory).
+    """
+
+    def __init__(self, session_factory, ttl: float = CART_TTL, flush_interval: float = CART_FLUSH_INTERVAL,
+                 flush_batch: int = CART_FLUSH_BATCH, cleanup_interval: float = CART_CLEANUP_INTERVAL):
+        super().__init__(session_factory, ttl, cleanup_interval)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.loads = 0
+        self.flushed_carts = 0
+        self.flush_batches = 0
+        self.flush_errors = 0
+        self.flush_skipped = 0
+
+    # Các thao tác cơ bản, từng backend tự cài
+    async def _read(self, user_id: int) -> Optional[Items]:
+        """None = chưa nạp vào hot store."""
+        raise NotImplementedError
+
+    async def _read_many(self, user_ids: List[int]) -> List[Optional[Items]]:
+        return [await self._read(user_id) for user_id in user_ids]
+
+    async def _seed(self, user_id: int, items: Items):
+        """Nạp giỏ đọc từ DB, không ghi đè nếu request khác đã nạp/sửa trước."""
+        raise NotImplementedError
+
+    async def _update(self, user_id: int, ops):
+        """Đọc giỏ -> apply_ops -> ghi lại + đánh dấu dirty, nguyên tử (request khác không chen giữa)."""
+        raise NotImplementedError
+
+    async def _pop_dirty(self, count: int) -> List[int]:
+        raise NotImplementedError
+
+    async def _mark_dirty(self, user_ids: Iterable[int]):
+        raise NotImplementedError
+
+    async def _dirty_count(self) -> int:
+        raise NotImplementedError
+
+    async def _load(self, user_id: int) -> Items:
+        items = await self._read(user_id)
+        if items is not None:
+            return items
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        async with self.session_factory() as db:
+            rows = (await db.scalars(
+                select(models.CartItem)
+                .where(models.CartItem.user_id == user_id, models.CartItem.updated_at >= cutoff)
+                .order_by(models.CartItem.id)
+            )).all()
+        self.loads += 1
+        await self._seed(user_id, {r.food_id: (r.quantity, r.branch_id) for r in rows})
+        return await self._read(user_id) or {}
+
+    async def get(self, user_id: int) -> List[dict]:
+        return to_rows(user_id, await self._load(user_id))
+
+    async def apply(self, user_id: int, ops):
+        await self._update(user_id, ops)
+
+    # --- WRITE-BEHIND ---
+    async def start(self):
+        await super().start()
+        self._tasks.append(asyncio.create_task(self._every(self.flush_interval, self.flush)))
+
+    async def stop(self):
+        await super().stop()
+        await self.flush()  # ghi nốt trước khi tắt
+
+    async def flush(self) -> int:
+        total = 0
+        while True:
+            sent = await self.flush_once()
+            total += sent
+            if sent < self.flush_batch:
+                return total
+
+    async def flush_once(self) -> int:
+        user_ids = await self._pop_dirty(self.flush_batch)
+        if not user_ids:
+            return 0
+        # Đọc giỏ SAU khi lấy khỏi dirty: sửa tiếp trong lúc ghi sẽ đánh dấu dirty lại -> lần sau ghi tiếp
+        now = datetime.utcnow()
+        flushed, rows = [], []
+        for user_id, items in zip(user_ids, await self._read_many(user_ids)):
+            if items is None:
+                # Key đã mất (Redis evict / hết hạn): không có gì mới để ghi, giữ nguyên dòng MySQL
+                # (ghi như giỏ rỗng sẽ xóa mất giỏ của user)
+                self.flush_skipped += 1
+                continue
+            flushed.append(user_id)
+            for row in to_rows(user_id, items):
+                row["updated_at"] = now
+                rows.append(row)
+        if flushed:
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(delete(models.CartItem).where(models.CartItem.user_id.in_(flushed)))
+                    if rows:
+                        await db.execute(models.CartItem.__table__.insert(), rows)
+                    await db.commit()
+            except Exception:
+                self.flush_errors += 1
+                await self._mark_dirty(flushed)
+                raise
+            self.flushed_carts += len(flushed)
+            self.flush_batches += 1
+        return len(user_ids)
+
+    async def stats(self) -> dict:
+        return {
+            **await super().stats(),
+            "dirty": await self._dirty_count(),
+            "loads": self.loads,
+            "flushed_carts": self.flushed_carts,
+            "flush_batches": self.flush_batches,
+            "flush_errors": self.flush_errors,
+            "flush_skipped": self.flush_skipped,
+        }
+
+
+class _MemoryCart:
+    __slots__ = ("items", "expires")
+
+    def __init__(self, items: Items, expires: float):
+        self.items = items
+        self.expires = expires
+
+
+class MemoryCartStore(HotCartStore):
+    """Giỏ trong RAM của process (chỉ chạy 1 replica cart_service)."""
+
+    backend = "memory"
+
+    def __init__(self, session_factory, **kwargs):
+        super().__init__(session_factory, **kwargs)
+        self._carts: Dict[int, _MemoryCart] = {}
+        self._dirty = set()
+
+    def _get(self, user_id: int) -> Optional[Items]:
+        cart = self._carts.get(user_id)
+        if cart is None or cart.expires <= time.monotonic():
+            return None
+        return cart.items
+
+    async def _read(self, user_id: int) -> Optional[Items]:
+        return self._get(user_id)
+
+    async def _seed(self, user_id: int, items: Items):
+        if self._get(user_id) is None:
+            self._carts[user_id] = _MemoryCart(items, time.monotonic() + self.ttl)
+
+    async def _update(self, user_id: int, ops):
+        before = await self._load(user_id)
+        # Không có await giữa đọc lại và ghi -> nguyên tử trong event loop
+        after = apply_ops(self._get(user_id) or before, ops)
+        self._carts[user_id] = _MemoryCart(after, time.monotonic() + self.ttl)
+        self._dirty.add(user_id)
+
+    async def _pop_dirty(self, count: int) -> List[int]:
+        return [self._dirty.pop() for _ in range(min(count, len(self._dirty)))]
+
+    async def _mark_dirty(self, user_ids: Iterable[int]):
+        self._dirty.update(user_ids)
+
+    async def _dirty_count(self) -> int:
+        return len(self._dirty)
+
+    async def cleanup(self):
+        now = time.monotonic()
+        for user_id in [u for u, c in self._carts.items() if c.expires <= now and u not in self._dirty]:
+            del self._carts[user_id]
+        await super().cleanup()
+
+    async def stats(self) -> dict:
+        return {**await super().stats(), "carts": len(self._carts)}
+
+
+class RedisCartStore(HotCartStore):
+    """Giỏ = 1 hash Redis / user, dùng chung giữa nhiều replica.
+
+    `client` là redis.asyncio.Redis(decode_responses=True) hoặc FakeAsyncRedis. Field "f:<food_id>" = quantity,
+    "branch" = quán của giỏ, "_" = đánh dấu đã nạp (giỏ rỗng vẫn có key).
+    Sửa giỏ = WATCH key -> đọc -> apply_ops (kiểm tra 1 quán / giỏ) -> MULTI ghi lại cả hash + SADD dirty -> EXEC;
+    replica khác sửa chen giữa thì EXEC hủy và làm lại từ đầu -> không lọt giỏ 2 quán, không mất lượt cộng.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, session_factory, prefix: str = "cart:", **kwargs):
+        super().__init__(session_factory, **kwargs)
+        self.client = client
+        self.prefix = prefix
+        self.dirty_key = prefix + "dirty"
+        self.conflicts = 0
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    @staticmethod
+    def _decode(data: dict) -> Optional[Items]:
+        if not data:
+            return None
+        branch_id = int(data["branch"]) if data.get("branch") else None
+        return {int(f[2:]): (int(v), branch_id) for f, v in data.items() if f.startswith("f:")}
+
+    @staticmethod
+    def _encode(items: Items) -> dict:
+        mapping = {"_": 1}
+        for food_id, (qty, branch_id) in items.items():
+            mapping[f"f:{food_id}"] = qty
+            if branch_id is not None:
+                mapping["branch"] = branch_id
+        return mapping
+
+    async def _read(self, user_id: int) -> Optional[Items]:
+        return self._decode(await self.client.hgetall(self._key(user_id)))
+
+    async def _read_many(self, user_ids: List[int]) -> List[Optional[Items]]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.hgetall(self._key(user_id))
+            return [self._decode(data) for data in await pipe.execute()]
+
+    async def _seed(self, user_id: int, items: Items):
+        key = self._key(user_id)
+
+        async def seed(pipe):
+            if await pipe.exists(key):
+                return  # request khác đã nạp / sửa trước
+            pipe.multi()
+            pipe.hset(key, mapping=self._encode(items))
+            pipe.expire(key, int(self.ttl))
+
+        await self.client.transaction(seed, key)
+
+    async def _update(self, user_id: int, ops):
+        key = self._key(user_id)
+        attempts = 0
+
+        async def write(pipe):
+            nonlocal attempts
+            attempts += 1
+            before = self._decode(await pipe.hgetall(key))
+            if before is None:
+                return False  # key vừa hết hạn sau _load -> nạp lại rồi thử lại
+            after = apply_ops(before, ops)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.hset(key, mapping=self._encode(after))
+            pipe.expire(key, int(self.ttl))
+            pipe.sadd(self.dirty_key, user_id)
+            return True
+
+        while True:
+            await self._load(user_id)
+            done = await self.client.transaction(write, key, value_from_callable=True)
+            self.conflicts += max(attempts - 1, 0)
+            attempts = 0
+            if done:
+                return
+
+    async def _pop_dirty(self, count: int) -> List[int]:
+        return [int(u) for u in await self.client.spop(self.dirty_key, count) or []]
+
+    async def _mark_dirty(self, user_ids: Iterable[int]):
+        user_ids = list(user_ids)
+        if user_ids:
+            await self.client.sadd(self.dirty_key, *user_ids)
+
+    async def _dirty_count(self) -> int:
+        return await self.client.scard(self.dirty_key)
+
+    async def stop(self):
+        await super().stop()
+        await self.client.aclose()
+
+    async def stats(self) -> dict:
+        return {**await super().stats(), "conflicts": self.conflicts}
+
+
+def create_cart_store(session_factory, kind: str = CART_STORE) -> CartStore:
+    if kind == "redis":
+        import redis.asyncio as redis_asyncio  # chỉ cần cài khi dùng backend redis
+        return RedisCartStore(redis_asyncio.from_url(REDIS_URL, decode_responses=True), session_factory)
+    if kind == "fake-redis":
+        from common.fakeredis import FakeAsyncRedis
+        return RedisCartStore(FakeAsyncRedis(), session_factory)
+    if kind == "memory":
+        return MemoryCartStore(session_factory)
+    return DbCartStore(session_factory)
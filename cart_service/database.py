@@ -1,18 +1,17 @@
-import os
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from common.db import Database
 
-DB_USER = os.getenv("DB_ROOT_USER", "root")
-DB_PASS = os.getenv("DB_PASSWORD", "123456")
+# Engine/session + pool dựng ở common/db.py, cấu hình qua biến môi trường:
+#   CART_DB_HOST, CART_DATABASE_URL, CART_DB_POOL_SIZE, CART_DB_MAX_OVERFLOW, CART_DB_POOL_RECYCLE, ...
+database = Database("CART", "cart_db")
 
-# Mặc định trỏ về 'db'
-DB_HOST = os.getenv("CART_DB_HOST", "db")
-DB_NAME = "cart_db"
+engine = database.engine
+SessionLocal = database.SessionLocal
+get_db = database.get_db
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Session async cho các endpoint `async def` (aiomysql; test có thể dùng sqlite+aiosqlite)
+async_engine = database.async_engine
+AsyncSessionLocal = database.AsyncSessionLocal
+get_async_db = database.get_async_db
 
 Base = declarative_base()
\ No newline at end of file
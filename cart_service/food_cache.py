@@ -0,0 +1,53 @@
+import os
+import time
+from typing import Dict, Iterable
+
+from common.resilience import resilience
+
+RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant_service:8002")
+# Thông tin món (tên, giá, ảnh) thay đổi rất ít -> cache ngắn hạn ngay trong cart_service
+FOOD_CACHE_TTL = float(os.getenv("FOOD_CACHE_TTL", 30))
+FOOD_CACHE_MAX_SIZE = int(os.getenv("FOOD_CACHE_MAX_SIZE", 5000))
+
+
+class FoodCache:
+    """Cache food_id -> dữ liệu món, các món thiếu được lấy bằng 1 lần gọi /foods/batch."""
+
+    def __init__(self, ttl: float = FOOD_CACHE_TTL, max_size: int = FOOD_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: Dict[int, tuple] = {}
+
+    def _put(self, food: dict):
+        if len(self._items) >= self.max_size:
+            # Hết chỗ -> dọn các entry đã hết hạn, nếu vẫn đầy thì xóa entry cũ nhất
+            now = time.monotonic()
+            self._items = {k: v for k, v in self._items.items() if v[1] > now}
+            if len(self._items) >= self.max_size:
+                self._items.pop(next(iter(self._items)))
+        self._items[food["id"]] = (food, time.monotonic() + self.ttl)
+
+    async def get_many(self, food_ids: Iterable[int]) -> Dict[int, dict]:
+        now = time.monotonic()
+        found: Dict[int, dict] = {}
+        missing = []
+        for food_id in set(food_ids):
+            entry = self._items.get(food_id)
+            if entry and entry[1] > now:
+                found[food_id] = entry[0]
+            else:
+                missing.append(food_id)
+
+        if missing:
+            client = resilience.client("restaurant_service", RESTAURANT_SERVICE_URL, timeout=5.0)
+            res = await client.get(
+                "/foods/batch", params={"ids": ",".join(str(i) for i in sorted(missing))}
+            )
+            res.raise_for_status()
+            for food in res.json():
+                self._put(food)
+                found[food["id"]] = food
+        return found
+
+
+food_cache = FoodCache()
@@ -1,42 +1,59 @@
+import os
 import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+from database import database, engine, Base, AsyncSessionLocal
+from common.auth import verify_request
+from common.lifespan import service_lifespan
+from common.resilience import resilience
+from food_cache import food_cache
+from cart_store import create_cart_store
 import models
+from typing import List, Literal, Optional
 
 # Tạo lại bảng
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# Nơi lưu giỏ: CART_STORE=db (mỗi thao tác ghi MySQL) | memory | redis (RAM/Redis + ghi dồn xuống MySQL)
+cart_store = create_cart_store(AsyncSessionLocal)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Warm-up pool DB lúc startup, đóng HTTP client + pool khi tắt (common/lifespan.py)
+app = FastAPI(lifespan=service_lifespan(database, on_startup=[cart_store.start], on_shutdown=[cart_store.stop]))
 
 # --- AUTH HELPER ---
 async def get_user_id(request: Request):
-    token = request.headers.get("Authorization")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing Token")
-    try:
-        # Gọi User Service xác thực (qua Gateway hoặc trực tiếp)
-        async with httpx.AsyncClient() as client:
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid Token")
-            return res.json()['id']
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=str(e))
+    # Xác thực JWT ngay tại service (không gọi sang User Service nữa)
+    user = await verify_request(request)
+    return user['id']
+
+CART_BATCH_MAX_OPS = int(os.getenv("CART_BATCH_MAX_OPS", 100))
+
+class CartOp(BaseModel):
+    op: Literal["add", "update", "remove", "clear"]
+    food_id: Optional[int] = None
+    quantity: int = 1
+    branch_id: Optional[int] = None
+
+class CartBatch(BaseModel):
+    ops: List[CartOp]
+
+def validate_op(op: CartOp):
+    if op.op == "clear":
+        return
+    if op.food_id is None:
+        raise HTTPException(status_code=400, detail=f"Missing food_id ({op.op})")
+    if op.op == "add":
+        if not op.branch_id:
+            raise HTTPException(status_code=400, detail="Missing branch_id")
+        if op.quantity < 1:
+            raise HTTPException(status_code=400, detail="Invalid quantity")
 
 # ==========================================
 # API GIỎ HÀNG THÔNG MINH
 # ==========================================
 
 @app.post("/cart")
-async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def add_to_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     
     # Nhận dữ liệu từ UI
@@ -46,60 +63,100 @@ async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db
     
     if not b_id:
         raise HTTPException(status_code=400, detail="Missing branch_id")
+    if not f_id or qty < 1:
+        raise HTTPException(status_code=400, detail="Invalid food_id/quantity")
 
-    # 1. Kiểm tra giỏ hàng hiện tại
-    existing_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
-    
-    if existing_items:
-        # Lấy branch_id của món đầu tiên trong giỏ
-        current_branch = existing_items[0].branch_id
-        
-        # Nếu khác branch -> Báo lỗi ngay
-        if current_branch != b_id:
-             raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
-            
-        # Nếu cùng branch -> Cộng dồn số lượng nếu trùng món
-        found = False
-        for cart_item in existing_items:
-            if cart_item.food_id == f_id:
-                cart_item.quantity += qty
-                found = True
-                break
-        
-        if not found:
-            new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-            db.add(new_item)
-            
-    else:
-        # Giỏ trống -> Thêm mới
-        new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-        db.add(new_item)
-
-    db.commit()
+    # Thêm hoặc cộng dồn (atomic); giỏ đang chứa món quán khác -> 409
+    await cart_store.apply(user_id, [CartOp(op="add", food_id=f_id, quantity=qty, branch_id=b_id)])
     return {"message": "Added"}
 
+# Nhiều thao tác trong 1 request / 1 transaction (lỗi ở bất kỳ thao tác nào -> không đổi gì)
+# vd: {"ops": [{"op": "clear"}, {"op": "add", "food_id": 1, "branch_id": 2, "quantity": 1}]}
+@app.post("/cart/batch")
+async def batch_update_cart(payload: CartBatch, request: Request):
+    user_id = await get_user_id(request)
+    if len(payload.ops) > CART_BATCH_MAX_OPS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {CART_BATCH_MAX_OPS} thao tác / lần")
+    for op in payload.ops:
+        validate_op(op)
+    await cart_store.apply(user_id, payload.ops)
+    return {"message": "Updated", "applied": len(payload.ops)}
+
 @app.get("/cart")
-async def get_my_cart(request: Request, db: Session = Depends(get_db)):
+async def get_my_cart(request: Request):
+    user_id = await get_user_id(request)
+    return await cart_store.get(user_id)
+
+# Giỏ hàng kèm sẵn thông tin món (tên, giá, ảnh, thành tiền)
+# -> Frontend không phải gọi /foods/{id} cho từng dòng nữa
+@app.get("/cart/details")
+async def get_my_cart_details(request: Request):
     user_id = await get_user_id(request)
-    return db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
+    cart_items = await cart_store.get(user_id)
+
+    foods = {}
+    if cart_items:
+        try:
+            foods = await food_cache.get_many(i['food_id'] for i in cart_items)
+        except httpx.HTTPError as e:
+            print(f"Lỗi lấy thông tin món: {e}")
+            raise HTTPException(status_code=503, detail="Restaurant Service Unavailable")
+
+    items = []
+    sub_total = 0
+    for cart_item in cart_items:
+        food = foods.get(cart_item['food_id'])
+        price = food['price'] if food else 0
+        discount = (food.get('discount') or 0) if food else 0
+        final_price = price * (1 - discount / 100)
+        line_total = final_price * cart_item['quantity']
+        sub_total += line_total
+        items.append({
+            "food_id": cart_item['food_id'],
+            "branch_id": cart_item['branch_id'],
+            "quantity": cart_item['quantity'],
+            "name": food['name'] if food else "Món đã xóa",
+            "price": price,
+            "discount": discount,
+            "final_price": final_price,
+            "image_url": food.get('image_url') if food else None,
+            "line_total": line_total,
+            "available": food is not None,
+        })
+
+    return {
+        "branch_id": cart_items[0]['branch_id'] if cart_items else None,
+        "items": items,
+        "total_quantity": sum(i['quantity'] for i in cart_items),
+        "sub_total": sub_total,
+    }
 
 @app.put("/cart")
-async def update_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def update_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     f_id = item.get('food_id')
     qty = item.get('quantity')
-    
-    cart_item = db.query(models.CartItem).filter(models.CartItem.user_id == user_id, models.CartItem.food_id == f_id).first()
-    if cart_item:
-        if qty <= 0: db.delete(cart_item)
-        else: cart_item.quantity = qty
-        db.commit()
-        return {"message": "Updated"}
-    raise HTTPException(status_code=404, detail="Item not found")
+    if f_id is None or qty is None:
+        raise HTTPException(status_code=400, detail="Missing food_id/quantity")
+
+    # quantity <= 0 -> xóa món; món không có trong giỏ -> 404
+    await cart_store.apply(user_id, [CartOp(op="update", food_id=f_id, quantity=qty)])
+    return {"message": "Updated"}
 
 @app.delete("/cart")
-async def clear_cart(request: Request, db: Session = Depends(get_db)):
+async def clear_cart(request: Request):
     user_id = await get_user_id(request)
-    db.query(models.CartItem).filter(models.CartItem.user_id == user_id).delete()
-    db.commit()
-    return {"message": "Cleared"}
\ No newline at end of file
+    await cart_store.apply(user_id, [CartOp(op="clear")])
+    return {"message": "Cleared"}
+
+# Số liệu pool kết nối DB (thời gian chờ checkout, timeout...) để chỉnh CART_DB_POOL_SIZE
+@app.get("/metrics/db")
+def db_metrics(): return database.stats()
+
+# Giỏ trong hot store, số giỏ chờ ghi xuống MySQL, số lần ghi dồn...
+@app.get("/metrics/cart")
+async def cart_metrics(): return await cart_store.stats()
+
+# Breaker / retry / độ trễ các lần gọi restaurant_service, user_service
+@app.get("/metrics/resilience")
+def resilience_metrics(): return resilience.stats()
@@ -1,13 +1,28 @@
-from sqlalchemy import Column, Integer
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, Index, UniqueConstraint
 from database import Base
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    # Mỗi user chỉ có 1 dòng / món -> thêm món dùng upsert, 2 request song song không tạo dòng trùng.
+    # Unique (user_id, food_id) cũng là index cho mọi truy vấn "giỏ của user";
+    # (user_id, branch_id) cho kiểm tra "giỏ chỉ chứa món của 1 quán" không phải đọc cả dòng.
+    # DB cũ: gộp dòng trùng rồi tạo constraint (create_all không sửa bảng đã có):
+    #   ALTER TABLE cart_items ADD CONSTRAINT uq_cart_items_user_food UNIQUE (user_id, food_id);
+    #   CREATE INDEX ix_cart_items_user_branch ON cart_items (user_id, branch_id);
+    #   ALTER TABLE cart_items ADD COLUMN updated_at DATETIME, ADD INDEX ix_cart_items_updated_at (updated_at);
+    __table_args__ = (
+        UniqueConstraint("user_id", "food_id", name="uq_cart_items_user_food"),
+        Index("ix_cart_items_user_branch", "user_id", "branch_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    food_id = Column(Integer)
+    user_id = Column(Integer, nullable=False)
+    food_id = Column(Integer, nullable=False)
     quantity = Column(Integer, default=1)
     
     # --- UPDATE: Lưu thêm branch_id ---
-    branch_id = Column(Integer)
\ No newline at end of file
+    branch_id = Column(Integer)
+
+    # Lần sửa cuối -> giỏ bỏ quá CART_TTL bị dọn (cart_store.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
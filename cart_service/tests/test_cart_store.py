@@ -0,0 +1,133 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from common.fakeredis import FakeAsyncRedis
+from database import AsyncSessionLocal
+from cart_store import MemoryCartStore, RedisCartStore, apply_ops
+import models
+
+
+def op(kind, food_id=None, quantity=1, branch_id=1):
+    return SimpleNamespace(op=kind, food_id=food_id, quantity=quantity, branch_id=branch_id)
+
+
+async def db_rows(user_id):
+    async with AsyncSessionLocal() as db:
+        rows = (await db.scalars(select(models.CartItem).where(models.CartItem.user_id == user_id))).all()
+    return {r.food_id: (r.quantity, r.branch_id) for r in rows}
+
+
+# --- apply_ops ---
+def test_apply_ops_add_update_remove():
+    items = apply_ops({}, [op("add", 1, 2), op("add", 1, 3), op("add", 2, 1)])
+    assert items == {1: (5, 1), 2: (1, 1)}
+    assert apply_ops(items, [op("update", 1, 7), op("remove", 2)]) == {1: (7, 1)}
+    assert apply_ops(items, [op("update", 1, 0)]) == {2: (1, 1)}
+
+
+def test_apply_ops_update_missing_item_is_404():
+    with pytest.raises(HTTPException) as e:
+        apply_ops({1: (1, 1)}, [op("update", 9, 2)])
+    assert e.value.status_code == 404
+
+
+def test_apply_ops_other_branch_is_409_and_leaves_cart_unchanged():
+    items = {1: (2, 1)}
+    with pytest.raises(HTTPException) as e:
+        apply_ops(items, [op("add", 5, 1, branch_id=2)])
+    assert e.value.status_code == 409
+    assert items == {1: (2, 1)}
+    # clear trong cùng lô -> đổi quán được
+    assert apply_ops(items, [op("clear"), op("add", 5, 1, branch_id=2)]) == {5: (1, 2)}
+
+
+# --- hot store (RAM / fake Redis) + write-behind ---
+STORES = {
+    "memory": lambda: MemoryCartStore(AsyncSessionLocal),
+    "redis": lambda: RedisCartStore(FakeAsyncRedis(), AsyncSessionLocal),
+}
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request):
+    return STORES[request.param]()
+
+
+def test_concurrent_adds_are_all_counted(store, run):
+    async def scenario():
+        await asyncio.gather(*(store.apply(1, [op("add", 1, 1)]) for _ in range(30)))
+        return await store.get(1)
+
+    assert run(scenario()) == [{"user_id": 1, "food_id": 1, "quantity": 30, "branch_id": 1}]
+
+
+def test_concurrent_adds_from_two_branches_keep_one_branch(store, run):
+    async def scenario():
+        results = await asyncio.gather(
+            store.apply(1, [op("add", 1, 1, branch_id=1)]),
+            store.apply(1, [op("add", 2, 1, branch_id=2)]),
+            return_exceptions=True,
+        )
+        return results, await store.get(1)
+
+    results, rows = run(scenario())
+    assert [getattr(r, "status_code", None) for r in results].count(409) == 1
+    assert len({r["branch_id"] for r in rows}) == 1
+
+
+def test_flush_writes_dirty_carts(store, run):
+    async def scenario():
+        await store.apply(1, [op("add", 1, 2), op("add", 2, 1)])
+        await store.apply(2, [op("add", 3, 1, branch_id=4)])
+        await store.flush()
+        return await db_rows(1), await db_rows(2), await store.stats()
+
+    rows1, rows2, stats = run(scenario())
+    assert rows1 == {1: (2, 1), 2: (1, 1)}
+    assert rows2 == {3: (1, 4)}
+    assert stats["dirty"] == 0 and stats["flushed_carts"] == 2
+
+
+def test_flush_of_cleared_cart_deletes_rows(store, run):
+    async def scenario():
+        await store.apply(1, [op("add", 1, 2)])
+        await store.flush()
+        await store.apply(1, [op("clear")])
+        await store.flush()
+        return await db_rows(1)
+
+    assert run(scenario()) == {}
+
+
+def test_cart_is_loaded_from_db_when_missing_in_hot_store(store, run):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add(models.CartItem(user_id=1, food_id=1, quantity=3, branch_id=1))
+            await db.commit()
+        await store.apply(1, [op("add", 1, 1)])
+        return await store.get(1), store.loads
+
+    rows, loads = run(scenario())
+    assert rows == [{"user_id": 1, "food_id": 1, "quantity": 4, "branch_id": 1}]
+    assert loads == 1
+
+
+def test_flush_skips_evicted_key_and_keeps_db_rows(run):
+    client = FakeAsyncRedis()
+    store = RedisCartStore(client, AsyncSessionLocal)
+
+    async def scenario():
+        await store.apply(1, [op("add", 1, 2)])
+        await store.flush()
+        await store.apply(1, [op("add", 1, 1)])
+        await client.delete(store._key(1))  # Redis evict giỏ trước khi flusher kịp ghi
+        await store.flush()
+        return await db_rows(1), await store.stats()
+
+    rows, stats = run(scenario())
+    assert rows == {1: (2, 1)}
+    assert stats["flush_skipped"] == 1 and stats["dirty"] == 0
@@ -0,0 +1 @@
+# Code dùng chung cho các service (được COPY vào image của từng service, xem Dockerfile)
@@ -0,0 +1,119 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+
+from common.resilience import resilience
+
+# --- CẤU HÌNH (phải khớp với user_service.create_access_token) ---
+SECRET_KEY = os.getenv("SECRET_KEY", "chuoi_mac_dinh_phong_khi_quen_set_env")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+# Cache claims đã giải mã, key = token, sống tới khi token hết hạn (exp)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+
+# Tùy chọn: hỏi lại user_service /verify (vd: để chặn token đã bị thu hồi).
+# Kết quả remote được nhớ AUTH_REMOTE_RECHECK_SECONDS giây để không quay lại
+# cảnh mỗi request một round trip.
+AUTH_REMOTE_VERIFY = os.getenv("AUTH_REMOTE_VERIFY", "0") == "1"
+AUTH_REMOTE_RECHECK_SECONDS = float(os.getenv("AUTH_REMOTE_RECHECK_SECONDS", 60))
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8001")
+
+
+class ClaimsCache:
+    """LRU nhỏ: token -> (claims, exp, lần check remote gần nhất)."""
+
+    def __init__(self, max_size: int = AUTH_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Tuple[dict, float, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Tuple[dict, float]]:
+        entry = self._items.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, exp, checked_at = entry
+        if exp <= time.time():
+            # Token hết hạn -> bỏ khỏi cache, để jwt.decode báo lỗi như bình thường
+            self._items.pop(token, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(token)
+        self.hits += 1
+        return claims, checked_at
+
+    def put(self, token: str, claims: dict, checked_at: float = 0.0):
+        exp = float(claims.get("exp") or 0)
+        if exp <= time.time():
+            return
+        self._items[token] = (claims, exp, checked_at)
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def discard(self, token: str):
+        self._items.pop(token, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+claims_cache = ClaimsCache()
+
+
+def extract_token(authorization: Optional[str]) -> str:
+    if not authorization:
+        raise HTTPException(401, "Missing Token")
+    return authorization.replace("Bearer ", "").strip()
+
+
+def decode_token(token: str) -> dict:
+    """Xác thực chữ ký HS256 + exp ngay tại service, không gọi mạng."""
+    cached = claims_cache.get(token)
+    if cached is not None:
+        return cached[0]
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(401, "Invalid Token")
+    claims_cache.put(token, claims)
+    return claims
+
+
+async def _remote_verify(token: str, claims: dict):
+    cached = claims_cache.get(token)
+    if cached is not None and time.time() - cached[1] < AUTH_REMOTE_RECHECK_SECONDS:
+        return
+    client = resilience.client("user_service", USER_SERVICE_URL, timeout=3.0)
+    try:
+        res = await client.get("/verify", headers={"Authorization": f"Bearer {token}"})
+    except httpx.HTTPError as e:
+        # user_service không phản hồi / breaker đang mở -> tin vào chữ ký đã kiểm tra ở local
+        print(f"Lỗi verify remote: {e}")
+        return
+    if res.status_code >= 500:
+        print(f"Lỗi verify remote: user_service trả {res.status_code}")
+        return
+    if res.status_code != 200:
+        claims_cache.discard(token)
+        raise HTTPException(401, "Invalid Token")
+    claims_cache.put(token, claims, checked_at=time.time())
+
+
+async def verify_request(request: Request) -> dict:
+    """Dependency/helper thay cho việc gọi user_service /verify ở mỗi request.
+
+    Trả về payload của token (id, role, branch_id, seller_mode, ...), giống
+    hệt response của /verify, hoặc raise 401.
+    """
+    token = extract_token(request.headers.get("Authorization"))
+    claims = decode_token(token)
+    if AUTH_REMOTE_VERIFY:
+        await _remote_verify(token, claims)
+    return claims
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+# --- CẤU HÌNH ---
+# Mặc định sql: các service chạy local (mỗi service 1 process, cùng máy) vẫn thấy event của nhau qua
+# cùng 1 file SQLite trong thư mục tạm. memory chỉ dùng được khi producer & consumer chạy chung 1 process.
+# Mỗi service 1 container -> file SQLite không dùng chung được: dùng redis, hoặc EVENT_BROKER_URL trỏ tới
+# DB chung (MySQL / file SQLite trên volume chung).
+EVENT_BROKER = os.getenv("EVENT_BROKER", "sql")  # sql | redis | memory | fake-redis
+_DEFAULT_EVENTS_DB = os.path.join(tempfile.gettempdir(), "food_events.db")
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", f"sqlite:///{_DEFAULT_EVENTS_DB}")  # cho EVENT_BROKER=sql
+EVENT_STREAM = os.getenv("EVENT_STREAM", "events")
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", 100000))
+# Tin đã giao nhưng quá lâu chưa ack (consumer chết giữa chừng) -> giao lại cho consumer khác
+EVENT_REDELIVER_AFTER = float(os.getenv("EVENT_REDELIVER_AFTER", 30))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+Message = Tuple[str, dict]  # (message id trong broker, event)
+
+
+class EventBroker:
+    """Kênh sự kiện giữa các service (at-least-once).
+
+    - publish(events): ghi 1 lô event (dict, xem common/events.py)
+    - read(group, consumer, ...): lấy tin chưa xử lý của 1 consumer group
+    - ack(group, ids): xác nhận đã xử lý xong; tin không được ack sẽ được giao lại
+    - expire_groups(prefix, max_idle): dọn group riêng của replica đã bỏ (xem events.replica_group)
+    Mỗi group nhận đủ mọi event -> order_service và notification_service đọc độc lập.
+    """
+
+    async def publish(self, events: List[dict]):
+        raise NotImplementedError
+
+    async def ensure_group(self, group: str, start_id: Optional[str] = None):
+        """start_id="0" (mặc định): đọc cả event cũ còn trong broker; "$": chỉ event từ lúc tạo group.
+        None = như lần gọi trước cho group này (group bị xóa rồi tạo lại vẫn giữ kiểu cũ)."""
+        pass
+
+    async def expire_groups(self, prefix: str, max_idle: float, keep: Optional[str] = None) -> List[str]:
+        """Xóa group tên bắt đầu bằng `prefix` không ai đọc quá `max_idle` giây. -> tên các group đã xóa."""
+        return []
+
+    async def read(self, group: str, consumer: str, count: int = 100, block: float = 1.0) -> List[Message]:
+        raise NotImplementedError
+
+    async def ack(self, group: str, ids: List[str]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def stats(self, group: Optional[str] = None) -> dict:
+        return {}
+
+
+class StreamBroker(EventBroker):
+    """Redis Streams + consumer group. `client` là redis.asyncio.Redis(decode_responses=True) hoặc FakeAsyncRedis."""
+
+    def __init__(self, client, stream: str = EVENT_STREAM, maxlen: int = EVENT_STREAM_MAXLEN,
+                 redeliver_after: float = EVENT_REDELIVER_AFTER):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+        self.redeliver_after = redeliver_after
+        self._groups = set()
+        self._start_ids = {}
+
+    async def publish(self, events: List[dict]):
+        for event in events:
+            await self.client.xadd(
+                self.stream, {"event": json.dumps(event)}, maxlen=self.maxlen, approximate=True
+            )
+
+    async def ensure_group(self, group: str, start_id: Optional[str] = None):
+        start_id = self._start_ids.setdefault(group, start_id or "0")
+        if group in self._groups:
+            return
+        try:
+            # id="0": group mới tạo vẫn đọc được các event đã publish trước khi consumer chạy
+            await self.client.xgroup_create(self.stream, group, id=start_id, mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(group)
+
+    async def expire_groups(self, prefix: str, max_idle: float, keep: Optional[str] = None) -> List[str]:
+        expired = []
+        for info in await self.client.xinfo_groups(self.stream):
+            name = info["name"]
+            if not name.startswith(prefix) or name == keep:
+                continue
+            consumers = await self.client.xinfo_consumers(self.stream, name)
+            # Group chưa có consumer: vừa được replica khác tạo, chưa kịp đọc -> để yên
+            if consumers and min(c["idle"] for c in consumers) > max_idle * 1000:
+                await self.client.xgroup_destroy(self.stream, name)
+                self._groups.discard(name)
+                expired.append(name)
+        return expired
+
+    @staticmethod
+    def _decode(entries) -> List[Message]:
+        return [(msg_id, json.loads(fields["event"])) for msg_id, fields in entries]
+
+    async def read(self, group: str, consumer: str, count: int = 100, block: float = 1.0) -> List[Message]:
+        await self.ensure_group(group)
+        try:
+            # 1. Tin của consumer khác bị treo quá lâu -> nhận lại
+            claimed = await self.client.xautoclaim(
+                self.stream, group, consumer, int(self.redeliver_after * 1000), start_id="0-0", count=count
+            )
+            if claimed and claimed[1]:
+                return self._decode(claimed[1])
+            # 2. Tin mới
+            result = await self.client.xreadgroup(group, consumer, {self.stream: ">"}, count=count, block=int(block * 1000))
+        except Exception as e:
+            if "NOGROUP" in str(e):
+                # Group bị xóa (dọn nhầm / Redis mất dữ liệu) -> lần read sau tạo lại
+                self._groups.discard(group)
+            raise
+        return self._decode(result[0][1]) if result else []
+
+    async def ack(self, group: str, ids: List[str]):
+        if ids:
+            await self.client.xack(self.stream, group, *ids)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def stats(self, group: Optional[str] = None) -> dict:
+        result = {"backend": "stream", "stream": self.stream, "length": await self.client.xlen(self.stream)}
+        if group is not None and group in self._groups:
+            pending = await self.client.xpending(self.stream, group)
+            result["pending"] = pending["pending"] if isinstance(pending, dict) else pending
+        return result
+
+
+class SqlBroker(EventBroker):
+    """Log event trong 1 bảng SQL (SQLite cho test/dev chạy nhiều process, hoặc MySQL).
+
+    Mỗi group giữ 1 offset; ack dời offset tới id lớn nhất đã xử lý, tin chưa ack
+    được đọc lại ở lần read sau. Chỉ nên chạy 1 consumer / group (consumer idempotent
+    nên có trùng cũng không sao, chỉ tốn công).
+    """
+
+    def __init__(self, url: str = EVENT_BROKER_URL, poll_interval: float = 0.2):
+        from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine
+
+        self.engine = create_engine(url)
+        self.poll_interval = poll_interval
+        self._groups = set()
+        self._start_ids = {}
+        metadata = MetaData()
+        self.log = Table(
+            "event_log", metadata,
+            Column("id", Integer, primary_key=True, autoincrement=True),
+            Column("body", Text, nullable=False),
+        )
+        self.offsets = Table(
+            "event_offsets", metadata,
+            Column("group_name", String(100), primary_key=True),
+            Column("last_id", Integer, nullable=False, default=0),
+        )
+        # Lần cuối group được đọc (bảng riêng: event_offsets cũ không phải ALTER) -> expire_groups
+        self.seen = Table(
+            "event_group_seen", metadata,
+            Column("group_name", String(100), primary_key=True),
+            Column("seen_at", Float, nullable=False),
+        )
+        self._seen_at = {}
+        metadata.create_all(self.engine)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _publish(self, events: List[dict]):
+        with self.engine.begin() as conn:
+            conn.execute(self.log.insert(), [{"body": json.dumps(e)} for e in events])
+
+    async def publish(self, events: List[dict]):
+        if events:
+            await self._run(self._publish, events)
+
+    def _ensure_group(self, group: str, start_id: str):
+        from sqlalchemy import exc, func, select
+        with self.engine.begin() as conn:
+            if conn.execute(select(self.offsets.c.last_id).where(self.offsets.c.group_name == group)).first() is None:
+                last_id = (conn.execute(select(func.max(self.log.c.id))).scalar() or 0) if start_id == "$" else int(start_id)
+                try:
+                    conn.execute(self.offsets.insert().values(group_name=group, last_id=last_id))
+                except exc.IntegrityError:
+                    pass
+
+    async def ensure_group(self, group: str, start_id: Optional[str] = None):
+        start_id = self._start_ids.setdefault(group, start_id or "0")
+        if group not in self._groups:
+            await self._run(self._ensure_group, group, start_id)
+            self._groups.add(group)
+
+    def _touch(self, group: str):
+        from sqlalchemy import exc, update
+        now = time.time()
+        with self.engine.begin() as conn:
+            if not conn.execute(update(self.seen).where(self.seen.c.group_name == group).values(seen_at=now)).rowcount:
+                try:
+                    conn.execute(self.seen.insert().values(group_name=group, seen_at=now))
+                except exc.IntegrityError:
+                    pass
+        self._seen_at[group] = now
+
+    def _expire_groups(self, prefix: str, max_idle: float, keep: Optional[str]) -> List[str]:
+        from sqlalchemy import delete, select
+        with self.engine.begin() as conn:
+            names = [
+                name for name in conn.execute(
+                    select(self.seen.c.group_name).where(self.seen.c.seen_at < time.time() - max_idle)
+                ).scalars()
+                if name.startswith(prefix) and name != keep
+            ]
+            if names:
+                conn.execute(delete(self.offsets).where(self.offsets.c.group_name.in_(names)))
+                conn.execute(delete(self.seen).where(self.seen.c.group_name.in_(names)))
+        for name in names:
+            self._groups.discard(name)
+        return names
+
+    async def expire_groups(self, prefix: str, max_idle: float, keep: Optional[str] = None) -> List[str]:
+        return await self._run(self._expire_groups, prefix, max_idle, keep)
+
+    def _read(self, group: str, count: int) -> List[Message]:
+        from sqlalchemy import select
+        with self.engine.connect() as conn:
+            offset = conn.execute(select(self.offsets.c.last_id).where(self.offsets.c.group_name == group)).scalar()
+            if offset is None:
+                # Group bị xóa (expire_groups ở replica khác) -> read sau tạo lại, không đọc lại từ đầu
+                self._groups.discard(group)
+                return []
+            rows = conn.execute(
+                select(self.log.c.id, self.log.c.body).where(self.log.c.id > offset).order_by(self.log.c.id).limit(count)
+            ).all()
+        return [(str(row.id), json.loads(row.body)) for row in rows]
+
+    async def read(self, group: str, consumer: str, count: int = 100, block: float = 1.0) -> List[Message]:
+        await self.ensure_group(group)
+        # Ghi "lần cuối đọc" tối đa 1 lần / phút, không phải mỗi lần poll
+        if time.time() - self._seen_at.get(group, 0) >= 60:
+            await self._run(self._touch, group)
+        deadline = time.monotonic() + block
+        while True:
+            messages = await self._run(self._read, group, count)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            await asyncio.sleep(self.poll_interval)
+
+    def _ack(self, group: str, last_id: int):
+        from sqlalchemy import update
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.offsets)
+                .where(self.offsets.c.group_name == group, self.offsets.c.last_id < last_id)
+                .values(last_id=last_id)
+            )
+
+    async def ack(self, group: str, ids: List[str]):
+        if ids:
+            await self._run(self._ack, group, max(int(i) for i in ids))
+
+    async def close(self):
+        self.engine.dispose()
+
+    async def stats(self, group: Optional[str] = None) -> dict:
+        from sqlalchemy import func, select
+
+        def query():
+            with self.engine.connect() as conn:
+                result = {"backend": "sql", "length": conn.execute(select(func.count()).select_from(self.log)).scalar()}
+                if group is not None:
+                    offset = conn.execute(
+                        select(self.offsets.c.last_id).where(self.offsets.c.group_name == group)
+                    ).scalar() or 0
+                    result["pending"] = conn.execute(
+                        select(func.count()).select_from(self.log).where(self.log.c.id > offset)
+                    ).scalar()
+                return result
+        return await self._run(query)
+
+
+def _in_container() -> bool:
+    return os.path.exists("/.dockerenv") or "KUBERNETES_SERVICE_HOST" in os.environ
+
+
+def create_broker(backend: str = EVENT_BROKER) -> EventBroker:
+    if backend == "redis":
+        import redis.asyncio as redis_asyncio
+        return StreamBroker(redis_asyncio.from_url(REDIS_URL, decode_responses=True))
+    if backend == "sql":
+        if "EVENT_BROKER_URL" not in os.environ and _in_container():
+            # File SQLite mặc định nằm riêng trong từng container -> service này không bao giờ thấy
+            # event của service khác. Dừng ngay thay vì chạy "được" mà mất event.
+            raise RuntimeError("EVENT_BROKER=sql với file SQLite mặc định không dùng chung được giữa các container: "
+                               "đặt EVENT_BROKER=redis hoặc EVENT_BROKER_URL trỏ tới DB chung")
+        return SqlBroker(EVENT_BROKER_URL)
+    if backend in ("fake-redis", "memory"):
+        # Stream giả trong RAM: chỉ dùng được khi producer & consumer chạy chung 1 process
+        print(f"[broker] ⚠️ EVENT_BROKER={backend}: event chỉ đi trong process này, "
+              "service khác KHÔNG nhận được (FoodChanged, OrderCreated...). Chạy nhiều service -> dùng sql hoặc redis")
+        from common.fakeredis import FakeAsyncRedis
+        return StreamBroker(FakeAsyncRedis())
+    raise ValueError(f"Unknown EVENT_BROKER: {backend}")
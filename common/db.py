@@ -0,0 +1,241 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# --- CẤU HÌNH POOL ---
+# Đọc theo tiền tố của từng service, ví dụ ORDER_DB_POOL_SIZE=20, CART_DB_POOL_RECYCLE=600.
+# Không set thì dùng giá trị chung DB_POOL_* bên dưới.
+# Lưu ý: mỗi service có 2 pool (sync + async), tổng kết nối tối đa
+#   = số service x 2 x (POOL_SIZE + MAX_OVERFLOW) phải < max_connections của MySQL.
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DEFAULT_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DEFAULT_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Nhỏ hơn wait_timeout của MySQL để không bao giờ dùng lại kết nối đã bị server cắt
+DEFAULT_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DEFAULT_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DEFAULT_WARMUP = os.getenv("DB_POOL_WARMUP")
+SLOW_CHECKOUT_MS = float(os.getenv("DB_POOL_SLOW_CHECKOUT_MS", 10))
+
+# Mốc (ms) cho histogram thời gian chờ lấy kết nối
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+def _env(prefix: str, key: str, default, cast):
+    value = os.getenv(f"{prefix}_{key}")
+    return cast(value) if value not in (None, "") else default
+
+
+def _bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+def to_async_url(url: str) -> str:
+    """pymysql -> aiomysql, sqlite -> aiosqlite (các driver khác giữ nguyên)."""
+    return url.replace("mysql+pymysql://", "mysql+aiomysql://").replace("sqlite://", "sqlite+aiosqlite://")
+
+
+class PoolMetrics:
+    """Thời gian chờ lấy kết nối từ pool: đủ để biết pool đang thiếu hay thừa."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if ms >= SLOW_CHECKOUT_MS:
+                self.slow_checkouts += 1
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if ms <= bound:
+                    self.buckets[i] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+
+    def timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"le_{b}ms" for b in WAIT_BUCKETS_MS] + ["inf"]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "avg_wait_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "wait_histogram": dict(zip(labels, self.buckets)),
+            }
+
+
+def _measured_pool(base, metrics: PoolMetrics):
+    # Bọc _do_get để đo thời gian chờ; pool.recreate() (sau dispose) dùng lại đúng class này
+    class MeasuredPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except exc.TimeoutError:
+                metrics.timeout()
+                raise
+            metrics.observe(time.perf_counter() - started)
+            return conn
+
+    MeasuredPool.__name__ = f"Measured{base.__name__}"
+    return MeasuredPool
+
+
+def _pool_status(pool) -> dict:
+    status = {"class": type(pool).__name__}
+    for key in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, key, None)
+        if callable(fn):
+            status[key] = fn()
+    return status
+
+
+class Database:
+    """Engine + session (sync & async) của 1 service, dựng từ biến môi trường.
+
+    Database("ORDER", "order_db") đọc:
+      ORDER_DATABASE_URL / ORDER_ASYNC_DATABASE_URL (ghi đè toàn bộ URL, vd sqlite khi test)
+      ORDER_DB_HOST, DB_ROOT_USER, DB_PASSWORD
+      ORDER_DB_POOL_SIZE, ORDER_DB_MAX_OVERFLOW, ORDER_DB_POOL_TIMEOUT,
+      ORDER_DB_POOL_RECYCLE, ORDER_DB_POOL_PRE_PING, ORDER_DB_POOL_WARMUP
+    """
+
+    def __init__(self, prefix: str, db_name: str):
+        self.prefix = prefix.upper()
+        user = os.getenv("DB_ROOT_USER", "root")
+        password = os.getenv("DB_PASSWORD", "123456")
+        host = os.getenv(f"{self.prefix}_DB_HOST", "db")
+        self.url = os.getenv(f"{self.prefix}_DATABASE_URL") or f"mysql+pymysql://{user}:{password}@{host}/{db_name}"
+        self.async_url = os.getenv(f"{self.prefix}_ASYNC_DATABASE_URL") or to_async_url(self.url)
+
+        self.pool_size = _env(self.prefix, "DB_POOL_SIZE", DEFAULT_POOL_SIZE, int)
+        self.max_overflow = _env(self.prefix, "DB_MAX_OVERFLOW", DEFAULT_MAX_OVERFLOW, int)
+        self.pool_timeout = _env(self.prefix, "DB_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT, float)
+        self.pool_recycle = _env(self.prefix, "DB_POOL_RECYCLE", DEFAULT_POOL_RECYCLE, int)
+        self.pre_ping = _env(self.prefix, "DB_POOL_PRE_PING", DEFAULT_PRE_PING, _bool)
+        # Mặc định mở sẵn đủ pool_size kết nối lúc startup
+        self.warmup = _env(self.prefix, "DB_POOL_WARMUP", int(DEFAULT_WARMUP or self.pool_size), int)
+
+        self.metrics = PoolMetrics()
+        self.async_metrics = PoolMetrics()
+        self.engine = create_engine(self.url, **self._engine_kwargs(self.url, QueuePool, self.metrics))
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._async_engine: Optional[AsyncEngine] = None
+        self._async_sessionmaker: Optional[async_sessionmaker] = None
+
+    def _engine_kwargs(self, url: str, pool_base, metrics: PoolMetrics) -> dict:
+        if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+            # SQLite trong RAM: để SQLAlchemy tự chọn pool (mỗi kết nối là 1 DB riêng)
+            return {}
+        return {
+            "poolclass": _measured_pool(pool_base, metrics),
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pre_ping,
+        }
+
+    # Engine async chỉ tạo khi service thực sự dùng (user_service chỉ cần sync)
+    @property
+    def async_engine(self) -> AsyncEngine:
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(
+                self.async_url, **self._engine_kwargs(self.async_url, AsyncAdaptedQueuePool, self.async_metrics)
+            )
+        return self._async_engine
+
+    @property
+    def AsyncSessionLocal(self) -> async_sessionmaker:
+        if self._async_sessionmaker is None:
+            self._async_sessionmaker = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        return self._async_sessionmaker
+
+    # --- DEPENDENCY CHO FASTAPI ---
+    def get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db(self):
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+    # --- VÒNG ĐỜI ---
+    def _warm_up_sync(self, count: int):
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(self.engine.connect())
+        finally:
+            for conn in conns:
+                conn.close()
+
+    async def _warm_up_async(self, count: int):
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(await self.async_engine.connect())
+        finally:
+            for conn in conns:
+                await conn.close()
+
+    async def warm_up(self):
+        """Mở sẵn kết nối lúc startup để request đầu tiên không phải chờ handshake MySQL."""
+        count = min(self.warmup, self.pool_size)
+        if count <= 0:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._warm_up_sync, count)
+            if self._async_engine is not None:
+                await self._warm_up_async(count)
+        except Exception as e:
+            # DB chưa sẵn sàng -> vẫn cho service chạy, pool sẽ tự mở kết nối khi cần
+            print(f"[{self.prefix}] Warm-up DB lỗi: {e}")
+            return
+        print(f"[{self.prefix}] Warm-up {count} kết nối DB trong {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    async def dispose(self):
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        self.engine.dispose()
+
+    def stats(self) -> dict:
+        result = {
+            "config": {
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "pool_timeout": self.pool_timeout,
+                "pool_recycle": self.pool_recycle,
+                "pre_ping": self.pre_ping,
+                "warmup": self.warmup,
+            },
+            "sync": {"pool": _pool_status(self.engine.pool), **self.metrics.snapshot()},
+        }
+        if self._async_engine is not None:
+            result["async"] = {"pool": _pool_status(self._async_engine.pool), **self.async_metrics.snapshot()}
+        return result
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import socket
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from common.broker import EventBroker
+
+# --- LOẠI SỰ KIỆN ---
+ORDER_CREATED = "OrderCreated"              # order_service: {order_id, user_id, branch_id, total_price}
+PAYMENT_SUCCEEDED = "PaymentSucceeded"      # payment_service: {payment_id, order_id, amount, transaction_id}
+ORDER_STATUS_CHANGED = "OrderStatusChanged"  # order_service: {order_id, user_id, branch_id, status}
+FOOD_CHANGED = "FoodChanged"                # restaurant_service: {food_id, branch_id, version, deleted, food}
+COUPON_CHANGED = "CouponChanged"            # restaurant_service: {coupon_id, branch_id, version, deleted, coupon}
+
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", 100))
+EVENT_RETRY_DELAY = float(os.getenv("EVENT_RETRY_DELAY", 2))
+
+# --- GROUP RIÊNG TỪNG REPLICA (cache trong RAM) ---
+# Tên group = "<tên>-<REPLICA_ID>": restart giữ nguyên REPLICA_ID -> đọc tiếp group cũ, không đẻ group mới.
+# Không set thì lấy hostname (container tạo lại là đổi -> group cũ thành rác, được dọn theo EVENT_GROUP_STALE_AFTER)
+REPLICA_ID = os.getenv("REPLICA_ID") or socket.gethostname()
+# Group cùng tiền tố không có consumer nào đọc quá lâu -> replica đã bỏ, xóa group
+EVENT_GROUP_STALE_AFTER = float(os.getenv("EVENT_GROUP_STALE_AFTER", 24 * 3600))
+EVENT_GROUP_CLEANUP_INTERVAL = float(os.getenv("EVENT_GROUP_CLEANUP_INTERVAL", 600))
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+def replica_group(name: str) -> str:
+    return f"{name}-{REPLICA_ID}"
+
+
+class SeenEvents:
+    """Nhớ id các event vừa xử lý (LRU) -> chống xử lý trùng cho consumer không có DB."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, event_id: str) -> bool:
+        """True nếu event chưa từng thấy."""
+        if event_id in self._ids:
+            self._ids.move_to_end(event_id)
+            return False
+        self._ids[event_id] = None
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return True
+
+    def discard(self, event_id: str):
+        """Xử lý lỗi -> quên id để lần broker giao lại vẫn được xử lý."""
+        self._ids.pop(event_id, None)
+
+
+class EventConsumer:
+    """Đọc event của 1 consumer group và gọi handler theo loại event.
+
+    Handler phải idempotent: broker giao ít nhất 1 lần (có thể trùng).
+    Event không có handler được ack luôn; handler lỗi -> không ack, thử lại sau.
+
+    Cache trong RAM (replica_group): start_id="$" -> group mới chỉ nhận event từ lúc tạo
+    (start() trước khi tải snapshot, không đọc lại cả lịch sử); stale_prefix -> định kỳ xóa
+    group cùng tiền tố của replica đã biến mất.
+    """
+
+    def __init__(self, broker: EventBroker, group: str, handlers: Dict[str, Handler],
+                 consumer: Optional[str] = None, batch_size: int = EVENT_BATCH_SIZE,
+                 retry_delay: float = EVENT_RETRY_DELAY, start_id: str = "0",
+                 stale_prefix: Optional[str] = None, stale_after: float = EVENT_GROUP_STALE_AFTER,
+                 cleanup_interval: float = EVENT_GROUP_CLEANUP_INTERVAL):
+        self.broker = broker
+        self.group = group
+        self.handlers = handlers
+        self.consumer = consumer or f"{group}-{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.start_id = start_id
+        self.stale_prefix = stale_prefix
+        self.stale_after = stale_after
+        self.cleanup_interval = cleanup_interval
+        self._task: Optional[asyncio.Task] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.skipped = 0
+        self.failures = 0
+        self.expired_groups = 0
+
+    async def start(self):
+        # Tạo group ngay (không đợi lần read đầu) -> event phát ra trong lúc cache tải snapshot vẫn nhận được
+        try:
+            await self.broker.ensure_group(self.group, self.start_id)
+        except Exception as e:
+            print(f"[{self.group}] Lỗi tạo consumer group: {e}")
+        self._task = asyncio.create_task(self._run())
+        if self.stale_prefix is not None:
+            self._cleanup_task = asyncio.create_task(self._cleanup())
+
+    async def stop(self):
+        for task in (self._task, self._cleanup_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._cleanup_task = None
+
+    async def _cleanup(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                expired = await self.broker.expire_groups(self.stale_prefix, self.stale_after, keep=self.group)
+                self.expired_groups += len(expired)
+                for group in expired:
+                    print(f"[{self.group}] Xóa consumer group bỏ hoang: {group}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{self.group}] Lỗi dọn consumer group cũ: {e}")
+
+    async def handle_batch(self, messages) -> bool:
+        done, ok = [], True
+        for msg_id, event in messages:
+            handler = self.handlers.get(event.get("type"))
+            try:
+                if handler is None:
+                    self.skipped += 1
+                else:
+                    await handler(event)
+                    self.processed += 1
+            except Exception as e:
+                self.failures += 1
+                ok = False
+                print(f"[{self.group}] Lỗi xử lý event {event.get('type')} {event.get('id')}: {e}")
+                break
+            done.append(msg_id)
+        await self.broker.ack(self.group, done)
+        return ok
+
+    async def _run(self):
+        while True:
+            try:
+                messages = await self.broker.read(self.group, self.consumer, count=self.batch_size)
+                if messages and not await self.handle_batch(messages):
+                    await asyncio.sleep(self.retry_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{self.group}] Lỗi đọc event: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def stats(self) -> dict:
+        try:
+            broker = await self.broker.stats(self.group)
+        except Exception as e:
+            broker = {"error": str(e)}
+        return {
+            "group": self.group,
+            "consumer": self.consumer,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "expired_groups": self.expired_groups,
+            "broker": broker,
+        }
@@ -0,0 +1,579 @@
+import fnmatch
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class FakeRedis:
+    """Giả lập (một phần) redis.Redis trong RAM, dùng cho test / chạy local không có Redis.
+
+    Chỉ cài những lệnh mà các service đang dùng, với cùng chữ ký như redis-py
+    (decode_responses=True: nhận/trả str).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data: Dict[str, object] = {}
+        self._expires: Dict[str, float] = {}
+        self._versions: Dict[str, int] = {}  # key -> số lần bị sửa, cho WATCH
+        self._epoch = 0
+
+    # --- TIỆN ÍCH NỘI BỘ ---
+    def _alive(self, key: str) -> bool:
+        exp = self._expires.get(key)
+        if exp is not None and exp <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            self._touch(key)
+            return False
+        return key in self._data
+
+    def _touch(self, key: str):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _version(self, key: str) -> Tuple[int, int]:
+        with self._lock:
+            self._alive(key)
+            return self._epoch, self._versions.get(key, 0)
+
+    # --- KEY / STRING ---
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._data.get(key) if self._alive(key) else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [self.get(key) for key in keys]
+
+    def set(self, key: str, value, ex: Optional[float] = None, nx: bool = False):
+        with self._lock:
+            if nx and self._alive(key):
+                return None
+            self._data[key] = str(value)
+            self._touch(key)
+            if ex:
+                self._expires[key] = time.time() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._data.get(key, 0) if self._alive(key) else 0) + amount
+            self._data[key] = str(value)
+            self._touch(key)
+            return value
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+                self._touch(key)
+            return removed
+
+    def exists(self, key: str) -> int:
+        with self._lock:
+            return int(self._alive(key))
+
+    def expire(self, key: str, seconds: float) -> bool:
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.time() + seconds
+            self._touch(key)
+            return True
+
+    def ttl(self, key: str) -> int:
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            exp = self._expires.get(key)
+            return -1 if exp is None else max(0, int(exp - time.time()))
+
+    def keys(self, pattern: str = "*"):
+        with self._lock:
+            return [k for k in list(self._data) if self._alive(k) and fnmatch.fnmatchcase(k, pattern)]
+
+    # --- HASH ---
+    def _hash(self, key: str, create: bool = False) -> Optional[dict]:
+        if not self._alive(key):
+            if not create:
+                return None
+            self._data[key] = {}
+        return self._data[key]
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            h = self._hash(key)
+            return None if h is None else h.get(field)
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hash(key) or {})
+
+    def hset(self, key: str, field: Optional[str] = None, value=None, mapping: Optional[dict] = None) -> int:
+        with self._lock:
+            h = self._hash(key, create=True)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for f in items if f not in h)
+            h.update({f: str(v) for f, v in items.items()})
+            self._touch(key)
+            return added
+
+    def hsetnx(self, key: str, field: str, value) -> int:
+        with self._lock:
+            h = self._hash(key, create=True)
+            if field in h:
+                return 0
+            h[field] = str(value)
+            self._touch(key)
+            return 1
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            h = self._hash(key, create=True)
+            h[field] = str(int(h.get(field, 0)) + amount)
+            self._touch(key)
+            return int(h[field])
+
+    def hdel(self, key: str, *fields) -> int:
+        with self._lock:
+            h = self._hash(key)
+            if h is None:
+                return 0
+            removed = sum(1 for f in fields if h.pop(f, None) is not None)
+            self._touch(key)
+            if not h:
+                self.delete(key)
+            return removed
+
+    # --- SET ---
+    def sadd(self, key: str, *members) -> int:
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = set()
+            s = self._data[key]
+            before = len(s)
+            s.update(str(m) for m in members)
+            self._touch(key)
+            return len(s) - before
+
+    def spop(self, key: str, count: Optional[int] = None):
+        with self._lock:
+            s = self._data.get(key) if self._alive(key) else None
+            if not s:
+                return [] if count is not None else None
+            popped = [s.pop() for _ in range(min(count or 1, len(s)))]
+            self._touch(key)
+            if not s:
+                self.delete(key)
+            return popped if count is not None else popped[0]
+
+    def scard(self, key: str) -> int:
+        with self._lock:
+            return len(self._data[key]) if self._alive(key) else 0
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            self._epoch += 1
+
+    def pipeline(self, transaction: bool = True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    """Gom lệnh rồi chạy 1 lượt khi execute(), giống redis-py pipeline."""
+
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+
+
+# ==========================================
+# PUB/SUB (bản async, giống redis.asyncio)
+# ==========================================
+class FakePubSubHub:
+    """Kênh pub/sub dùng chung: nhiều FakeAsyncRedis cùng 1 hub = nhiều replica cùng 1 Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, list] = {}
+
+    def publish(self, channel: str, message) -> int:
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for pubsub in targets:
+            pubsub._deliver(channel, message)
+        return len(targets)
+
+    def _add(self, channel: str, pubsub):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(pubsub)
+
+    def _remove(self, channel: str, pubsub):
+        with self._lock:
+            subs = self._subscribers.get(channel, [])
+            if pubsub in subs:
+                subs.remove(pubsub)
+
+
+class FakeAsyncPubSub:
+    def __init__(self, hub: FakePubSubHub):
+        import asyncio
+        self._asyncio = asyncio
+        self._hub = hub
+        self._channels = set()
+        self._queue = None
+        self._loop = None
+
+    async def subscribe(self, *channels):
+        self._loop = self._asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = self._asyncio.Queue()
+        for channel in channels:
+            if channel not in self._channels:
+                self._channels.add(channel)
+                self._hub._add(channel, self)
+
+    async def unsubscribe(self, *channels):
+        for channel in channels or list(self._channels):
+            self._channels.discard(channel)
+            self._hub._remove(channel, self)
+
+    def _deliver(self, channel: str, message):
+        if self._loop is None or self._loop.is_closed():
+            return
+        data = {"type": "message", "pattern": None, "channel": channel, "data": str(message)}
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, data)
+
+    async def get_message(self, ignore_subscribe_messages: bool = True, timeout: float = 0.0):
+        if self._queue is None:
+            return None
+        try:
+            return await self._asyncio.wait_for(self._queue.get(), timeout or 0.001)
+        except self._asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+    close = aclose
+
+
+# ==========================================
+# STREAM + CONSUMER GROUP (XADD / XREADGROUP / XACK / XAUTOCLAIM)
+# ==========================================
+class FakeResponseError(Exception):
+    """Giống redis.exceptions.ResponseError (vd "BUSYGROUP ...")."""
+
+
+def _parse_id(stream_id: str) -> Tuple[int, int]:
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class FakeStreams:
+    """Dữ liệu stream dùng chung: nhiều FakeAsyncRedis cùng 1 FakeStreams = cùng 1 Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[tuple]] = {}   # stream -> [(id_tuple, id, fields)]
+        self._groups: Dict[Tuple[str, str], dict] = {}
+        self._last_id = (0, 0)
+
+    def _next_id(self) -> Tuple[int, int]:
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_id
+        self._last_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        return self._last_id
+
+    def xadd(self, name: str, fields: dict, maxlen: Optional[int] = None) -> str:
+        with self._lock:
+            id_tuple = self._next_id()
+            stream_id = f"{id_tuple[0]}-{id_tuple[1]}"
+            entries = self._entries.setdefault(name, [])
+            entries.append((id_tuple, stream_id, {k: str(v) for k, v in fields.items()}))
+            if maxlen is not None and len(entries) > maxlen:
+                del entries[: len(entries) - maxlen]
+            return stream_id
+
+    def xgroup_create(self, name: str, group: str, id: str = "$", mkstream: bool = False):
+        with self._lock:
+            if name not in self._entries:
+                if not mkstream:
+                    raise FakeResponseError("ERR The XGROUP subcommand requires the key to exist")
+                self._entries[name] = []
+            if (name, group) in self._groups:
+                raise FakeResponseError("BUSYGROUP Consumer Group name already exists")
+            entries = self._entries[name]
+            last = (entries[-1][0] if entries else (0, 0)) if id == "$" else _parse_id(id)
+            self._groups[(name, group)] = {"last": last, "pending": OrderedDict(), "consumers": {}}
+
+    def xgroup_destroy(self, name: str, group: str) -> int:
+        with self._lock:
+            return int(self._groups.pop((name, group), None) is not None)
+
+    def xinfo_groups(self, name: str) -> List[dict]:
+        with self._lock:
+            if name not in self._entries:
+                raise FakeResponseError("ERR no such key")
+            return [
+                {"name": group, "consumers": len(state["consumers"]), "pending": len(state["pending"]),
+                 "last-delivered-id": f"{state['last'][0]}-{state['last'][1]}"}
+                for (stream, group), state in self._groups.items() if stream == name
+            ]
+
+    def xinfo_consumers(self, name: str, group: str) -> List[dict]:
+        with self._lock:
+            state = self._group(name, group)
+            now = time.monotonic()
+            return [
+                {"name": consumer, "pending": sum(1 for p in state["pending"].values() if p[0] == consumer),
+                 "idle": int((now - seen) * 1000)}
+                for consumer, seen in state["consumers"].items()
+            ]
+
+    def _group(self, name: str, group: str) -> dict:
+        state = self._groups.get((name, group))
+        if state is None:
+            raise FakeResponseError("NOGROUP No such key or consumer group")
+        return state
+
+    def read_new(self, name: str, group: str, consumer: str, count: Optional[int]) -> list:
+        with self._lock:
+            state = self._group(name, group)
+            state["consumers"][consumer] = time.monotonic()
+            result = []
+            for id_tuple, stream_id, fields in self._entries.get(name, ()):
+                if id_tuple <= state["last"]:
+                    continue
+                result.append((stream_id, dict(fields)))
+                state["last"] = id_tuple
+                state["pending"][stream_id] = [consumer, time.monotonic(), 1]
+                if count and len(result) >= count:
+                    break
+            return result
+
+    def xack(self, name: str, group: str, *ids) -> int:
+        with self._lock:
+            pending = self._group(name, group)["pending"]
+            return sum(1 for i in ids if pending.pop(i, None) is not None)
+
+    def xautoclaim(self, name: str, group: str, consumer: str, min_idle_time: int, count: int = 100) -> list:
+        with self._lock:
+            state = self._group(name, group)
+            state["consumers"][consumer] = time.monotonic()
+            pending = state["pending"]
+            fields_by_id = {stream_id: fields for _, stream_id, fields in self._entries.get(name, ())}
+            now = time.monotonic()
+            claimed, deleted = [], []
+            for stream_id, info in list(pending.items()):
+                if len(claimed) >= count:
+                    break
+                if (now - info[1]) * 1000 < min_idle_time:
+                    continue
+                if stream_id not in fields_by_id:
+                    # Tin đã bị cắt khỏi stream (MAXLEN) -> bỏ khỏi pending như Redis
+                    del pending[stream_id]
+                    deleted.append(stream_id)
+                    continue
+                info[0], info[1], info[2] = consumer, now, info[2] + 1
+                claimed.append((stream_id, dict(fields_by_id[stream_id])))
+            return ["0-0", claimed, deleted]
+
+    def xlen(self, name: str) -> int:
+        with self._lock:
+            return len(self._entries.get(name, ()))
+
+    def xpending(self, name: str, group: str) -> dict:
+        with self._lock:
+            return {"pending": len(self._group(name, group)["pending"])}
+
+
+# ==========================================
+# PIPELINE ASYNC + WATCH/MULTI/EXEC
+# ==========================================
+class FakeWatchError(Exception):
+    """Giống redis.exceptions.WatchError: key đang WATCH bị sửa trước EXEC."""
+
+
+class _FakeAsyncPipeline:
+    """Như pipeline của redis.asyncio: sau watch() lệnh chạy ngay (await được),
+    sau multi() lệnh được gom lại; execute() báo FakeWatchError nếu key đang WATCH đã đổi."""
+
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._commands = []
+        self._watched: Optional[Dict[str, Tuple[int, int]]] = None
+        self._explicit = False
+
+    async def watch(self, *keys):
+        self._watched = {**(self._watched or {}), **{key: self._client._version(key) for key in keys}}
+
+    def multi(self):
+        self._explicit = True
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+        if self._watched is not None and not self._explicit:
+            async def immediate(*args, **kwargs):
+                return command(*args, **kwargs)
+            return immediate
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        try:
+            with self._client._lock:
+                if any(self._client._version(k) != v for k, v in (self._watched or {}).items()):
+                    raise FakeWatchError("Watched variable changed.")
+                return [command(*args, **kwargs) for command, args, kwargs in self._commands]
+        finally:
+            self._reset()
+
+    def _reset(self):
+        self._commands = []
+        self._watched = None
+        self._explicit = False
+
+    async def reset(self):
+        self._reset()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._reset()
+
+
+# Lệnh key/hash/set chạy thẳng trên FakeRedis bên dưới
+_KV_COMMANDS = {
+    "get", "mget", "set", "incr", "delete", "exists", "expire", "ttl", "keys",
+    "hget", "hgetall", "hset", "hsetnx", "hincrby", "hdel", "sadd", "spop", "scard", "flushall",
+}
+
+
+class FakeAsyncRedis:
+    """Bản async của redis.asyncio.Redis (decode_responses=True): publish/pubsub, stream,
+    key/hash/set, pipeline + transaction() (WATCH/MULTI/EXEC)."""
+
+    def __init__(self, hub: Optional[FakePubSubHub] = None, streams: Optional[FakeStreams] = None,
+                 store: Optional[FakeRedis] = None):
+        self.hub = hub or FakePubSubHub()
+        self.streams = streams or FakeStreams()
+        self.store = store or FakeRedis()
+
+    def __getattr__(self, name):
+        if name not in _KV_COMMANDS:
+            raise AttributeError(name)
+        command = getattr(self.store, name)
+
+        async def run(*args, **kwargs):
+            return command(*args, **kwargs)
+        return run
+
+    def pipeline(self, transaction: bool = True) -> _FakeAsyncPipeline:
+        return _FakeAsyncPipeline(self.store)
+
+    async def transaction(self, func, *watches, value_from_callable: bool = False, watch_delay: Optional[float] = None):
+        """Như redis.asyncio.Redis.transaction: WATCH -> func(pipe) -> EXEC, key đổi giữa chừng thì chạy lại."""
+        import asyncio
+        async with self.pipeline(True) as pipe:
+            while True:
+                try:
+                    if watches:
+                        await pipe.watch(*watches)
+                    value = func(pipe)
+                    if inspect.isawaitable(value):
+                        value = await value
+                    results = await pipe.execute()
+                    return value if value_from_callable else results
+                except FakeWatchError:
+                    if watch_delay:
+                        await asyncio.sleep(watch_delay)
+
+    async def publish(self, channel: str, message) -> int:
+        return self.hub.publish(channel, message)
+
+    def pubsub(self) -> FakeAsyncPubSub:
+        return FakeAsyncPubSub(self.hub)
+
+    async def xadd(self, name: str, fields: dict, id: str = "*", maxlen: Optional[int] = None, approximate: bool = True) -> str:
+        return self.streams.xadd(name, fields, maxlen)
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False):
+        self.streams.xgroup_create(name, groupname, id, mkstream)
+        return True
+
+    async def xreadgroup(self, groupname: str, consumername: str, streams: dict,
+                         count: Optional[int] = None, block: Optional[int] = None, noack: bool = False):
+        import asyncio
+        # Chỉ hỗ trợ id ">" (tin mới); chờ tối đa `block` ms bằng cách poll
+        deadline = time.monotonic() + (block or 0) / 1000
+        while True:
+            result = []
+            for name in streams:
+                entries = self.streams.read_new(name, groupname, consumername, count)
+                if entries:
+                    result.append([name, entries])
+            if result or block is None or time.monotonic() >= deadline:
+                return result
+            await asyncio.sleep(0.01)
+
+    async def xgroup_destroy(self, name: str, groupname: str) -> int:
+        return self.streams.xgroup_destroy(name, groupname)
+
+    async def xinfo_groups(self, name: str) -> List[dict]:
+        return self.streams.xinfo_groups(name)
+
+    async def xinfo_consumers(self, name: str, groupname: str) -> List[dict]:
+        return self.streams.xinfo_consumers(name, groupname)
+
+    async def xack(self, name: str, groupname: str, *ids) -> int:
+        return self.streams.xack(name, groupname, *ids)
+
+    async def xautoclaim(self, name: str, groupname: str, consumername: str, min_idle_time: int,
+                         start_id: str = "0-0", count: Optional[int] = None, justid: bool = False):
+        return self.streams.xautoclaim(name, groupname, consumername, min_idle_time, count or 100)
+
+    async def xlen(self, name: str) -> int:
+        return self.streams.xlen(name)
+
+    async def xpending(self, name: str, groupname: str) -> dict:
+        return self.streams.xpending(name, groupname)
+
+    async def aclose(self):
+        pass
+
+    close = aclose
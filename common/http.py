@@ -0,0 +1,55 @@
+import os
+from typing import Dict, Optional
+
+import httpx
+
+# --- HTTP CLIENT DÙNG CHUNG ---
+# Mỗi service đích có 1 httpx.AsyncClient sống suốt vòng đời process (giữ keep-alive),
+# thay cho kiểu `async with httpx.AsyncClient()` mở kết nối mới ở mỗi request.
+# Giới hạn đọc theo tên service đích, ví dụ RESTAURANT_SERVICE_HTTP_MAX_CONNECTIONS=50,
+# không set thì dùng HTTP_* bên dưới.
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+
+
+def _env(prefix: str, key: str, default, cast):
+    value = os.getenv(f"{prefix}_{key}")
+    return cast(value) if value not in (None, "") else default
+
+
+class HttpClients:
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, name: str, base_url: str, timeout: Optional[float] = None) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            prefix = name.upper()
+            read_timeout = _env(prefix, "HTTP_TIMEOUT", timeout if timeout is not None else DEFAULT_TIMEOUT, float)
+            client = self._clients[name] = httpx.AsyncClient(
+                base_url=base_url,
+                limits=httpx.Limits(
+                    max_connections=_env(prefix, "HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS, int),
+                    max_keepalive_connections=_env(prefix, "HTTP_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE, int),
+                    keepalive_expiry=_env(prefix, "HTTP_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY, float),
+                ),
+                timeout=httpx.Timeout(
+                    read_timeout,
+                    connect=min(read_timeout, _env(prefix, "HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT, float)),
+                ),
+            )
+        return client
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {name: {"base_url": str(c.base_url), "closed": c.is_closed} for name, c in self._clients.items()}
+
+
+http_clients = HttpClients()
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# --- CẤU HÌNH ---
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")  # memory | redis | fake-redis
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))     # giữ kết quả bao lâu
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 30))  # request trùng chờ request đầu tối đa
+# Khóa "đang chạy" (redis): hạn ngắn, được gia hạn mỗi 1/3 hạn trong lúc handler còn chạy
+# -> handler chậm không mất khóa, process chết thì khóa tự nhả sau tối đa IDEMPOTENCY_LOCK_TTL
+IDEMPOTENCY_LOCK_TTL = float(os.getenv("IDEMPOTENCY_LOCK_TTL", 10))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+OWNER, DONE, PENDING = "owner", "done", "pending"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Hash ổn định của request (thứ tự key trong JSON không ảnh hưởng)."""
+    raw = json.dumps(jsonable_encoder(parts), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Idempotency-Key cho các API POST tạo dữ liệu (/checkout, /pay).
+
+    - lần đầu: chạy handler, lưu (fingerprint, body) trong IDEMPOTENCY_TTL
+    - gửi lại cùng key + cùng nội dung: trả lại đúng body cũ, KHÔNG chạy lại handler
+    - cùng key nhưng khác nội dung: 422
+    - request trùng tới khi request đầu chưa xong: chờ kết quả của request đầu
+    - handler lỗi: không lưu gì, lần gửi lại sẽ chạy lại
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.mismatches = 0
+
+    # Các thao tác cơ bản, từng backend tự cài
+    async def _reserve(self, key: str, fp: str) -> Tuple[str, Optional[str], Any]:
+        """-> (OWNER | DONE | PENDING, fingerprint đang lưu, body nếu DONE)"""
+        raise NotImplementedError
+
+    async def _wait(self, key: str, timeout: float) -> bool:
+        raise NotImplementedError
+
+    async def _execute(self, key: str, handler: Callable[[], Awaitable[Any]]):
+        """Chạy handler khi đang giữ key (backend cần gia hạn khóa thì cài lại)."""
+        return await handler()
+
+    async def _complete(self, key: str, fp: str, body):
+        raise NotImplementedError
+
+    async def _release(self, key: str):
+        raise NotImplementedError
+
+    async def run(self, scope: str, key: Optional[str], fp: str, handler: Callable[[], Awaitable[Any]]):
+        if not key:
+            return await handler()
+        key = f"{scope}:{key}"
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            state, stored_fp, body = await self._reserve(key, fp)
+            if state != OWNER and stored_fp != fp:
+                self.mismatches += 1
+                raise HTTPException(422, "Idempotency-Key đã được dùng cho một request khác")
+            if state == DONE:
+                self.replayed += 1
+                return JSONResponse(body, headers={REPLAYED_HEADER: "true"})
+            if state == OWNER:
+                break
+            # PENDING: request đầu đang chạy -> chờ rồi đọc lại kết quả
+            self.waited += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await self._wait(key, remaining):
+                raise HTTPException(409, "Request với Idempotency-Key này đang được xử lý")
+
+        try:
+            result = await self._execute(key, handler)
+        except BaseException:
+            await self._release(key)
+            raise
+        self.executed += 1
+        await self._complete(key, fp, jsonable_encoder(result))
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "mismatches": self.mismatches,
+        }
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "body", "done", "expires", "event")
+
+    def __init__(self, fp: str):
+        self.fingerprint = fp
+        self.body = None
+        self.done = False
+        self.expires = float("inf")
+        self.event = asyncio.Event()
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """LRU + TTL trong RAM (1 replica). Request trùng chờ trên asyncio.Event, không poll."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    async def _reserve(self, key: str, fp: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self._entries[key] = _Entry(fp)
+            self._evict()
+            return OWNER, fp, None
+        self._entries.move_to_end(key)
+        return (DONE if entry.done else PENDING), entry.fingerprint, entry.body
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            # Không bỏ entry đang chạy (còn request chờ trên nó)
+            for key, entry in self._entries.items():
+                if entry.done:
+                    del self._entries[key]
+                    break
+            else:
+                return
+
+    async def _wait(self, key: str, timeout: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return True
+        try:
+            await asyncio.wait_for(entry.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _complete(self, key: str, fp: str, body):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.body, entry.done = body, True
+        entry.expires = time.monotonic() + self.ttl
+        entry.event.set()
+
+    async def _release(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.event.set()
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Dùng chung giữa nhiều replica. `client` là redis.asyncio.Redis(decode_responses=True) hoặc FakeAsyncRedis.
+
+    Khóa "đang chạy" ghi kèm owner token: chỉ request giữ khóa mới gia hạn / ghi kết quả / nhả khóa
+    (WATCH/MULTI), khóa hết hạn rồi bị request khác lấy thì request cũ không ghi đè lên.
+    """
+
+    def __init__(self, client, ttl: float = IDEMPOTENCY_TTL, prefix: str = "idem:", poll_interval: float = 0.05,
+                 lock_ttl: float = IDEMPOTENCY_LOCK_TTL):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+        self.lock_ttl = lock_ttl
+        # token khóa của request hiện tại (task heartbeat tạo trong request thấy cùng giá trị)
+        self._owner: ContextVar[Optional[str]] = ContextVar(f"idempotency_owner_{id(self)}", default=None)
+        self.lost_locks = 0
+
+    async def _reserve(self, key: str, fp: str):
+        token = uuid.uuid4().hex
+        pending = json.dumps({"fp": fp, "done": False, "owner": token})
+        # Khóa "đang chạy" có hạn ngắn, _execute() gia hạn; process chết giữa chừng thì tự nhả
+        if await self.client.set(self.prefix + key, pending, nx=True, ex=max(int(self.lock_ttl), 1)):
+            self._owner.set(token)
+            return OWNER, fp, None
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return await self._reserve(key, fp)
+        data = json.loads(raw)
+        return (DONE if data["done"] else PENDING), data["fp"], data.get("body")
+
+    async def _wait(self, key: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            raw = await self.client.get(self.prefix + key)
+            if raw is None or json.loads(raw)["done"]:
+                return True
+            await asyncio.sleep(self.poll_interval)
+        return False
+
+    async def _if_owner(self, key: str, write: Callable) -> bool:
+        """Chạy `write(pipe)` trong MULTI nếu khóa vẫn là của request này."""
+        token = self._owner.get()
+        name = self.prefix + key
+
+        async def check(pipe):
+            raw = await pipe.get(name)
+            if token is None or raw is None or json.loads(raw).get("owner") != token:
+                return False
+            pipe.multi()
+            write(pipe)
+            return True
+
+        return await self.client.transaction(check, name, value_from_callable=True)
+
+    async def _heartbeat(self, key: str):
+        ttl = max(int(self.lock_ttl), 1)
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self._if_owner(key, lambda pipe: pipe.expire(self.prefix + key, ttl)):
+                    self.lost_locks += 1
+                    print(f"[idempotency] Mất khóa {key} khi handler còn chạy")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[idempotency] Lỗi gia hạn khóa {key}: {e}")
+
+    async def _execute(self, key: str, handler: Callable[[], Awaitable[Any]]):
+        heartbeat = asyncio.create_task(self._heartbeat(key))
+        try:
+            return await handler()
+        finally:
+            heartbeat.cancel()
+            try:
+                await heartbeat
+            except asyncio.CancelledError:
+                pass
+
+    async def _complete(self, key: str, fp: str, body):
+        value = json.dumps({"fp": fp, "done": True, "body": body})
+        try:
+            await self._if_owner(key, lambda pipe: pipe.set(self.prefix + key, value, ex=int(self.ttl)))
+        finally:
+            self._owner.set(None)
+
+    async def _release(self, key: str):
+        try:
+            await self._if_owner(key, lambda pipe: pipe.delete(self.prefix + key))
+        finally:
+            self._owner.set(None)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "lost_locks": self.lost_locks}
+
+
+def create_idempotency_store(kind: str = IDEMPOTENCY_BACKEND) -> IdempotencyStore:
+    if kind == "redis":
+        import redis.asyncio as redis_asyncio  # chỉ cần cài khi dùng backend redis
+        return RedisIdempotencyStore(redis_asyncio.from_url(REDIS_URL, decode_responses=True))
+    if kind == "fake-redis":
+        from common.fakeredis import FakeAsyncRedis
+        return RedisIdempotencyStore(FakeAsyncRedis())
+    return MemoryIdempotencyStore()
@@ -0,0 +1,45 @@
+import inspect
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+
+from fastapi import FastAPI
+
+from common.http import http_clients
+
+if TYPE_CHECKING:  # gateway/notification không cài sqlalchemy
+    from common.db import Database
+
+
+async def _run(hook: Callable):
+    result = hook()
+    if inspect.isawaitable(result):
+        await result
+
+
+def service_lifespan(
+    database: Optional["Database"] = None,
+    on_startup: Iterable[Callable] = (),
+    on_shutdown: Iterable[Callable] = (),
+):
+    """Lifespan chung: warm-up pool DB -> hook startup -> ... -> hook shutdown -> đóng HTTP client & DB.
+
+    Hook có thể là hàm thường hoặc async.
+    """
+    on_startup, on_shutdown = list(on_startup), list(on_shutdown)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if database is not None:
+            await database.warm_up()
+        for hook in on_startup:
+            await _run(hook)
+        try:
+            yield
+        finally:
+            for hook in reversed(on_shutdown):
+                await _run(hook)
+            await http_clients.close()
+            if database is not None:
+                await database.dispose()
+
+    return lifespan
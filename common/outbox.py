@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, delete, func, select
+
+from common.broker import EventBroker
+
+# --- CẤU HÌNH RELAY ---
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", 24))
+
+
+# ==========================================
+# BẢNG OUTBOX + BẢNG CHỐNG TRÙNG (tạo trong DB của từng service)
+# ==========================================
+def outbox_model(Base):
+    """Event chờ gửi: ghi CÙNG transaction với thay đổi nghiệp vụ, relay gửi sau."""
+
+    class OutboxEvent(Base):
+        __tablename__ = "outbox_events"
+        __table_args__ = (Index("ix_outbox_unpublished", "published_at", "id"),)
+
+        id = Column(Integer, primary_key=True, index=True)
+        event_id = Column(String(36), unique=True, nullable=False)
+        event_type = Column(String(64), nullable=False)
+        aggregate_id = Column(String(64))
+        payload = Column(Text, nullable=False)
+        created_at = Column(DateTime, default=datetime.utcnow)
+        published_at = Column(DateTime, nullable=True)
+        attempts = Column(Integer, default=0)
+
+    return OutboxEvent
+
+
+def processed_event_model(Base):
+    """Event đã xử lý bởi consumer nào -> giao trùng thì bỏ qua."""
+
+    class ProcessedEvent(Base):
+        __tablename__ = "processed_events"
+
+        consumer = Column(String(64), primary_key=True)
+        event_id = Column(String(36), primary_key=True)
+        processed_at = Column(DateTime, default=datetime.utcnow)
+
+    return ProcessedEvent
+
+
+def add_event(db, model, event_type: str, payload: dict, aggregate_id=None):
+    """Thêm event vào outbox trong session hiện tại (sync hoặc async); commit cùng dữ liệu."""
+    row = model(
+        event_id=str(uuid.uuid4()),
+        event_type=event_type,
+        aggregate_id=str(aggregate_id) if aggregate_id is not None else None,
+        payload=json.dumps(payload, default=str),
+    )
+    db.add(row)
+    return row
+
+
+def to_event(row, source: str) -> dict:
+    return {
+        "id": row.event_id,
+        "type": row.event_type,
+        "aggregate_id": row.aggregate_id,
+        "payload": json.loads(row.payload),
+        "occurred_at": row.created_at.isoformat() if row.created_at else None,
+        "source": source,
+    }
+
+
+# ==========================================
+# RELAY: outbox -> broker
+# ==========================================
+class OutboxRelay:
+    """Đọc outbox theo lô và publish lên broker.
+
+    - chạy nền trong lifespan; wake() sau khi commit để gửi ngay, không chờ hết chu kỳ poll
+    - nhiều replica chạy cùng lúc: SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8) chia lô
+    - chết giữa publish và commit -> lô đó được gửi lại (at-least-once, consumer tự chống trùng)
+    """
+
+    def __init__(self, session_factory, model, broker: EventBroker, source: str,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 retention_hours: float = OUTBOX_RETENTION_HOURS):
+        self.session_factory = session_factory  # AsyncSessionLocal của service
+        self.model = model
+        self.broker = broker
+        self.source = source
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = timedelta(hours=retention_hours)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = datetime.min
+        self.published = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Gọi được từ cả event loop lẫn threadpool (endpoint `def`)."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run_once(self) -> int:
+        M = self.model
+        async with self.session_factory() as db:
+            rows = (await db.scalars(
+                select(M).where(M.published_at.is_(None)).order_by(M.id)
+                .limit(self.batch_size).with_for_update(skip_locked=True)
+            )).all()
+            if not rows:
+                return 0
+            try:
+                await self.broker.publish([to_event(row, self.source) for row in rows])
+            except Exception:
+                for row in rows:
+                    row.attempts = (row.attempts or 0) + 1
+                await db.commit()
+                raise
+            now = datetime.utcnow()
+            for row in rows:
+                row.published_at = now
+            await db.commit()
+        self.published += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    async def cleanup(self):
+        # Xóa event đã gửi quá OUTBOX_RETENTION_HOURS (giữ lại 1 thời gian để tra cứu)
+        M = self.model
+        async with self.session_factory() as db:
+            await db.execute(delete(M).where(M.published_at < datetime.utcnow() - self.retention))
+            await db.commit()
+
+    async def _run(self):
+        while True:
+            # clear TRƯỚC khi đọc: wake() gọi trong lúc đang gửi sẽ không bị mất
+            self._wakeup.clear()
+            try:
+                sent = await self.run_once()
+                if sent >= self.batch_size:
+                    continue  # còn tồn -> gửi tiếp luôn
+                if datetime.utcnow() - self._last_cleanup > timedelta(minutes=10):
+                    self._last_cleanup = datetime.utcnow()
+                    await self.cleanup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"[outbox:{self.source}] Lỗi publish: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        M = self.model
+        async with self.session_factory() as db:
+            backlog = await db.scalar(select(func.count(M.id)).where(M.published_at.is_(None)))
+        return {
+            "source": self.source,
+            "published": self.published,
+            "batches": self.batches,
+            "errors": self.errors,
+            "backlog": backlog,
+        }
@@ -0,0 +1,327 @@
+import asyncio
+import bisect
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from common.http import http_clients
+
+# --- CẤU HÌNH ---
+# Giá trị chung, ghi đè theo tên service đích, ví dụ:
+#   RESTAURANT_SERVICE_BREAKER_OPEN_SECONDS=10
+#   USER_SERVICE_RETRY_MAX_ATTEMPTS=1
+# Timeout từng đích vẫn cấu hình ở common/http.py (<NAME>_HTTP_TIMEOUT) / gateway_service/pool.py.
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))  # xét N lần gọi gần nhất
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", 0.5))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 5))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 1))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))  # tính cả lần gọi đầu
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.05))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 1.0))
+# Retry tối đa ~10% số request (+ 1 retry/giây khi ít traffic) -> service đang yếu không bị retry dồn thêm tải
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", 0.1))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", 1))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS = {502, 503, 504}
+# Lỗi xảy ra trước khi request tới được upstream -> retry được cả POST
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Ranh giới bucket histogram độ trễ (giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _env(prefix: str, key: str, default, cast):
+    value = os.getenv(f"{prefix}_{key}")
+    return cast(value) if value not in (None, "") else default
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Breaker đang mở -> không gọi upstream. Là httpx.HTTPError nên các chỗ đang bắt lỗi mạng xử lý luôn."""
+
+    def __init__(self, target: str):
+        super().__init__(f"Circuit open for {target}")
+        self.target = target
+
+
+# ==========================================
+# CIRCUIT BREAKER
+# ==========================================
+class CircuitBreaker:
+    """closed -> (tỉ lệ lỗi cao) -> open: fail fast -> hết open_seconds -> half_open: cho vài request thử
+    -> thành công thì closed, lỗi thì open lại."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_ratio: float = BREAKER_FAILURE_RATIO, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self._window = deque(maxlen=window)  # True = thành công
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened_total = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state, self._probes = self.HALF_OPEN, 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes += 1
+        return True
+
+    def release(self):
+        """Request đã được allow() nhưng bị hủy: trả lại lượt thử, không tính thành công / lỗi."""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def record(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if ok:
+                self.state = self.CLOSED
+                self._window.clear()
+            else:
+                self._open()
+            return
+        if self.state == self.OPEN:
+            return  # request bắt đầu trước khi breaker mở
+        self._window.append(ok)
+        if not ok and len(self._window) >= self.min_calls:
+            failures = self._window.count(False)
+            if failures / len(self._window) >= self.failure_ratio:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened_total += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._window),
+            "recent_failures": self._window.count(False),
+            "opened_total": self.opened_total,
+            "rejected": self.rejected,
+        }
+
+
+# ==========================================
+# RETRY BUDGET
+# ==========================================
+class RetryBudget:
+    """Mỗi request nạp `ratio` token, mỗi retry tiêu 1 token; thêm `min_per_second` token/giây."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(10.0, min_per_second * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"tokens": round(self._tokens, 2), "retries": self.retries, "exhausted": self.exhausted}
+
+
+# ==========================================
+# HISTOGRAM ĐỘ TRỄ
+# ==========================================
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ô cuối = lớn hơn bucket lớn nhất
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Ước lượng theo cận trên của bucket (giây)."""
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def stats(self) -> dict:
+        ms = lambda s: None if s is None else (s * 1000 if s != float("inf") else "inf")
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0,
+            "p50_ms": ms(self.percentile(0.5)),
+            "p95_ms": ms(self.percentile(0.95)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "buckets_ms": {
+                **{str(int(b * 1000)): n for b, n in zip(self.buckets, self.counts)},
+                "inf": self.counts[-1],
+            },
+        }
+
+
+# ==========================================
+# TARGET = 1 SERVICE ĐÍCH
+# ==========================================
+class Target:
+    """Breaker + retry budget + histogram cho 1 service đích, dùng chung mọi chỗ gọi tới nó."""
+
+    def __init__(self, name: str):
+        self.name = name
+        prefix = name.upper()
+        self.breaker = CircuitBreaker(
+            window=_env(prefix, "BREAKER_WINDOW", BREAKER_WINDOW, int),
+            min_calls=_env(prefix, "BREAKER_MIN_CALLS", BREAKER_MIN_CALLS, int),
+            failure_ratio=_env(prefix, "BREAKER_FAILURE_RATIO", BREAKER_FAILURE_RATIO, float),
+            open_seconds=_env(prefix, "BREAKER_OPEN_SECONDS", BREAKER_OPEN_SECONDS, float),
+            half_open_probes=_env(prefix, "BREAKER_HALF_OPEN_PROBES", BREAKER_HALF_OPEN_PROBES, int),
+        )
+        self.budget = RetryBudget(
+            ratio=_env(prefix, "RETRY_BUDGET_RATIO", RETRY_BUDGET_RATIO, float),
+            min_per_second=_env(prefix, "RETRY_BUDGET_MIN_PER_SECOND", RETRY_BUDGET_MIN_PER_SECOND, float),
+        )
+        self.max_attempts = _env(prefix, "RETRY_MAX_ATTEMPTS", RETRY_MAX_ATTEMPTS, int)
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: các client không retry cùng lúc
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]], idempotent: bool = True) -> httpx.Response:
+        """Gọi `send()` qua breaker; lỗi mạng / 502-504 thì retry (nếu idempotent và còn budget)."""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.name)
+            self.calls += 1
+            started = time.perf_counter()
+            # Kết quả luôn được ghi vào breaker (finally): lỗi lạ cũng tính là lỗi, request bị hủy
+            # (client ngắt) chỉ trả lại lượt thử half-open -> không kẹt breaker ở half_open
+            outcome = None
+            try:
+                response = await send()
+                outcome = response.status_code < 500
+            except httpx.TransportError as e:
+                outcome = False
+                retry = idempotent or isinstance(e, NOT_SENT_ERRORS)
+                if not retry or not self._retry_allowed(attempt):
+                    raise
+            except Exception:
+                outcome = False
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS or not idempotent or not self._retry_allowed(attempt):
+                    return response
+                await response.aclose()
+            finally:
+                self._finish(started, outcome)
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def _retry_allowed(self, attempt: int) -> bool:
+        return attempt + 1 < self.max_attempts and self.budget.withdraw()
+
+    def _finish(self, started: float, ok: Optional[bool]):
+        """ok=None: request bị hủy giữa chừng, không biết kết quả."""
+        self.latency.observe(time.perf_counter() - started)
+        if ok is None:
+            self.breaker.release()
+            return
+        self.breaker.record(ok)
+        if not ok:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "breaker": self.breaker.stats(),
+            "retry_budget": self.budget.stats(),
+            "latency": self.latency.stats(),
+        }
+
+
+class ResilientClient:
+    """Bọc httpx.AsyncClient dùng chung (common/http.py) bằng Target cùng tên."""
+
+    def __init__(self, target: Target, base_url: str, timeout: Optional[float] = None):
+        self.target = target
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        client = http_clients.get(self.target.name, self.base_url, timeout=self.timeout)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        return await self.target.call(lambda: client.request(method, url, **kwargs), idempotent=idempotent)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+
+class Resilience:
+    def __init__(self):
+        self._targets: Dict[str, Target] = {}
+
+    def target(self, name: str) -> Target:
+        target = self._targets.get(name)
+        if target is None:
+            target = self._targets[name] = Target(name)
+        return target
+
+    def client(self, name: str, base_url: str, timeout: Optional[float] = None) -> ResilientClient:
+        return ResilientClient(self.target(name), base_url, timeout)
+
+    def stats(self) -> dict:
+        return {name: target.stats() for name, target in self._targets.items()}
+
+
+resilience = Resilience()
@@ -0,0 +1,14 @@
+import os
+
+
+def require_secret(name: str) -> str:
+    """Đọc secret bắt buộc từ biến môi trường: thiếu hoặc trùng SECRET_KEY (khóa ký JWT) -> không cho service chạy.
+
+    Mỗi loại secret 1 giá trị riêng: lộ / đổi 1 cái không kéo theo cái khác.
+    """
+    value = os.getenv(name, "")
+    if not value:
+        raise RuntimeError(f"Thiếu biến môi trường {name} (xem .env)")
+    if value == os.getenv("SECRET_KEY"):
+        raise RuntimeError(f"{name} phải khác SECRET_KEY")
+    return value
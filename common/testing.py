@@ -0,0 +1,34 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+
+# --- DÙNG CHUNG CHO tests/conftest.py CỦA CÁC SERVICE ---
+# Test chạy với SQLite (aiosqlite) + FakeAsyncRedis / broker trong RAM, không cần MySQL / Redis.
+# Mỗi service có models.py riêng cùng tên module -> chạy pytest trong từng thư mục service:
+#   cd cart_service && python -m pytest -q
+
+
+def setup_service(conftest_file: str, db_prefix: str):
+    """Gọi đầu conftest, TRƯỚC khi import database / models của service: thêm thư mục service vào sys.path
+    và trỏ <PREFIX>_DATABASE_URL tới 1 file SQLite tạm."""
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(conftest_file)))
+    sys.path.insert(0, service_dir)
+    os.environ.setdefault(f"{db_prefix}_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/{db_prefix.lower()}_test.db")
+    os.environ.setdefault("EVENT_BROKER", "memory")
+
+
+def reset_tables(base, engine):
+    base.metadata.drop_all(bind=engine)
+    base.metadata.create_all(bind=engine)
+
+
+def run_async(coro, async_engine):
+    """asyncio.run + đóng pool async sau mỗi lần (connection aiosqlite gắn với event loop cũ)."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Test các module dùng chung, chạy từ thư mục gốc repo (trong common/ thì common/http.py che module http):
+#   python -m pytest -q common/tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from common.fakeredis import FakeAsyncRedis
+from common.idempotency import REPLAYED_HEADER, MemoryIdempotencyStore, RedisIdempotencyStore, fingerprint
+
+STORES = {
+    "memory": lambda: MemoryIdempotencyStore(),
+    "redis": lambda: RedisIdempotencyStore(FakeAsyncRedis(), poll_interval=0.01, lock_ttl=1),
+}
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request):
+    return STORES[request.param]()
+
+
+def counting_handler(result=None, delay: float = 0):
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result if result is not None else {"order_id": len(calls)}
+
+    return handler, calls
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_same_key_same_body_replays_without_running_handler(store):
+    handler, calls = counting_handler()
+
+    async def scenario():
+        first = await store.run("checkout", "k1", "fp", handler)
+        second = await store.run("checkout", "k1", "fp", handler)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == {"order_id": 1}
+    assert json.loads(second.body) == {"order_id": 1} and second.headers[REPLAYED_HEADER] == "true"
+    assert len(calls) == 1 and store.replayed == 1
+
+
+def test_same_key_other_body_is_422(store):
+    handler, calls = counting_handler()
+
+    async def scenario():
+        await store.run("checkout", "k1", "fp-1", handler)
+        await store.run("checkout", "k1", "fp-2", handler)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(scenario())
+    assert e.value.status_code == 422 and store.mismatches == 1 and len(calls) == 1
+
+
+def test_keys_are_scoped(store):
+    handler, calls = counting_handler()
+
+    async def scenario():
+        await store.run("checkout:1", "k1", "fp", handler)
+        await store.run("checkout:2", "k1", "fp-khac", handler)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_no_key_always_runs(store):
+    handler, calls = counting_handler()
+    asyncio.run(store.run("checkout", None, "fp", handler))
+    asyncio.run(store.run("checkout", None, "fp", handler))
+    assert len(calls) == 2
+
+
+def test_concurrent_duplicate_waits_for_first_result(store):
+    handler, calls = counting_handler(delay=0.1)
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("pay", "k1", "fp", handler) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1 and store.waited >= 2
+    bodies = [r if isinstance(r, dict) else json.loads(r.body) for r in results]
+    assert bodies == [{"order_id": 1}] * 3
+
+
+def test_failed_handler_is_not_stored(store):
+    async def failing():
+        raise RuntimeError("lỗi")
+
+    handler, calls = counting_handler()
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run("pay", "k1", "fp", failing)
+        return await store.run("pay", "k1", "fp", handler)
+
+    assert asyncio.run(scenario()) == {"order_id": 1} and len(calls) == 1
+
+
+def test_slow_handler_keeps_redis_lock():
+    store = RedisIdempotencyStore(FakeAsyncRedis(), poll_interval=0.01, lock_ttl=0.3)
+    handler, calls = counting_handler(delay=2.0)
+
+    async def scenario():
+        first = asyncio.create_task(store.run("pay", "k1", "fp", handler))
+        await asyncio.sleep(1.5)  # khóa đặt hạn 1s (tối thiểu của EX): không gia hạn thì đã mất
+        second = await store.run("pay", "k1", "fp", handler)
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(calls) == 1 and store.lost_locks == 0
+    assert json.loads(second.body) == first
@@ -0,0 +1,169 @@
+import asyncio
+
+import httpx
+import pytest
+
+from common.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, Target
+
+REQUEST = httpx.Request("GET", "http://upstream/x")
+
+
+def response(status: int) -> httpx.Response:
+    return httpx.Response(status, request=REQUEST)
+
+
+def make_target(**breaker) -> Target:
+    target = Target("test")
+    target.breaker = CircuitBreaker(**{"window": 4, "min_calls": 4, "failure_ratio": 0.5, "open_seconds": 60, **breaker})
+    target.budget = RetryBudget(ratio=0.1, min_per_second=0)
+    target.max_attempts = 3
+    target.backoff = lambda attempt: 0
+    return target
+
+
+def upstream(*results):
+    """send() trả lần lượt các kết quả (status code hoặc exception); -> (send, danh sách lần gọi)."""
+    calls = []
+
+    async def send():
+        result = results[len(calls)]
+        calls.append(result)
+        if isinstance(result, BaseException):
+            raise result
+        return response(result)
+
+    return send, calls
+
+
+# --- breaker ---
+def test_breaker_opens_on_failure_ratio_and_rejects():
+    breaker = CircuitBreaker(window=4, min_calls=4, failure_ratio=0.5, open_seconds=60)
+    for ok in (True, True, False):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == breaker.CLOSED  # chưa đủ min_calls
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow() and breaker.rejected == 1
+
+
+def test_half_open_allows_limited_probes_then_closes_or_reopens():
+    breaker = CircuitBreaker(window=2, min_calls=2, failure_ratio=0.5, open_seconds=0, half_open_probes=1)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN
+    assert breaker.allow() and breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()  # chỉ 1 lượt thử
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN and breaker.opened_total == 2
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == breaker.CLOSED
+
+
+def test_release_returns_half_open_probe():
+    breaker = CircuitBreaker(window=2, min_calls=2, open_seconds=0, half_open_probes=1)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == breaker.HALF_OPEN and breaker.allow()
+
+
+# --- retry ---
+def test_idempotent_call_retries_502_504():
+    target = make_target()
+    send, calls = upstream(503, 502, 200)
+    assert asyncio.run(target.call(send)).status_code == 200
+    assert calls == [503, 502, 200] and target.budget.retries == 2
+
+
+def test_retries_stop_at_max_attempts():
+    target = make_target()
+    send, calls = upstream(503, 503, 503, 200)
+    assert asyncio.run(target.call(send)).status_code == 503
+    assert len(calls) == 3
+
+
+def test_non_idempotent_call_is_not_retried_after_sending():
+    target = make_target()
+    send, calls = upstream(503, 200)
+    assert asyncio.run(target.call(send, idempotent=False)).status_code == 503
+    send, calls = upstream(httpx.ReadTimeout("chậm"), 200)
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(target.call(send, idempotent=False))
+    assert len(calls) == 1
+
+
+def test_non_idempotent_call_retries_when_request_was_not_sent():
+    target = make_target()
+    send, calls = upstream(httpx.ConnectError("refused"), 200)
+    assert asyncio.run(target.call(send, idempotent=False)).status_code == 200
+    assert len(calls) == 2
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.1, min_per_second=0)
+    budget._tokens = 1.0
+    assert budget.withdraw()
+    assert not budget.withdraw() and budget.exhausted == 1
+    for _ in range(11):  # mỗi request nạp 0.1 -> ~10 request mới được thêm 1 retry
+        budget.deposit()
+    assert budget.withdraw()
+
+    target = make_target()
+    target.budget._tokens = 0
+    send, calls = upstream(503, 200)
+    assert asyncio.run(target.call(send)).status_code == 503
+    assert len(calls) == 1 and target.budget.exhausted == 1
+
+
+def test_open_breaker_fails_fast_without_calling_upstream():
+    target = make_target(window=2, min_calls=2)
+    for _ in range(2):
+        send, _ = upstream(500)
+        asyncio.run(target.call(send))
+    send, calls = upstream(200)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(target.call(send))
+    assert calls == []
+
+
+# --- kết quả luôn ghi vào breaker ---
+def half_open_target() -> Target:
+    target = make_target(window=2, min_calls=2, open_seconds=0)
+    target.breaker.record(False)
+    target.breaker.record(False)
+    return target
+
+
+def test_unexpected_exception_counts_as_failure():
+    target = half_open_target()
+    send, _ = upstream(ValueError("lỗi lạ"))
+    with pytest.raises(ValueError):
+        asyncio.run(target.call(send))
+    assert target.breaker.state == target.breaker.OPEN and target.failures == 1
+
+
+def test_cancelled_call_releases_half_open_probe():
+    target = half_open_target()
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        task = asyncio.create_task(target.call(hang))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert target.breaker.state == target.breaker.HALF_OPEN
+    send, _ = upstream(200)
+    assert asyncio.run(target.call(send)).status_code == 200
+    assert target.breaker.state == target.breaker.CLOSED
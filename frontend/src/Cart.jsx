@@ -25,24 +25,13 @@ function Cart() {
 
     const fetchCart = async () => {
         try {
-            const cartRes = await api.get('/cart');
-            const items = cartRes.data;
+            // 1 request duy nhất: cart_service trả về sẵn tên, giá, ảnh của từng món
+            const cartRes = await api.get('/cart/details');
+            const items = cartRes.data.items.map(item => ({ ...item, price: item.final_price }));
             if (items.length === 0) { setCartItems([]); return; }
 
-            const enrichedItems = await Promise.all(items.map(async (item) => {
-                try {
-                    const foodDetail = await api.get(`/foods/${item.food_id}`);
-                    return {
-                        ...item,
-                        name: foodDetail.data.name,
-                        price: foodDetail.data.price,
-                        image_url: foodDetail.data.image_url
-                    };
-                } catch (e) { return { ...item, name: "Món đã xóa", price: 0 }; }
-            }));
-
-            setCartItems(enrichedItems);
-            calculateSubTotal(enrichedItems);
+            setCartItems(items);
+            calculateSubTotal(items);
         } catch (err) { console.error(err); }
     };
 
@@ -64,14 +53,11 @@ function Cart() {
     const removeItem = async (foodId) => {
         if(!window.confirm("Xóa món này khỏi giỏ?")) return;
         try {
-            // Lưu ý: API hiện tại của bạn là xóa hết. Nếu backend hỗ trợ xóa 1 món thì gọi API đó.
-            // Ở đây mình giả lập xóa trên giao diện trước
+            // Xóa đúng 1 món trên server rồi mới cập nhật giao diện
+            await api.post('/cart/batch', { ops: [{ op: 'remove', food_id: foodId }] });
             const updatedItems = cartItems.filter(item => item.food_id !== foodId);
             setCartItems(updatedItems);
             calculateSubTotal(updatedItems);
-            // Gọi API thực tế (nếu có): await api.delete(`/cart/${foodId}`); 
-            // Hiện tại dùng tạm xóa all nếu backend chưa update:
-            if(updatedItems.length === 0) await api.delete('/cart');
         } catch(err) { toast.error("Lỗi xóa món"); }
     };
 
@@ -149,7 +135,7 @@ function Cart() {
                                     <td>
                                         <div style={{display:'flex', alignItems:'center', gap:'20px'}}>
                                             {item.image_url ? (
-                                                <img src={`${API_URL}${item.image_url}`} className="cart-thumb" alt="" />
+                                                <img src={`${API_URL}${item.image_url}?size=thumb`} className="cart-thumb" alt="" />
                                             ) : (
                                                 <div className="cart-thumb" style={{background:'#eee', display:'flex', alignItems:'center', justifyContent:'center', fontSize:'2rem'}}>🍖</div>
                                             )}
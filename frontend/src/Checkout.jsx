@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import { FaArrowLeft, FaMapMarkerAlt, FaFileInvoiceDollar, FaUser, FaPhone, FaStickyNote } from "react-icons/fa"; 
@@ -15,13 +15,35 @@ function Checkout() {
     const [branchName, setBranchName] = useState('Đang tải...');
     const [savedAddresses, setSavedAddresses] = useState([]); 
     const [loading, setLoading] = useState(false);
+    // Báo giá từ server (POST /quote): tổng tiền chính xác + token gửi kèm /checkout để không phải tính lại
+    const [quote, setQuote] = useState(null);
+    // 1 key cho 1 lần đặt hàng: bấm lại / mạng chập chờn gửi lại cũng không tạo đơn trùng
+    const idempotencyKey = useRef(crypto.randomUUID());
 
     useEffect(() => {
         if (!items || items.length === 0) { navigate('/shop'); return; }
         if (branch_id) fetchBranchInfo();
         fetchSavedAddresses(); 
+        fetchQuote();
     }, [items, branch_id, navigate]);
 
+    const fetchQuote = async () => {
+        const userId = localStorage.getItem('user_id');
+        try {
+            const res = await api.post('/quote', {
+                user_id: userId ? parseInt(userId) : null,
+                branch_id: branch_id,
+                items: items.map(item => ({ food_id: item.food_id, quantity: item.quantity })),
+                coupon_code: coupon ? coupon.code : null
+            });
+            setQuote(res.data);
+        } catch (err) {
+            // Không có báo giá vẫn đặt được: /checkout tự tính lại giá
+            console.error(err);
+            if (err.response?.status === 400) toast.warning(err.response.data.detail);
+        }
+    };
+
     const fetchSavedAddresses = async () => {
         const token = localStorage.getItem('access_token');
         if (!token) return;
@@ -72,10 +94,11 @@ function Checkout() {
                 customer_name: customerInfo.name,
                 customer_phone: customerInfo.phone,
                 delivery_address: customerInfo.address,
-                note: customerInfo.note
+                note: customerInfo.note,
+                quote_token: quote ? quote.quote_token : null
             };
             
-            const orderRes = await api.post('/checkout', orderPayload);
+            const orderRes = await api.post('/checkout', orderPayload, { headers: { 'Idempotency-Key': idempotencyKey.current } });
             const { order_id, total_price } = orderRes.data;
 
             toast.info("Đang chuyển sang thanh toán...");
@@ -85,7 +108,8 @@ function Checkout() {
 
         } catch (err) {
             console.error(err);
-            toast.error("Lỗi đặt hàng. Thử lại sau!");
+            // 400: món đã bị xóa / mã giảm giá hết hạn; 503: quán tạm thời không phản hồi
+            toast.error(err.response?.data?.detail || "Lỗi đặt hàng. Thử lại sau!");
         } finally {
             setLoading(false);
         }
@@ -177,7 +201,7 @@ function Checkout() {
                             <div key={item.food_id} style={{display:'flex', alignItems: 'center', justifyContent:'space-between', marginBottom:'12px', borderBottom:'1px solid #f0f0f0', paddingBottom:'8px'}}>
                                 <div style={{display:'flex', alignItems: 'center', gap: '10px'}}>
                                     {item.image_url ? 
-                                        <img src={`${API_URL}${item.image_url}`} style={{width:'40px', height:'40px', objectFit:'cover', borderRadius:'4px', border:'1px solid #ddd'}} alt="" /> 
+                                        <img src={`${API_URL}${item.image_url}?size=thumb`} style={{width:'40px', height:'40px', objectFit:'cover', borderRadius:'4px', border:'1px solid #ddd'}} alt="" /> 
                                         : <div style={{width:'40px', height:'40px', background:'#eee', borderRadius:'4px'}}></div>
                                     }
                                     <div>
@@ -199,7 +223,7 @@ function Checkout() {
                     
                     <div style={{display:'flex', justifyContent:'space-between', fontSize:'1.4rem', fontWeight:'800', marginTop:'10px', color:'#333', borderTop:'2px solid #333', paddingTop:'15px'}}>
                         <span>Tổng tiền:</span>
-                        <span style={{color:'#ff6347'}}>{formatMoney(final_price)}</span>
+                        <span style={{color:'#ff6347'}}>{formatMoney(quote ? quote.total_price : final_price)}</span>
                     </div>
                     
                     <button onClick={handleConfirmOrder} disabled={loading} style={{
@@ -15,11 +15,38 @@ function OrderHistory() {
     const navigate = useNavigate();
 
     useEffect(() => {
-        fetchOrders();
-        const interval = setInterval(() => fetchOrders(true), 5000);
-        return () => clearInterval(interval);
+        // Long-poll /orders/changes: server giữ request tới khi có đơn đổi trạng thái (tối đa 10s)
+        // thay vì tải lại toàn bộ danh sách mỗi 5 giây
+        let active = true;
+        const watchOrders = async () => {
+            const userId = localStorage.getItem('user_id');
+            if (!userId) { fetchOrders(); return; }
+            let cursor = null;
+            try { cursor = (await api.get('/orders/changes', { params: { user_id: userId } })).data.cursor; }
+            catch (err) { console.error(err); }
+            await fetchOrders();
+            while (active && cursor !== null) {
+                try {
+                    const res = await api.get('/orders/changes', { params: { user_id: userId, since: cursor, wait: 10 } });
+                    cursor = res.data.cursor;
+                    if (active && res.data.orders.length > 0) mergeOrders(res.data.orders);
+                } catch (err) {
+                    await new Promise(resolve => setTimeout(resolve, 5000));
+                }
+            }
+        };
+        watchOrders();
+        return () => { active = false; };
     }, []);
 
+    const mergeOrders = (changed) => {
+        setOrders(prev => {
+            const byId = new Map(prev.map(o => [o.id, o]));
+            changed.forEach(o => byId.set(o.id, o));
+            return [...byId.values()].sort((a, b) => new Date(b.created_at) - new Date(a.created_at) || b.id - a.id);
+        });
+    };
+
     const fetchOrders = async (isBackground = false) => {
         const userId = localStorage.getItem('user_id');
         if (!userId) { if(!isBackground) navigate('/'); return; }
@@ -51,13 +78,14 @@ function OrderHistory() {
         try {
             const payload = {
                 order_id: selectedOrder.id,
+                branch_id: selectedOrder.branch_id,
                 rating_general: reviewData.rating,
                 comment: reviewData.comment,
                 items: selectedOrder.items.map(item => ({ food_id: item.food_id, score: reviewData.rating }))
             };
             await api.post('/reviews', payload, { headers: { Authorization: `Bearer ${token}` } });
             toast.success("Đánh giá thành công! ⭐"); setShowReviewModal(false);
-        } catch (err) { console.error(err); toast.error("Lỗi gửi đánh giá"); }
+        } catch (err) { console.error(err); toast.error(err.response?.data?.detail || "Lỗi gửi đánh giá"); }
     };
 
     const renderStatus = (status) => {
@@ -93,7 +121,7 @@ function OrderHistory() {
                             {order.items?.map((item, idx) => (
                                 <div key={idx} style={{display: 'flex', justifyContent: 'space-between', alignItems: 'center', fontSize: '0.9rem', marginBottom: '8px'}}>
                                     <div style={{display: 'flex', alignItems: 'center'}}>
-                                        {item.image_url ? ( <img src={`${API_URL}${item.image_url}`} style={{width: '35px', height: '35px', objectFit: 'cover', borderRadius: '4px', marginRight: '10px'}} /> ) : ( <span>🍖</span> )}
+                                        {item.image_url ? ( <img src={`${API_URL}${item.image_url}?size=thumb`} style={{width: '35px', height: '35px', objectFit: 'cover', borderRadius: '4px', marginRight: '10px'}} /> ) : ( <span>🍖</span> )}
                                         <span>{item.quantity}x <b>{item.food_name}</b></span>
                                     </div>
                                     <span style={{color: '#666'}}>{formatMoney(item.price)}</span>
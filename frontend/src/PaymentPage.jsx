@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import api from './api';
@@ -10,6 +10,7 @@ function PaymentPage() {
     const [savedCards, setSavedCards] = useState([]);
     const [selectedCardId, setSelectedCardId] = useState('new'); 
     const [processing, setProcessing] = useState(false);
+    const idempotencyKey = useRef(crypto.randomUUID()); // thanh toán lại đơn này không bị trừ tiền 2 lần
     const [newCard, setNewCard] = useState({ bank_name: '', card_number: '', card_holder: '', expiry_date: '' });
 
     useEffect(() => {
@@ -35,7 +36,7 @@ function PaymentPage() {
                 await api.post('/payment-methods', newCard, { headers: { Authorization: `Bearer ${token}` } });
             }
             await new Promise(r => setTimeout(r, 2000));
-            await api.post('/pay', { order_id: order_id, amount: total_price });
+            await api.post('/pay', { order_id: order_id, amount: total_price }, { headers: { 'Idempotency-Key': idempotencyKey.current } });
             toast.success("Thanh toán thành công! 💸");
             try { await api.delete('/cart'); } catch(e) {}
             navigate('/history');
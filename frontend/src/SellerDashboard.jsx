@@ -23,7 +23,7 @@ function SellerDashboard() {
     const [previewImage, setPreviewImage] = useState(null);
 
     // Form thêm mã
-    const [newCoupon, setNewCoupon] = useState({ code: '', discount_percent: '', valid_from: '', valid_to: '' });
+    const [newCoupon, setNewCoupon] = useState({ code: '', discount_percent: '', valid_from: '', valid_to: '', usage_limit: '', per_user_limit: '' });
 
     const navigate = useNavigate();
 
@@ -144,7 +144,11 @@ function SellerDashboard() {
                 discount_percent: parseInt(newCoupon.discount_percent),
                 // Xử lý ngày tháng theo chuẩn ISO để backend dễ đọc
                 start_date: newCoupon.valid_from ? new Date(newCoupon.valid_from).toISOString() : new Date().toISOString(),
-                end_date: newCoupon.valid_to ? new Date(newCoupon.valid_to).toISOString() : new Date().toISOString(),
+                // Không chọn ngày kết thúc -> mã không hết hạn (trước đây gửi "bây giờ" nên mã hết hạn ngay)
+                end_date: newCoupon.valid_to ? new Date(newCoupon.valid_to).toISOString() : null,
+                // Để trống = không giới hạn lượt dùng
+                usage_limit: newCoupon.usage_limit ? parseInt(newCoupon.usage_limit) : null,
+                per_user_limit: newCoupon.per_user_limit ? parseInt(newCoupon.per_user_limit) : null,
                 // Lưu ý: Nếu backend cũ của bạn dùng key là 'valid_from'/'valid_to' thì sửa lại key ở đây nhé
                 // Dựa trên code cũ bạn gửi, có vẻ là start_date/end_date
             };
@@ -247,7 +251,7 @@ function SellerDashboard() {
                                 {foods.map(f => (
                                     <tr key={f.id}>
                                         <td>
-                                            <img src={f.image_url ? `${API_BASE_URL}${f.image_url}` : 'https://via.placeholder.com/50'} 
+                                            <img src={f.image_url ? `${API_BASE_URL}${f.image_url}?size=thumb` : 'https://via.placeholder.com/50'} 
                                                  style={{width:'50px', height:'50px', objectFit:'cover', borderRadius:'4px'}} alt=""/>
                                         </td>
                                         <td>{f.name}</td>
@@ -269,13 +273,14 @@ function SellerDashboard() {
                         <button onClick={()=>setShowModal('coupon')} style={{background:'#007bff', color:'white', padding:'10px 20px', borderRadius:'6px', border:'none', fontWeight:'bold', cursor:'pointer'}}><FaPlus/> Tạo mã</button>
                     </div>
                     <table className="data-table">
-                        <thead><tr><th>Code</th><th>Giảm</th><th>Hạn dùng</th><th>Xóa</th></tr></thead>
+                        <thead><tr><th>Code</th><th>Giảm</th><th>Hạn dùng</th><th>Đã dùng</th><th>Xóa</th></tr></thead>
                         <tbody>
                             {coupons.map(c => (
                                 <tr key={c.id}>
                                     <td><span style={{background:'#e3f2fd', padding:'5px 10px', borderRadius:'4px', color:'#007bff', fontWeight:'bold'}}>{c.code}</span></td>
                                     <td>{c.discount_percent}%</td>
                                     <td>{formatDate(c.end_date || c.valid_to)}</td>
+                                    <td>{c.used_count || 0}{c.usage_limit ? ` / ${c.usage_limit}` : ''}</td>
                                     <td><button onClick={()=>handleDeleteCoupon(c.id)} style={{color:'#dc3545', background:'none', border:'none', cursor:'pointer'}}><FaTrash/></button></td>
                                 </tr>
                             ))}
@@ -317,6 +322,10 @@ function SellerDashboard() {
                             <div className="form-group" style={{flex:1}}><label>Từ ngày:</label><input type="datetime-local" onChange={e=>setNewCoupon({...newCoupon, valid_from:e.target.value})}/></div>
                             <div className="form-group" style={{flex:1}}><label>Đến ngày:</label><input type="datetime-local" onChange={e=>setNewCoupon({...newCoupon, valid_to:e.target.value})}/></div>
                         </div>
+                        <div style={{display:'flex', gap:'10px'}}>
+                            <div className="form-group" style={{flex:1}}><label>Tổng lượt dùng:</label><input type="number" min="1" placeholder="Không giới hạn" value={newCoupon.usage_limit} onChange={e=>setNewCoupon({...newCoupon, usage_limit:e.target.value})}/></div>
+                            <div className="form-group" style={{flex:1}}><label>Lượt / khách:</label><input type="number" min="1" placeholder="Không giới hạn" value={newCoupon.per_user_limit} onChange={e=>setNewCoupon({...newCoupon, per_user_limit:e.target.value})}/></div>
+                        </div>
                         <div className="modal-actions">
                             <button className="btn-cancel" onClick={()=>setShowModal(null)}>Hủy</button>
                             <button className="btn-confirm" onClick={handleAddCoupon} disabled={loading}>{loading?'Đang tạo...':'Tạo mã'}</button>
@@ -50,8 +50,11 @@ function Shop() {
         } catch (err) {
             if (err.response?.status === 409) {
                 if(window.confirm("Giỏ hàng đang chứa món của quán khác! Bạn có muốn xóa giỏ cũ để thêm món này không?")) {
-                    await api.delete('/cart');
-                    await api.post('/cart', { food_id: option.food_id, branch_id: option.branch_id, quantity: 1 });
+                    // Xóa giỏ cũ + thêm món mới trong 1 request (1 transaction)
+                    await api.post('/cart/batch', { ops: [
+                        { op: 'clear' },
+                        { op: 'add', food_id: option.food_id, branch_id: option.branch_id, quantity: 1 },
+                    ] });
                     toast.success("Đã tạo giỏ mới!");
                     setSelectedFood(null);
                 }
@@ -97,7 +100,7 @@ function Shop() {
                             {/* Hiển thị ảnh từ API thật */}
                             {food.image_url ? (
                                 <img 
-                                    src={food.image_url.startsWith('http') ? food.image_url : `${API_BASE_URL}${food.image_url}`} 
+                                    src={food.image_url.startsWith('http') ? food.image_url : `${API_BASE_URL}${food.image_url}?size=card`} 
                                     alt={food.name} 
                                     onError={(e) => {e.target.src = "https://via.placeholder.com/300x200?text=No+Image"}} 
                                 />
@@ -133,7 +136,7 @@ function Shop() {
                             {foodOptions.map((opt, idx) => (
                                 <div key={idx} className="option-item" style={{display:'flex', justifyContent:'space-between', alignItems:'center', padding:'15px', borderBottom:'1px solid #eee'}}>
                                     <div style={{display:'flex', alignItems:'center'}}>
-                                        {opt.image_url && <img src={opt.image_url.startsWith('http') ? opt.image_url : `${API_BASE_URL}${opt.image_url}`} style={{width:'50px', height:'50px', objectFit:'cover', borderRadius:'4px', marginRight:'10px'}} />}
+                                        {opt.image_url && <img src={opt.image_url.startsWith('http') ? opt.image_url : `${API_BASE_URL}${opt.image_url}?size=thumb`} style={{width:'50px', height:'50px', objectFit:'cover', borderRadius:'4px', marginRight:'10px'}} />}
                                         <div>
                                             <strong>{opt.branch_name}</strong><br/>
                                             <span style={{color:'red', fontWeight:'bold'}}>{formatMoney(opt.final_price)}</span>
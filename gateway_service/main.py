@@ -1,9 +1,38 @@
+import hmac
 import httpx
 import os
-from fastapi import FastAPI, Request, HTTPException, Response
+from typing import List
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from pool import PoolRegistry
+from static import StaticServer
+from response_cache import ResponseCache
+from common.lifespan import service_lifespan
+from common.settings import require_secret
+from common.resilience import IDEMPOTENT_METHODS, CircuitOpenError, resilience
 
-app = FastAPI()
+# --- URL SERVICE ---
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8001")
+RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant_service:8002")
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment_service:8004")
+CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8005")
+
+# Token cho API nội bộ (restaurant_service gọi để xóa cache): bắt buộc set INTERNAL_TOKEN riêng, khác SECRET_KEY
+INTERNAL_TOKEN = require_secret("INTERNAL_TOKEN")
+
+# --- CONNECTION POOL (1 pool / backend, dùng chung cho mọi request) ---
+pools = PoolRegistry()
+pools.register("user_service", USER_SERVICE_URL)
+pools.register("restaurant_service", RESTAURANT_SERVICE_URL)
+pools.register("order_service", ORDER_SERVICE_URL)
+pools.register("payment_service", PAYMENT_SERVICE_URL)
+pools.register("cart_service", CART_SERVICE_URL)
+
+app = FastAPI(lifespan=service_lifespan(on_startup=[pools.start], on_shutdown=[pools.close]))
 
 # --- CẤU HÌNH CORS ---
 origins = [
@@ -18,48 +47,157 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Header phân trang / tổng số dòng do các service trả về, cho phép JS đọc
+    expose_headers=["X-Total-Count", "X-Next-Before-Created-At", "X-Next-Before-Id", "Idempotent-Replayed"],
 )
 
-# --- URL SERVICE ---
-USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8001")
-RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant_service:8002")
-ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
-PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment_service:8004")
-CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8005")
-
 # --- PROXY FUNCTION ---
+# Header chỉ có ý nghĩa trên 1 chặng kết nối -> không được chuyển tiếp (RFC 7230 6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+
+def filter_headers(items, drop=()):
+    items = list(items)
+    # Các header được liệt kê trong "Connection: ..." cũng là hop-by-hop
+    extra = set()
+    for key, value in items:
+        if key.lower() == "connection":
+            extra.update(token.strip().lower() for token in value.split(","))
+    blocked = HOP_BY_HOP_HEADERS | extra | set(drop)
+    return [(key, value) for key, value in items if key.lower() not in blocked]
+
+def upstream_error(e: Exception) -> HTTPException:
+    if isinstance(e, CircuitOpenError):
+        # Service đang lỗi liên tục -> trả lỗi ngay, không giữ worker chờ timeout
+        return HTTPException(status_code=503, detail="Service Unavailable (circuit open)")
+    if isinstance(e, httpx.ConnectError):
+        return HTTPException(status_code=503, detail="Service Unavailable")
+    if isinstance(e, httpx.PoolTimeout):
+        return HTTPException(status_code=503, detail="Upstream pool exhausted")
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="Gateway Timeout")
+    print(f"Gateway Error: {e}")
+    return HTTPException(status_code=500, detail="Internal Gateway Error")
+
 async def forward_request(service_url: str, path: str, request: Request):
-    client = httpx.AsyncClient()
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    headers.pop("content-length", None)
-    params = dict(request.query_params)
-    body = await request.body()
+    pool = pools.for_url(service_url)
+    headers = filter_headers(request.headers.items(), drop=("host",))
+
+    # Body được stream thẳng lên upstream theo từng chunk, không đọc hết vào RAM.
+    # Giữ nguyên content-length của client; nếu client gửi chunked thì httpx tự chunk lại.
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    content = request.stream() if has_body else None
 
+    started = pool.acquire()
     try:
-        url = f"{service_url}/{path}"
-        response = await client.request(
+        upstream_request = pool.client.build_request(
             method=request.method,
-            url=url,
+            url=f"/{path}",
             headers=headers,
-            params=params,
-            content=body
+            params=list(request.query_params.multi_items()),
+            content=content,
         )
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            headers=dict(response.headers)
+        # Retry (lỗi mạng / 502-504) chỉ khi request không có body và method idempotent
+        upstream = await pool.target.call(
+            lambda: pool.client.send(upstream_request, stream=True),
+            idempotent=content is None and request.method in IDEMPOTENT_METHODS,
         )
-    except httpx.ConnectError:
-        raise HTTPException(status_code=503, detail="Service Unavailable")
     except Exception as e:
-        print(f"Gateway Error: {e}")
-        raise HTTPException(status_code=500, detail="Internal Gateway Error")
+        pool.release(started, error=True)
+        raise upstream_error(e)
+
+    closed = False
+
+    async def close_upstream():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        await upstream.aclose()
+        pool.release(started)
+
+    async def stream_body():
+        # Đóng upstream + trả slot pool trong finally: client ngắt giữa chừng (ClientDisconnect)
+        # thì BackgroundTask không chạy, nhưng generator vẫn được đóng
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await close_upstream()
+
+    # Trả body về client theo từng chunk (raw = giữ nguyên content-encoding/gzip của upstream)
+    response = StreamingResponse(
+        stream_body(),
+        status_code=upstream.status_code,
+        background=BackgroundTask(close_upstream),  # phòng khi body không được đọc tới
+    )
+    # Dùng raw_headers để không mất header lặp (vd: nhiều Set-Cookie)
+    response.raw_headers = [
+        (key.encode("latin-1"), value.encode("latin-1"))
+        for key, value in filter_headers(upstream.headers.multi_items())
+    ]
+    return response
+
+# --- RESPONSE CACHE CHO API CATALOGUE (xem response_cache.py) ---
+response_cache = ResponseCache()
+
+# Gateway tự trả 304 từ cache -> không gửi điều kiện lên upstream, luôn lấy body đầy đủ
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since", "range", "if-range", "cache-control", "pragma")
+
+async def fetch_upstream(service_url: str, path: str, request: Request) -> httpx.Response:
+    """GET lên upstream, đọc hết body (đã giải nén) để lưu vào cache."""
+    pool = pools.for_url(service_url)
+    headers = filter_headers(request.headers.items(), drop=("host",) + CONDITIONAL_HEADERS)
+    started = pool.acquire()
+    try:
+        upstream = await pool.target.call(
+            lambda: pool.client.get(f"/{path}", headers=headers, params=list(request.query_params.multi_items()))
+        )
+    except Exception as e:
+        pool.release(started, error=True)
+        raise upstream_error(e)
+    pool.release(started, error=upstream.status_code >= 500)
+    return upstream
+
+async def forward_cached(service_url: str, path: str, request: Request):
+    """GET công khai -> qua response_cache; ghi thành công qua gateway -> xóa cache của nhóm route đó."""
+    if request.method == "GET":
+        rule = response_cache.match(request.url.path)
+        if rule is None:
+            return await forward_request(service_url, path, request)
+        return await response_cache.serve(rule, request, lambda req: fetch_upstream(service_url, path, req))
+    response = await forward_request(service_url, path, request)
+    if response.status_code < 400:
+        response_cache.invalidate_for_write(request.url.path)
+    return response
+
+class InvalidateRequest(BaseModel):
+    prefixes: List[str]
+
+# restaurant_service gọi khi menu / quán / coupon / review thay đổi (mọi replica gateway đều phải nhận)
+@app.post("/internal/cache/invalidate")
+def invalidate_cache(body: InvalidateRequest, x_internal_token: str = Header("", alias="X-Internal-Token")):
+    if not INTERNAL_TOKEN or not hmac.compare_digest(x_internal_token, INTERNAL_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"invalidated": response_cache.invalidate(body.prefixes)}
+
+@app.get("/metrics/cache")
+def cache_metrics(): return response_cache.stats()
 
 # --- ROUTES ---
 @app.get("/")
 def read_root(): return {"message": "Welcome to Food Delivery Gateway!"}
 
+# Số liệu sử dụng connection pool của từng backend
+@app.get("/metrics/pools")
+def pool_metrics(): return pools.stats()
+
+# Trạng thái circuit breaker, retry budget, histogram độ trễ theo backend
+@app.get("/metrics/resilience")
+def resilience_metrics(): return resilience.stats()
+
 # 1. USER
 @app.api_route("/register", methods=["POST", "OPTIONS"])
 async def register(req: Request): return await forward_request(USER_SERVICE_URL, "register", req)
@@ -72,41 +210,51 @@ async def users_path(path: str, req: Request): return await forward_request(USER
 
 # ... (Phần trên giữ nguyên)
 
-# 2. RESTAURANT
+# 2. RESTAURANT (GET đi qua response_cache, xem forward_cached)
 @app.api_route("/foods", methods=["GET", "POST"])
-async def foods_root(req: Request): return await forward_request(RESTAURANT_SERVICE_URL, "foods", req)
+async def foods_root(req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, "foods", req)
 @app.api_route("/foods/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def foods_path(path: str, req: Request): return await forward_request(RESTAURANT_SERVICE_URL, f"foods/{path}", req)
+async def foods_path(path: str, req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, f"foods/{path}", req)
 
 @app.api_route("/branches", methods=["GET", "POST"])
-async def branches_root(req: Request): return await forward_request(RESTAURANT_SERVICE_URL, "branches", req)
+async def branches_root(req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, "branches", req)
 @app.api_route("/branches/{path:path}", methods=["GET", "PUT", "DELETE"])
-async def branches_path(path: str, req: Request): return await forward_request(RESTAURANT_SERVICE_URL, f"branches/{path}", req)
+async def branches_path(path: str, req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, f"branches/{path}", req)
 
 # --- [SỬA DÒNG NÀY] THÊM "GET" VÀO ĐÂY ---
 @app.api_route("/coupons", methods=["GET", "POST"]) 
-async def coupons_root(req: Request): return await forward_request(RESTAURANT_SERVICE_URL, "coupons", req)
+async def coupons_root(req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, "coupons", req)
 # ------------------------------------------
 
 @app.api_route("/coupons/{path:path}", methods=["GET", "PUT", "DELETE"])
-async def coupons_path(path: str, req: Request): return await forward_request(RESTAURANT_SERVICE_URL, f"coupons/{path}", req)
+async def coupons_path(path: str, req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, f"coupons/{path}", req)
 
 @app.api_route("/reviews", methods=["POST"])
-async def reviews_root(req: Request): return await forward_request(RESTAURANT_SERVICE_URL, "reviews", req)
+async def reviews_root(req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, "reviews", req)
 @app.api_route("/reviews/{path:path}", methods=["GET"])
-async def reviews_path(path: str, req: Request): return await forward_request(RESTAURANT_SERVICE_URL, f"reviews/{path}", req)
+async def reviews_path(path: str, req: Request): return await forward_cached(RESTAURANT_SERVICE_URL, f"reviews/{path}", req)
 
 # ... (Phần dưới giữ nguyên)
 # --- QUAN TRỌNG: THÊM ROUTE STATIC ĐỂ XEM ẢNH ---
+# Đọc thẳng từ volume ảnh (STATIC_ROOT) hoặc cache RAM; chỉ khi không có mới hỏi Restaurant Service
+static_server = StaticServer(
+    pools.for_url(RESTAURANT_SERVICE_URL),
+    forward=lambda req: forward_request(RESTAURANT_SERVICE_URL, req.url.path.lstrip("/"), req),
+)
+
 @app.api_route("/static/{path:path}", methods=["GET"])
 async def static_files(path: str, req: Request):
-    # Chuyển tiếp request xem ảnh sang Restaurant Service
-    return await forward_request(RESTAURANT_SERVICE_URL, f"static/{path}", req)
+    return await static_server.serve(path, req)
+
+@app.get("/metrics/static")
+def static_metrics(): return static_server.stats()
 # ------------------------------------------------
 
 # 3. ORDER
 @app.api_route("/checkout", methods=["POST"])
 async def checkout(req: Request): return await forward_request(ORDER_SERVICE_URL, "checkout", req)
+@app.api_route("/quote", methods=["POST"])
+async def quote(req: Request): return await forward_request(ORDER_SERVICE_URL, "quote", req)
 @app.api_route("/orders", methods=["GET"])
 async def orders_root(req: Request): return await forward_request(ORDER_SERVICE_URL, "orders", req)
 @app.api_route("/orders/{path:path}", methods=["GET", "PUT", "DELETE"])
@@ -131,4 +279,6 @@ async def payment_methods_path(path: str, req: Request):
 
 # ... (Phần dưới Cart Service giữ nguyên)
 @app.api_route("/cart", methods=["GET", "POST", "PUT", "DELETE"])
-async def cart_root(req: Request): return await forward_request(CART_SERVICE_URL, "cart", req)
\ No newline at end of file
+async def cart_root(req: Request): return await forward_request(CART_SERVICE_URL, "cart", req)
+@app.api_route("/cart/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def cart_path(path: str, req: Request): return await forward_request(CART_SERVICE_URL, f"cart/{path}", req)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from common.resilience import resilience
+
+
+# --- CẤU HÌNH POOL ---
+# Mỗi backend có 1 httpx.AsyncClient sống suốt vòng đời gateway (keep-alive),
+# giới hạn & timeout đọc từ biến môi trường theo tên service, ví dụ:
+#   RESTAURANT_SERVICE_MAX_CONNECTIONS=200
+#   RESTAURANT_SERVICE_TIMEOUT=10
+# Nếu không set thì dùng giá trị chung GATEWAY_POOL_* bên dưới.
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("GATEWAY_POOL_MAX_CONNECTIONS", 100))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("GATEWAY_POOL_MAX_KEEPALIVE", 20))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_POOL_KEEPALIVE_EXPIRY", 30))
+DEFAULT_TIMEOUT = float(os.getenv("GATEWAY_POOL_TIMEOUT", 15))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_POOL_CONNECT_TIMEOUT", 3))
+DEFAULT_POOL_TIMEOUT = float(os.getenv("GATEWAY_POOL_ACQUIRE_TIMEOUT", 5))
+
+
+def _env(prefix: str, key: str, default, cast):
+    value = os.getenv(f"{prefix}_{key}")
+    return cast(value) if value not in (None, "") else default
+
+
+class UpstreamPool:
+    """Connection pool + số liệu sử dụng cho một backend service."""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        prefix = name.upper()
+
+        self.limits = httpx.Limits(
+            max_connections=_env(prefix, "MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS, int),
+            max_keepalive_connections=_env(prefix, "MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE, int),
+            keepalive_expiry=_env(prefix, "KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY, float),
+        )
+        self.timeout = httpx.Timeout(
+            _env(prefix, "TIMEOUT", DEFAULT_TIMEOUT, float),
+            connect=_env(prefix, "CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT, float),
+            pool=_env(prefix, "POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT, float),
+        )
+        self.client: Optional[httpx.AsyncClient] = None
+        # Circuit breaker + retry budget + histogram độ trễ (common/resilience.py)
+        self.target = resilience.target(name)
+
+        # Metrics
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_latency = 0.0
+
+    def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    # --- ĐẾM REQUEST ĐANG CHẠY ---
+    def acquire(self) -> float:
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def release(self, started: float, error: bool = False):
+        self.in_flight -= 1
+        self.total_latency += time.perf_counter() - started
+        if error:
+            self.errors_total += 1
+
+    def _connection_stats(self) -> Dict[str, int]:
+        # httpx không public thông tin pool -> đọc từ httpcore (best effort)
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = 0
+        for conn in connections:
+            try:
+                if conn.is_idle():
+                    idle += 1
+            except Exception:
+                pass
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def stats(self) -> dict:
+        done = self.requests_total - self.in_flight
+        return {
+            "base_url": self.base_url,
+            "started": self.client is not None,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "timeout": {
+                "read": self.timeout.read,
+                "connect": self.timeout.connect,
+                "pool": self.timeout.pool,
+            },
+            "connections": self._connection_stats() if self.client else {"open": 0, "idle": 0, "active": 0},
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "avg_latency_ms": round(self.total_latency / done * 1000, 2) if done else 0,
+        }
+
+
+class PoolRegistry:
+    """Quản lý toàn bộ pool của gateway: tạo khi startup, đóng khi shutdown."""
+
+    def __init__(self):
+        self.pools: Dict[str, UpstreamPool] = {}
+        self._by_url: Dict[str, UpstreamPool] = {}
+
+    def register(self, name: str, base_url: str) -> UpstreamPool:
+        # 2 service trỏ cùng 1 URL (chạy local) -> dùng chung 1 pool
+        existing = self._by_url.get(base_url.rstrip("/"))
+        if existing is not None:
+            return existing
+        pool = UpstreamPool(name, base_url)
+        self.pools[name] = pool
+        self._by_url[pool.base_url] = pool
+        return pool
+
+    def for_url(self, service_url: str) -> UpstreamPool:
+        pool = self._by_url.get(service_url.rstrip("/"))
+        if pool is None:
+            raise KeyError(f"No upstream pool registered for {service_url}")
+        return pool
+
+    def start(self):
+        for pool in self.pools.values():
+            pool.start()
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
+
+    def stats(self) -> dict:
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request, Response
+
+from static import etag_matches
+
+# --- CẤU HÌNH ---
+# Cache response GET của các API catalogue công khai (giống nhau với mọi user).
+# TTL từng nhóm route đặt qua biến môi trường, ví dụ GATEWAY_CACHE_TTL_FOODS=60 (0 = tắt nhóm đó).
+GATEWAY_CACHE_ENABLED = os.getenv("GATEWAY_CACHE_ENABLED", "1") not in ("0", "false", "no")
+GATEWAY_CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+GATEWAY_CACHE_MAX_ITEM_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_ITEM_BYTES", 1024 * 1024))
+# Hết TTL: trong khoảng SWR vẫn trả bản cũ ngay + làm mới ngầm;
+# upstream lỗi (5xx / không kết nối được): trả bản cũ tối đa thêm SIE giây
+GATEWAY_CACHE_SWR = int(os.getenv("GATEWAY_CACHE_SWR", 30))
+GATEWAY_CACHE_SIE = int(os.getenv("GATEWAY_CACHE_SIE", 600))
+
+# Response phụ thuộc người gọi -> không bao giờ cache
+PRIVATE_VARY = {"*", "authorization", "cookie"}
+# Header không lưu lại: body trong cache đã giải nén, content-length gateway tự tính
+DROPPED_HEADERS = {"content-length", "content-encoding", "date", "set-cookie"}
+
+
+class CacheRule:
+    """1 nhóm route: mọi path bằng `prefix` hoặc bắt đầu bằng `prefix/` (trừ `exclude`)."""
+
+    def __init__(self, name: str, prefix: str, ttl: int, exclude: Iterable[str] = ()):
+        self.name = name
+        self.prefix = prefix
+        self.ttl = int(os.getenv(f"GATEWAY_CACHE_TTL_{name.upper()}", ttl))
+        self.swr = GATEWAY_CACHE_SWR
+        self.sie = GATEWAY_CACHE_SIE
+        self.exclude = set(exclude)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def matches(self, path: str) -> bool:
+        return (path == self.prefix or path.startswith(self.prefix + "/")) and path not in self.exclude
+
+    def stats(self) -> dict:
+        return {"ttl": self.ttl, "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
+
+
+# Ghi (POST/PUT/DELETE) qua gateway vào nhóm nào -> xóa cache cả nhóm đó
+CACHE_RULES = [
+    CacheRule("foods", "/foods", ttl=30),
+    CacheRule("branches", "/branches", ttl=300),
+    # verify phụ thuộc user (giới hạn lượt dùng) -> không cache
+    CacheRule("coupons", "/coupons", ttl=30, exclude=("/coupons/verify",)),
+    CacheRule("reviews", "/reviews", ttl=60),
+]
+
+
+class _Entry:
+    __slots__ = ("status", "headers", "body", "etag", "stored_at", "fresh_until", "stale_until", "error_until", "size")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, rule: CacheRule):
+        now = time.monotonic()
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = next((v.decode("latin-1") for k, v in headers if k == b"etag"), None)
+        self.stored_at = now
+        self.fresh_until = now + rule.ttl
+        self.stale_until = self.fresh_until + rule.swr
+        self.error_until = self.fresh_until + rule.sie
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+
+    def expire(self):
+        """Bị invalidate: không trả bản cũ nữa, chỉ giữ lại để dùng khi upstream lỗi."""
+        now = time.monotonic()
+        self.fresh_until = min(self.fresh_until, now)
+        self.stale_until = min(self.stale_until, now)
+
+
+def cacheable(upstream: httpx.Response) -> Optional[Tuple[str, ...]]:
+    """-> danh sách header Vary nếu response được phép cache, None nếu không."""
+    if upstream.status_code != 200 or "set-cookie" in upstream.headers:
+        return None
+    cache_control = upstream.headers.get("cache-control", "").lower()
+    # max-age=0 / must-revalidate là chỉ dẫn cho trình duyệt; gateway tự quản TTL theo CacheRule
+    if any(d.strip() in ("no-store", "private") for d in cache_control.split(",")):
+        return None
+    vary = {v.strip().lower() for v in upstream.headers.get("vary", "").split(",") if v.strip()}
+    if vary & PRIVATE_VARY:
+        return None
+    return tuple(sorted(vary - {"accept-encoding"}))
+
+
+class ResponseCache:
+    """Cache response GET ở gateway (LRU giới hạn theo byte), key = path + query + header Vary.
+
+    - còn hạn -> trả từ RAM (HIT), If-None-Match khớp -> 304
+    - hết hạn nhưng trong SWR -> trả bản cũ (STALE) + làm mới ngầm
+    - upstream lỗi -> trả bản cũ nếu còn trong SIE (STALE-IF-ERROR)
+    Nhiều request cùng hỏi 1 key chưa có -> chỉ 1 request lên upstream.
+    `fetch(request)` do main.py cung cấp: gọi upstream, trả httpx.Response đã đọc hết body.
+    Key chỉ gồm path + query (+ header upstream khai báo trong Vary): header Authorization
+    của user không nằm trong key, nên chỉ đưa vào CACHE_RULES các API trả giống nhau cho mọi người.
+    """
+
+    def __init__(self, rules: List[CacheRule] = CACHE_RULES, enabled: bool = GATEWAY_CACHE_ENABLED,
+                 max_bytes: int = GATEWAY_CACHE_MAX_BYTES, max_item_bytes: int = GATEWAY_CACHE_MAX_ITEM_BYTES):
+        self.rules = rules
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._vary: Dict[str, Tuple[str, ...]] = {}  # key gốc (path + query) -> header Vary
+        self._size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: set = set()
+        self._generation = 0  # tăng mỗi lần invalidate -> bỏ kết quả fetch bắt đầu trước đó
+        self.bypass = 0
+        self.uncacheable = 0
+        self.not_modified = 0
+        self.stale_if_error = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def match(self, path: str) -> Optional[CacheRule]:
+        if not self.enabled:
+            return None
+        for rule in self.rules:
+            if rule.matches(path):
+                return rule if rule.ttl > 0 else None
+        return None
+
+    # --- KEY ---
+    @staticmethod
+    def _base_key(request: Request) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"GET {request.url.path}?{query}"
+
+    def _key(self, request: Request) -> str:
+        base = self._base_key(request)
+        vary = self._vary.get(base, ())
+        return base + "|" + "|".join(request.headers.get(h, "") for h in vary)
+
+    # --- LRU ---
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, entry: _Entry):
+        self._drop(key)
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old.size
+
+    # --- UPSTREAM ---
+    async def _fetch(self, rule: CacheRule, request: Request,
+                     fetch: Callable[[Request], Awaitable[httpx.Response]]) -> Tuple[httpx.Response, Optional[_Entry]]:
+        generation = self._generation
+        upstream = await fetch(request)
+        vary = cacheable(upstream)
+        if vary is None or len(upstream.content) > self.max_item_bytes:
+            self.uncacheable += 1
+            return upstream, None
+        headers = [
+            (k.lower(), v) for k, v in upstream.headers.raw
+            if k.lower().decode("latin-1") not in DROPPED_HEADERS
+        ]
+        entry = _Entry(upstream.status_code, headers, upstream.content, rule)
+        if generation == self._generation:
+            base = self._base_key(request)
+            self._vary[base] = vary
+            self._put(self._key(request), entry)
+        return upstream, entry
+
+    def _fetch_once(self, key: str, rule: CacheRule, request: Request, fetch) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(rule, request, fetch))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.get(key) is f and self._inflight.pop(key))
+        return future
+
+    def _refresh(self, key: str, rule: CacheRule, request: Request, fetch):
+        """Làm mới ngầm (stale-while-revalidate), lỗi thì giữ bản cũ tới lần sau."""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self.refreshes += 1
+
+        def done(future: asyncio.Future):
+            self._refreshing.discard(key)
+            if future.cancelled() or future.exception() is not None:
+                self.refresh_errors += 1
+
+        self._fetch_once(key, rule, request, fetch).add_done_callback(done)
+
+    # --- TRẢ RESPONSE ---
+    def _respond(self, request: Request, entry: _Entry, state: str) -> Response:
+        age = str(int(time.monotonic() - entry.stored_at)).encode()
+        extra = [(b"x-cache", state.encode()), (b"age", age)]
+        if entry.etag and etag_matches(request, entry.etag):
+            self.not_modified += 1
+            response = Response(status_code=304)
+            response.raw_headers = [(k, v) for k, v in entry.headers if k in (b"etag", b"cache-control")] + extra
+            return response
+        response = Response(entry.body, status_code=entry.status)
+        response.raw_headers.extend(entry.headers + extra)
+        return response
+
+    @staticmethod
+    def _passthrough(upstream: httpx.Response, state: str) -> Response:
+        response = Response(upstream.content, status_code=upstream.status_code)
+        response.raw_headers.extend(
+            (k.lower(), v) for k, v in upstream.headers.raw
+            if k.lower().decode("latin-1") not in DROPPED_HEADERS
+        )
+        response.raw_headers.append((b"x-cache", state.encode()))
+        return response
+
+    async def serve(self, rule: CacheRule, request: Request,
+                    fetch: Callable[[Request], Awaitable[httpx.Response]]) -> Response:
+        key = self._key(request)
+        entry = self._get(key)
+        now = time.monotonic()
+
+        # Client bấm tải lại (Cache-Control: no-cache) -> bỏ qua bản trong cache, lấy mới và lưu lại
+        if "no-cache" in request.headers.get("cache-control", "").lower():
+            self.bypass += 1
+            entry = None
+        elif entry is not None and now < entry.fresh_until:
+            rule.hits += 1
+            return self._respond(request, entry, "HIT")
+        elif entry is not None and now < entry.stale_until:
+            rule.stale_hits += 1
+            self._refresh(key, rule, request, fetch)
+            return self._respond(request, entry, "STALE")
+
+        rule.misses += 1
+        try:
+            upstream, fresh = await asyncio.shield(self._fetch_once(key, rule, request, fetch))
+        except HTTPException as e:
+            if e.status_code >= 500 and entry is not None and now < entry.error_until:
+                self.stale_if_error += 1
+                return self._respond(request, entry, "STALE-IF-ERROR")
+            raise
+        if upstream.status_code >= 500 and entry is not None and now < entry.error_until:
+            self.stale_if_error += 1
+            return self._respond(request, entry, "STALE-IF-ERROR")
+        if fresh is None:
+            return self._passthrough(upstream, "MISS")
+        return self._respond(request, fresh, "MISS")
+
+    # --- INVALIDATE ---
+    def invalidate(self, prefixes: Iterable[str]) -> int:
+        """Hết hạn mọi entry có path bắt đầu bằng 1 trong `prefixes` ("/" = tất cả). Trả số entry."""
+        prefixes = [p.rstrip("/") for p in prefixes]
+        self._generation += 1
+        self.invalidations += 1
+        count = 0
+        for key, entry in self._entries.items():
+            path = key[4:].split("?", 1)[0]
+            if any(p == "" or path == p or path.startswith(p + "/") for p in prefixes):
+                entry.expire()
+                count += 1
+        # Fetch đang chạy trả dữ liệu cũ -> request sau invalidate phải tự gọi upstream
+        self._inflight.clear()
+        return count
+
+    def invalidate_for_write(self, path: str) -> int:
+        """POST/PUT/DELETE thành công qua gateway -> xóa cache của nhóm route tương ứng."""
+        rule = next((r for r in self.rules if path == r.prefix or path.startswith(r.prefix + "/")), None)
+        return self.invalidate([rule.prefix]) if rule is not None else 0
+
+    def stats(self) -> dict:
+        hits = sum(r.hits + r.stale_hits for r in self.rules)
+        lookups = hits + sum(r.misses for r in self.rules)
+        return {
+            "enabled": self.enabled,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "routes": {r.name: r.stats() for r in self.rules},
+            "bypass": self.bypass,
+            "uncacheable": self.uncacheable,
+            "not_modified": self.not_modified,
+            "stale_if_error": self.stale_if_error,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "cache_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,251 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from pool import UpstreamPool
+
+# --- CẤU HÌNH ---
+# Thư mục ảnh dùng chung với restaurant_service (volume, mount read-only).
+# Có file -> gateway tự trả (sendfile), không có -> hỏi restaurant_service qua cache bên dưới.
+STATIC_ROOT = os.getenv("STATIC_ROOT", "")
+STATIC_CACHE_MAX_BYTES = int(os.getenv("STATIC_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+STATIC_CACHE_MAX_ITEM_BYTES = int(os.getenv("STATIC_CACHE_MAX_ITEM_BYTES", 2 * 1024 * 1024))
+STATIC_DEFAULT_MAX_AGE = int(os.getenv("STATIC_DEFAULT_MAX_AGE", 60))  # upstream không gửi Cache-Control
+
+# Quy ước tên file giống restaurant_service/image_store.py + image_variants.py
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.[a-z]+)+$")
+VARIANT_SIZES = ("thumb", "card", "full")
+IMMUTABLE = "public, max-age=31536000, immutable"
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+# Header của ảnh được giữ trong cache và trả lại cho client
+KEPT_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+
+def cache_control_for(name: str) -> str:
+    return IMMUTABLE if CONTENT_ADDRESSED.match(name) else "public, max-age=86400"
+
+
+def max_age(cache_control: Optional[str]) -> Optional[float]:
+    """None = không được cache (no-store / private / no-cache)."""
+    if not cache_control:
+        return STATIC_DEFAULT_MAX_AGE
+    directives = [d.strip().lower() for d in cache_control.split(",")]
+    if any(d in ("no-store", "private", "no-cache") for d in directives):
+        return None
+    for d in directives:
+        if d.startswith("max-age="):
+            try:
+                return float(d[8:])
+            except ValueError:
+                return None
+    return STATIC_DEFAULT_MAX_AGE
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")  # so sánh yếu (RFC 7232 2.3.2)
+    return strip(etag) in {strip(tag) for tag in header.split(",")}
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """"bytes=a-b" -> (start, end) (end tính cả). Chỉ hỗ trợ 1 khoảng; sai cú pháp -> None (trả cả file)."""
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":  # "bytes=-500": 500 byte cuối
+        return max(0, length - int(last)), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    return start, end
+
+
+def body_response(request: Request, body: bytes, headers: Dict[str, str]) -> Response:
+    """Trả ảnh đang có sẵn trong RAM: 304 / 206 (Range) / 200."""
+    headers = {**headers, "accept-ranges": "bytes"}
+    if etag_matches(request, headers.get("etag")):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "content-type"})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == headers.get("etag")):
+        byte_range = parse_range(range_header, len(body))
+        if byte_range is not None:
+            start, end = byte_range
+            if start >= len(body) or start > end:
+                return Response(status_code=416, headers={"content-range": f"bytes */{len(body)}"})
+            headers["content-range"] = f"bytes {start}-{end}/{len(body)}"
+            return Response(body[start:end + 1], status_code=206, headers=headers)
+    return Response(body, headers=headers)
+
+
+class _Entry:
+    __slots__ = ("body", "headers", "expires")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], ttl: float):
+        self.body = body
+        self.headers = headers
+        self.expires = time.monotonic() + ttl
+
+
+class StaticServer:
+    """Phục vụ /static/* ở gateway.
+
+    1. STATIC_ROOT có file -> FileResponse (sendfile, Range, ETag = tên file)
+    2. Cache LRU trong RAM (giới hạn theo byte) cho ảnh lấy từ restaurant_service;
+       ảnh immutable (tên = hash nội dung) không bao giờ phải hỏi lại upstream,
+       ảnh khác hết max-age thì hỏi lại bằng If-None-Match (upstream trả 304 -> dùng tiếp)
+    3. Ảnh quá lớn để cache -> stream thẳng qua `forward` (như các route khác)
+    Nhiều request cùng lúc hỏi 1 ảnh chưa có trong cache -> chỉ 1 request lên upstream.
+    """
+
+    def __init__(self, pool: UpstreamPool, forward: Callable[[Request], Awaitable[Response]],
+                 root: str = STATIC_ROOT, max_bytes: int = STATIC_CACHE_MAX_BYTES,
+                 max_item_bytes: int = STATIC_CACHE_MAX_ITEM_BYTES):
+        self.pool = pool
+        self.forward = forward  # forward_request tới restaurant_service cho phần không cache được
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.passthrough = 0
+        self.not_modified = 0
+        self.bytes_from_cache = 0
+
+    # --- 1. FILE TRÊN VOLUME DÙNG CHUNG ---
+    def _local_file(self, name: str, size: Optional[str]) -> Optional[str]:
+        if not self.root:
+            return None
+        if size is not None:
+            if size not in VARIANT_SIZES or name.count(".") != 1:
+                return None  # để restaurant_service báo lỗi / tự sinh variant
+            name = f"{name.rsplit('.', 1)[0]}.{size}.webp"
+        path = os.path.join(self.root, name)
+        return path if os.path.isfile(path) else None
+
+    # --- 2. CACHE LRU ---
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, entry: _Entry):
+        self._drop(key)
+        self._entries[key] = entry
+        self._size += len(entry.body)
+        while self._size > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old.body)
+
+    async def _fetch(self, key: str, path: str, params: dict, stale: Optional[_Entry]) -> Optional[_Entry]:
+        """Lấy ảnh từ upstream vào cache. None = không cache được (quá lớn, lỗi, no-store...)."""
+        headers = {"if-none-match": stale.headers["etag"]} if stale and "etag" in stale.headers else {}
+        started = self.pool.acquire()
+        error = False
+        try:
+            upstream = await self.pool.target.call(lambda: self.pool.client.send(
+                self.pool.client.build_request("GET", path, params=params, headers=headers), stream=True,
+            ))
+            try:
+                ttl = max_age(upstream.headers.get("cache-control"))
+                if upstream.status_code == 304 and stale is not None:
+                    self.revalidated += 1
+                    stale.expires = time.monotonic() + (ttl or 0)
+                    return stale
+                length = upstream.headers.get("content-length")
+                if upstream.status_code != 200 or ttl is None or length is None or int(length) > self.max_item_bytes:
+                    return None
+                body = await upstream.aread()
+                kept = {k: upstream.headers[k] for k in KEPT_HEADERS if k in upstream.headers}
+                entry = _Entry(body, kept, ttl)
+                self._put(key, entry)
+                return entry
+            finally:
+                await upstream.aclose()
+        except httpx.HTTPError:
+            error = True
+            return None
+        finally:
+            self.pool.release(started, error=error)
+
+    async def _cached(self, key: str, path: str, params: dict) -> Optional[_Entry]:
+        entry = self._get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self.hits += 1
+            return entry
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._fetch(key, path, params, entry))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    # --- ENDPOINT ---
+    async def serve(self, name: str, request: Request) -> Response:
+        name = os.path.basename(name)
+        if not name:
+            raise HTTPException(404, "Not found")
+        size = request.query_params.get("size")
+
+        local = self._local_file(name, size)
+        if local is not None:
+            self.local_hits += 1
+            served = os.path.basename(local)
+            etag = f'"{served}"'  # giống etag restaurant_service -> 304 vẫn khớp khi đổi đường phục vụ
+            headers = {"cache-control": cache_control_for(served), "etag": etag}
+            if etag_matches(request, etag):
+                self.not_modified += 1
+                return Response(status_code=304, headers=headers)
+            media_type = CONTENT_TYPES.get(served.rsplit(".", 1)[-1], "application/octet-stream")
+            return FileResponse(local, media_type=media_type, headers=headers)
+
+        params = {"size": size} if size is not None else {}
+        entry = await self._cached(f"{name}?{size or ''}", f"/static/{name}", params)
+        if entry is None:
+            self.passthrough += 1
+            return await self.forward(request)
+        response = body_response(request, entry.body, entry.headers)
+        if response.status_code == 304:
+            self.not_modified += 1
+        else:
+            self.bytes_from_cache += len(response.body)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root or None,
+            "local_hits": self.local_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "passthrough": self.passthrough,
+            "not_modified": self.not_modified,
+            "bytes_from_cache": self.bytes_from_cache,
+            "entries": len(self._entries),
+            "cache_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
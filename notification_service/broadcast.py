@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+# --- CẤU HÌNH ---
+NOTIFY_BROADCAST_BACKEND = os.getenv("NOTIFY_BROADCAST_BACKEND", "memory")  # memory | redis | fake-redis
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "notify:branch")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+Handler = Callable[[int, str], Awaitable[None]]
+
+
+class BroadcastBackend:
+    """Phát 1 thông báo tới MỌI replica của notification_service.
+
+    Mỗi replica gọi start(handler) lúc khởi động; publish() ở bất kỳ replica nào
+    sẽ gọi handler(branch_id, message) trên tất cả replica (kể cả chính nó).
+    """
+
+    async def start(self, handler: Handler):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+    async def publish(self, branch_id: int, message: str):
+        raise NotImplementedError
+
+
+class MemoryBroadcast(BroadcastBackend):
+    """Chỉ trong 1 process (test / chạy 1 replica)."""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def publish(self, branch_id: int, message: str):
+        if self._handler is not None:
+            await self._handler(branch_id, message)
+
+
+class RedisBroadcast(BroadcastBackend):
+    """Redis pub/sub. `client` là redis.asyncio.Redis(decode_responses=True) hoặc FakeAsyncRedis."""
+
+    def __init__(self, client, channel: str = NOTIFY_CHANNEL):
+        self.client = client
+        self.channel = channel
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen(handler))
+
+    async def _listen(self, handler: Handler):
+        while True:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg is None or msg.get("type") != "message":
+                    continue
+                data = json.loads(msg["data"])
+                await handler(int(data["branch_id"]), data["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Lỗi nhận broadcast: {e}")
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            self._pubsub = None
+
+    async def publish(self, branch_id: int, message: str):
+        await self.client.publish(self.channel, json.dumps({"branch_id": branch_id, "message": message}))
+
+
+def create_broadcast(kind: str = NOTIFY_BROADCAST_BACKEND) -> BroadcastBackend:
+    if kind == "redis":
+        import redis.asyncio as aioredis  # chỉ cần cài khi dùng backend redis
+        return RedisBroadcast(aioredis.Redis.from_url(REDIS_URL, decode_responses=True))
+    if kind == "fake-redis":
+        from common.fakeredis import FakeAsyncRedis
+        return RedisBroadcast(FakeAsyncRedis())
+    return MemoryBroadcast()
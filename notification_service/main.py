@@ -1,47 +1,179 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from typing import Dict, Set
+import asyncio
+import os
+import time
 import uvicorn
 from pydantic import BaseModel
+from broadcast import create_broadcast
+from common.lifespan import service_lifespan
+from common.broker import create_broker
+from common.events import EventConsumer, SeenEvents, ORDER_CREATED
 
-app = FastAPI()
+# --- CẤU HÌNH ---
+SEND_QUEUE_SIZE = int(os.getenv("NOTIFY_SEND_QUEUE_SIZE", 100))      # số tin tối đa chờ gửi / socket
+SEND_TIMEOUT = float(os.getenv("NOTIFY_SEND_TIMEOUT", 5))            # gửi 1 tin quá lâu -> coi như client chết
+SLOW_CONSUMER_POLICY = os.getenv("NOTIFY_SLOW_CONSUMER", "disconnect")  # disconnect | drop
+# Heartbeat mặc định ở tầng giao thức: uvicorn gửi ping frame mỗi WS_PING_INTERVAL, không nhận pong
+# trong WS_PING_TIMEOUT -> tự đóng socket chết nửa vời (mạng rớt, không có FIN).
+# Trình duyệt tự trả pong, client chỉ việc nghe như cũ. Cần uvicorn --ws websockets (wsproto không ping)
+WS_PING_INTERVAL = float(os.getenv("NOTIFY_WS_PING_INTERVAL", 20))
+WS_PING_TIMEOUT = float(os.getenv("NOTIFY_WS_PING_TIMEOUT", 20))
+# Tùy chọn (mặc định tắt): heartbeat trong app cho client tự viết không xử lý được ping frame.
+# Bật lên thì server gửi text "PING" mỗi HEARTBEAT_INTERVAL và đóng socket không GỬI LÊN gì
+# (vd "PONG") trong IDLE_TIMEOUT -> chỉ bật khi mọi client đều trả lời PING
+APP_HEARTBEAT = os.getenv("NOTIFY_APP_HEARTBEAT", "0") == "1"
+HEARTBEAT_INTERVAL = float(os.getenv("NOTIFY_HEARTBEAT_INTERVAL", 25))
+IDLE_TIMEOUT = float(os.getenv("NOTIFY_IDLE_TIMEOUT", 90))
+HEARTBEAT_MESSAGE = "PING"
+
+# MỘT KẾT NỐI: hàng đợi riêng + task gửi riêng, socket chậm không làm chậm socket khác
+class Connection:
+    def __init__(self, websocket: WebSocket, branch_id: int):
+        self.websocket = websocket
+        self.branch_id = branch_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.last_activity = time.monotonic()
+        self.dropped = 0
+        self.sender: asyncio.Task = None
+
+    def enqueue(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            if SLOW_CONSUMER_POLICY == "drop":
+                # Bỏ tin cũ nhất để nhường chỗ cho tin mới
+                self.queue.get_nowait()
+                self.queue.put_nowait(message)
+                self.dropped += 1
+                return True
+            return False
 
 # QUẢN LÝ KẾT NỐI
 class ConnectionManager:
     def __init__(self):
         # Lưu danh sách socket theo branch_id
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+        self.active_connections: Dict[int, Set[Connection]] = {}
+        self.sent_total = 0
+        self.slow_disconnects = 0
+        self._heartbeat_task: asyncio.Task = None
 
-    async def connect(self, websocket: WebSocket, branch_id: int):
+    async def connect(self, websocket: WebSocket, branch_id: int) -> Connection:
         await websocket.accept()
-        if branch_id not in self.active_connections:
-            self.active_connections[branch_id] = []
-        self.active_connections[branch_id].append(websocket)
+        conn = Connection(websocket, branch_id)
+        conn.sender = asyncio.create_task(self._sender(conn))
+        self.active_connections.setdefault(branch_id, set()).add(conn)
         print(f"Branch {branch_id} connected")
+        return conn
+
+    def disconnect(self, conn: Connection):
+        conns = self.active_connections.get(conn.branch_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                del self.active_connections[conn.branch_id]
+        if conn.sender is not None and conn.sender is not asyncio.current_task():
+            conn.sender.cancel()
+
+    async def close(self, conn: Connection, code: int = 1001):
+        self.disconnect(conn)
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=code), SEND_TIMEOUT)
+        except Exception:
+            pass
 
-    def disconnect(self, websocket: WebSocket, branch_id: int):
-        if branch_id in self.active_connections:
-            if websocket in self.active_connections[branch_id]:
-                self.active_connections[branch_id].remove(websocket)
+    async def _sender(self, conn: Connection):
+        try:
+            while True:
+                message = await conn.queue.get()
+                await asyncio.wait_for(conn.websocket.send_text(message), SEND_TIMEOUT)
+                self.sent_total += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Gửi lỗi / quá SEND_TIMEOUT -> đóng kết nối này, các kết nối khác không bị ảnh hưởng
+            await self.close(conn)
 
     async def send_message(self, message: str, branch_id: int):
-        if branch_id in self.active_connections:
-            for connection in self.active_connections[branch_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    continue
+        # Chỉ đẩy vào hàng đợi của từng socket (không await gửi) -> không socket nào chặn socket nào
+        for conn in list(self.active_connections.get(branch_id, ())):
+            if not conn.enqueue(message):
+                self.slow_disconnects += 1
+                asyncio.create_task(self.close(conn, code=1013))
+
+    async def heartbeat(self):
+        # (NOTIFY_APP_HEARTBEAT=1) Định kỳ gửi PING và dọn các kết nối không còn hoạt động
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for conns in list(self.active_connections.values()):
+                for conn in list(conns):
+                    if now - conn.last_activity > IDLE_TIMEOUT:
+                        await self.close(conn)
+                    else:
+                        conn.enqueue(HEARTBEAT_MESSAGE)
+
+    def start(self):
+        if APP_HEARTBEAT:
+            self._heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "branches": len(self.active_connections),
+            "connections": sum(len(c) for c in self.active_connections.values()),
+            "queued": sum(c.queue.qsize() for conns in self.active_connections.values() for c in conns),
+            "dropped": sum(c.dropped for conns in self.active_connections.values() for c in conns),
+            "sent_total": self.sent_total,
+            "slow_disconnects": self.slow_disconnects,
+        }
 
 manager = ConnectionManager()
+# Pub/sub giữa các replica: /notify ở replica nào cũng tới được socket ở mọi replica
+broadcast = create_broadcast()
+
+# --- EVENT TỪ ORDER SERVICE (thay cho việc order_service gọi /notify) ---
+# Cả group chỉ 1 replica nhận mỗi event, rồi broadcast tới socket ở mọi replica
+broker = create_broker()
+seen_events = SeenEvents()
+
+async def on_order_created(event: dict):
+    if not seen_events.add(event["id"]):
+        return  # broker giao trùng -> không báo 2 lần
+    try:
+        await broadcast.publish(int(event["payload"]["branch_id"]), "NEW_ORDER")
+    except BaseException:
+        # Publish lỗi -> không ack, broker giao lại; phải quên id thì lần sau mới không bị bỏ qua
+        seen_events.discard(event["id"])
+        raise
+
+consumer = EventConsumer(broker, "notification_service", {ORDER_CREATED: on_order_created})
+
+app = FastAPI(lifespan=service_lifespan(
+    on_startup=[
+        lambda: broadcast.start(lambda branch_id, message: manager.send_message(message, branch_id)),
+        manager.start,
+        consumer.start,
+    ],
+    on_shutdown=[broker.close, broadcast.stop, manager.stop, consumer.stop],
+))
 
 # 1. API WebSocket cho Frontend kết nối
 @app.websocket("/ws/{branch_id}")
 async def websocket_endpoint(websocket: WebSocket, branch_id: int):
-    await manager.connect(websocket, branch_id)
+    conn = await manager.connect(websocket, branch_id)
     try:
         while True:
             await websocket.receive_text() # Giữ kết nối
+            conn.last_activity = time.monotonic()
     except WebSocketDisconnect:
-        manager.disconnect(websocket, branch_id)
+        manager.disconnect(conn)
+    except Exception:
+        manager.disconnect(conn)
 
 # 2. API cho Order Service gọi sang
 class NotifyPayload(BaseModel):
@@ -50,8 +182,15 @@ class NotifyPayload(BaseModel):
 
 @app.post("/notify")
 async def notify_branch(payload: NotifyPayload):
-    await manager.send_message(payload.message, payload.branch_id)
+    await broadcast.publish(payload.branch_id, payload.message)
     return {"status": "sent"}
 
+@app.get("/metrics/connections")
+def connection_metrics(): return manager.stats()
+
+@app.get("/metrics/events")
+async def event_metrics(): return await consumer.stats()
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8006)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8006, ws="websockets",
+                ws_ping_interval=WS_PING_INTERVAL, ws_ping_timeout=WS_PING_TIMEOUT)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+# --- CURSOR CỦA CHANGE FEED ---
+# Cursor = "<updated_at ISO>_<order id>" của đơn thay đổi gần nhất mà client đã thấy.
+# So sánh theo cặp (updated_at, id) nên không bỏ sót 2 đơn đổi trạng thái cùng 1 thời điểm.
+# updated_at gán lúc ghi nhưng transaction commit sau -> đơn có updated_at NHỎ hơn cursor có thể
+# hiện ra muộn. Vì vậy mỗi lần đọc lùi lại CHANGES_OVERLAP_SECONDS sau cursor, cursor mang theo
+# "~<id>.<µs trước mốc>,..." = các đơn đã gửi trong cửa sổ đó để không gửi lại lần 2.
+CHANGES_OVERLAP_SECONDS = float(os.getenv("ORDER_CHANGES_OVERLAP_SECONDS", 5))
+
+
+class Cursor(NamedTuple):
+    updated_at: datetime
+    order_id: int
+    seen: FrozenSet[Tuple[int, datetime]] = frozenset()  # (id, updated_at) đã gửi trong cửa sổ chồng lấn
+
+    @property
+    def floor(self) -> datetime:
+        return self.updated_at - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+
+
+def encode_cursor(updated_at: Optional[datetime], order_id: int, seen: Iterable[Tuple[int, datetime]] = ()) -> str:
+    if updated_at is None:
+        return "0"
+    cursor = f"{updated_at.isoformat()}_{order_id}"
+    marks = sorted(f"{i}.{(updated_at - ts) // timedelta(microseconds=1)}" for i, ts in seen)
+    return f"{cursor}~{','.join(marks)}" if marks else cursor
+
+
+def decode_cursor(cursor: str) -> Optional[Cursor]:
+    if cursor in ("", "0"):
+        return None
+    try:
+        head, _, marks = cursor.partition("~")
+        ts, order_id = head.rsplit("_", 1)
+        updated_at = datetime.fromisoformat(ts)
+        seen = set()
+        for mark in filter(None, marks.split(",")):
+            i, delta = mark.split(".", 1)
+            seen.add((int(i), updated_at - timedelta(microseconds=int(delta))))
+        return Cursor(updated_at, int(order_id), frozenset(seen))
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def advance(after: Optional[Cursor], marks: Iterable[Tuple[datetime, int]]) -> Optional[Cursor]:
+    """Cursor mới sau khi gửi các đơn `marks` = [(updated_at, id)]: mốc = lớn nhất đã thấy,
+    seen = các đơn đã gửi còn nằm trong cửa sổ chồng lấn của mốc mới."""
+    marks = list(marks)
+    points = marks + ([(after.updated_at, after.order_id)] if after is not None else [])
+    if not points:
+        return after
+    updated_at, order_id = max(points)
+    cursor = Cursor(updated_at, order_id)
+    latest: Dict[int, datetime] = {}
+    for i, ts in list(after.seen if after is not None else ()) + [(i, ts) for ts, i in marks]:
+        latest[i] = max(ts, latest.get(i, ts))  # bản cũ hơn của cùng 1 đơn không bao giờ đọc lại
+    return cursor._replace(seen=frozenset((i, ts) for i, ts in latest.items() if ts >= cursor.floor))
+
+
+# --- ĐÁNH THỨC CÁC REQUEST LONG-POLL / SSE ---
+class ChangeNotifier:
+    """Mỗi user có 1 số thứ tự thay đổi + 1 asyncio.Event.
+
+    notify() có thể gọi từ thread khác (các endpoint sync chạy trong threadpool),
+    nên mọi thao tác trên Event đều được đẩy về event loop.
+    Chỉ đánh thức request trong cùng process; giữa các replica thì phía đọc
+    vẫn kiểm tra lại DB định kỳ.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq: Dict[int, int] = {}
+        self._events: Dict[int, asyncio.Event] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def seq(self, user_id: int) -> int:
+        return self._seq.get(user_id, 0)
+
+    def notify(self, user_id: Optional[int]):
+        if user_id is None or self.loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._wake(user_id)
+        else:
+            self.loop.call_soon_threadsafe(self._wake, user_id)
+
+    def _wake(self, user_id: int):
+        self._seq[user_id] = self._seq.get(user_id, 0) + 1
+        event = self._events.pop(user_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, user_id: int, seen: int, timeout: float) -> bool:
+        """Chờ tới khi seq(user_id) khác `seen` hoặc hết timeout. Trả về True nếu có thay đổi."""
+        if self.seq(user_id) != seen:
+            return True
+        event = self._events.get(user_id)
+        if event is None:
+            event = self._events[user_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.seq(user_id) != seen
+
+
+notifier = ChangeNotifier()
@@ -1,17 +1,91 @@
 import os
+import asyncio
+import json
 import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware # <--- THÊM CORS
-from sqlalchemy.orm import Session, joinedload
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, exc
+from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
-from database import SessionLocal, engine, Base
+from database import database, SessionLocal, AsyncSessionLocal, get_db, get_async_db, engine, Base
+from common.resilience import resilience
+from common.lifespan import service_lifespan
+from common.broker import create_broker
+from common.events import EventConsumer, replica_group, ORDER_CREATED, PAYMENT_SUCCEEDED, ORDER_STATUS_CHANGED, FOOD_CHANGED, COUPON_CHANGED
+from common.outbox import OutboxRelay, add_event
+from common.idempotency import create_idempotency_store, fingerprint
+from common.settings import require_secret
+from changes import notifier, advance, encode_cursor, decode_cursor
+from price_cache import ORDER_PRICE_MAX_STALE_ON_ERROR, ORDER_PRICE_MAX_STALENESS, PriceCache
+import quotes
 import models
 
-# Tạo bảng
+# Tạo bảng (+ index còn thiếu trên bảng orders đã có)
 Base.metadata.create_all(bind=engine)
+models.upgrade_schema(engine)
 
-app = FastAPI()
+# --- EVENT: outbox -> broker (OrderCreated, OrderStatusChanged); nhận PaymentSucceeded ---
+CONSUMER_GROUP = "order_service"
+broker = create_broker()
+relay = OutboxRelay(AsyncSessionLocal, models.OutboxEvent, broker, source="order_service")
+
+async def on_payment_succeeded(event: dict):
+    # Idempotent: ghi processed_events CÙNG transaction với đổi trạng thái
+    user_id = None
+    async with AsyncSessionLocal() as db:
+        if await db.get(models.ProcessedEvent, (CONSUMER_GROUP, event["id"])):
+            return
+        order = await db.get(models.Order, event["payload"]["order_id"])
+        if order and order.status in ("PENDING", "PENDING_PAYMENT"):
+            order.status = "PAID"
+            user_id = order.user_id
+            add_order_status_event(db, order)
+        db.add(models.ProcessedEvent(consumer=CONSUMER_GROUP, event_id=event["id"]))
+        try:
+            await db.commit()
+        except exc.IntegrityError:
+            return  # replica khác vừa xử lý xong event này
+    if user_id is not None:
+        notifier.notify(user_id)
+        relay.wake()
+
+consumer = EventConsumer(broker, CONSUMER_GROUP, {PAYMENT_SUCCEEDED: on_payment_succeeded})
+
+# Cấu hình URL (Mặc định Localhost để chạy máy cá nhân)
+RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://localhost:8002")
+RESTAURANT_TIMEOUT = float(os.getenv("ORDER_RESTAURANT_TIMEOUT", 3))
+# Timeout riêng + breaker: restaurant_service chậm/chết thì checkout lỗi nhanh, không giữ worker
+restaurant = resilience.client("restaurant_service", RESTAURANT_SERVICE_URL, timeout=RESTAURANT_TIMEOUT)
+
+# Cache giá món / coupon cho checkout (price_cache.py). Cache nằm trong RAM từng replica
+# -> mỗi replica 1 consumer group riêng (theo REPLICA_ID) để replica nào cũng nhận đủ FoodChanged / CouponChanged.
+# Group mới bắt đầu từ "$" (snapshot đã có dữ liệu cũ), group của replica đã bỏ được dọn dần
+price_cache = PriceCache(restaurant)
+price_consumer = EventConsumer(broker, replica_group("order_price_cache"), {
+    FOOD_CHANGED: price_cache.on_food_changed,
+    COUPON_CHANGED: price_cache.on_coupon_changed,
+}, start_id="$", stale_prefix="order_price_cache-")
+# Token cho API nội bộ của restaurant_service (/coupons/redeem): bắt buộc, khác SECRET_KEY
+INTERNAL_TOKEN = require_secret("INTERNAL_TOKEN")
+
+# Báo giá đã ký (quotes.py): số token đã phát / checkout dùng được token / phải tính lại giá
+quote_stats = {"issued": 0, "used": 0, "repriced": 0}
+
+# Idempotency-Key cho /checkout (client retry không tạo đơn trùng)
+idempotency = create_idempotency_store()
+
+app = FastAPI(lifespan=service_lifespan(
+    database,
+    # price_consumer trước price_cache: group tạo xong rồi mới tải snapshot -> không lỡ event nào ở giữa
+    on_startup=[lambda: notifier.bind(asyncio.get_running_loop()), relay.start, consumer.start, price_consumer.start, price_cache.start],
+    on_shutdown=[broker.close, relay.stop, consumer.stop, price_cache.stop, price_consumer.stop],
+))
 
 # --- CẤU HÌNH CORS (BẮT BUỘC ĐỂ FRONTEND GỌI ĐƯỢC) ---
 app.add_middleware(
@@ -22,16 +96,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Cấu hình URL (Mặc định Localhost để chạy máy cá nhân)
-RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://localhost:8002")
-NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://localhost:8006")
+# --- GIÁ MÓN / COUPON (xem price_cache.py) ---
+async def fetch_prices(food_ids: List[int], branch_id: int, coupon_code: Optional[str]):
+    """Hỏi thẳng restaurant_service (1 request batch + verify coupon song song). Lỗi mạng -> raise."""
+    tasks = [restaurant.get("/foods/batch", params={"ids": ",".join(str(i) for i in food_ids)})]
+    if coupon_code:
+        tasks.append(restaurant.get("/coupons/verify", params={"code": coupon_code, "branch_id": branch_id}))
+    responses = await asyncio.gather(*tasks)
+    for res in responses:
+        if res.status_code >= 500:
+            raise httpx.HTTPStatusError(f"restaurant_service {res.status_code}", request=res.request, response=res)
+    foods_resp = responses[0]
+    foods_resp.raise_for_status()
+    foods_by_id = {f['id']: f for f in foods_resp.json()}
+    coupon = None
+    if coupon_code:
+        coupon = responses[1].json() if responses[1].status_code == 200 else None
+    return foods_by_id, coupon
 
-def get_db():
-    db = SessionLocal()
+async def load_prices(food_ids: List[int], branch_id: int, coupon_code: Optional[str]):
+    """-> (food_id -> món, coupon hợp lệ | None). Món không tồn tại / coupon sai -> 400,
+    restaurant_service lỗi mà cache quá cũ -> 503 (không bao giờ bỏ qua món để lưu đơn thiếu)."""
+    found, deleted, unknown = price_cache.lookup(food_ids)
+    cached_coupon = price_cache.coupon(branch_id, coupon_code) if coupon_code else None
+
+    if price_cache.usable(ORDER_PRICE_MAX_STALENESS) and not unknown:
+        foods_by_id, coupon, missing = found, cached_coupon, deleted
+    else:
+        try:
+            foods_by_id, coupon = await fetch_prices(food_ids, branch_id, coupon_code)
+            missing = [i for i in food_ids if i not in foods_by_id]
+        except httpx.HTTPError as e:
+            if not price_cache.usable(ORDER_PRICE_MAX_STALE_ON_ERROR) or unknown:
+                print(f"Lỗi kết nối Restaurant Service: {e}")
+                raise HTTPException(503, "Restaurant Service Unavailable")
+            print(f"Restaurant Service lỗi ({e}), tính giá từ cache cũ {price_cache.age():.0f}s")
+            foods_by_id, coupon, missing = found, cached_coupon, deleted
+
+    if missing:
+        raise HTTPException(400, f"Món không tồn tại: {missing}")
+    if coupon_code and coupon is None:
+        raise HTTPException(400, "Mã giảm giá không hợp lệ hoặc đã hết hạn")
+    return foods_by_id, coupon
+
+# --- LƯỢT DÙNG MÃ GIẢM GIÁ: restaurant_service đếm nguyên tử (tổng / mỗi user) ---
+async def redeem_coupon(order, coupon_code: str):
+    """Hết lượt -> 400. restaurant_service lỗi: mã không giới hạn lượt thì vẫn cho đặt, có giới hạn -> 503."""
+    cached = price_cache.coupon(order.branch_id, coupon_code)
+    limited = cached is None or cached.get("usage_limit") is not None or cached.get("per_user_limit") is not None
     try:
-        yield db
-    finally:
-        db.close()
+        res = await restaurant.post("/coupons/redeem", json={
+            "code": coupon_code, "branch_id": order.branch_id, "order_id": order.id, "user_id": order.user_id,
+        }, headers={"X-Internal-Token": INTERNAL_TOKEN}, idempotent=True)  # cùng order_id -> không tính 2 lần
+        if res.status_code == 409:
+            raise HTTPException(400, res.json().get("detail", "Mã giảm giá đã hết lượt sử dụng"))
+        res.raise_for_status()
+    except httpx.HTTPError as e:
+        if limited:
+            print(f"Lỗi ghi lượt dùng mã {coupon_code}: {e}")
+            raise HTTPException(503, "Restaurant Service Unavailable")
+        print(f"Không ghi được lượt dùng mã {coupon_code} (mã không giới hạn lượt, vẫn tạo đơn): {e}")
+
+async def release_coupon(order_id: int):
+    try:
+        await restaurant.request("DELETE", f"/coupons/redemptions/{order_id}",
+                                 headers={"X-Internal-Token": INTERNAL_TOKEN})
+    except httpx.HTTPError as e:
+        print(f"Không trả lại được lượt dùng mã của đơn {order_id}: {e}")
+
+async def cancel_unredeemed_order(order_id: int):
+    """Bù trừ cho checkout: đơn đã commit nhưng không ghi được lượt dùng mã -> CANCELLED
+    (kèm OrderStatusChanged cho quán), trả lại lượt nếu thực ra restaurant_service đã ghi (timeout)."""
+    async with AsyncSessionLocal() as db:
+        order = await db.get(models.Order, order_id)
+        if order is not None and order.status == "PENDING":
+            order.status = "CANCELLED"
+            add_order_status_event(db, order)
+            await db.commit()
+            notifier.notify(order.user_id)
+            relay.wake()
+    await release_coupon(order_id)
+
+def add_order_status_event(db, order):
+    add_event(db, models.OutboxEvent, ORDER_STATUS_CHANGED, {
+        "order_id": order.id,
+        "user_id": order.user_id,
+        "branch_id": order.branch_id,
+        "status": order.status,
+    }, aggregate_id=order.id)
 
 # --- INPUT MODELS ---
 class OrderItemCreate(BaseModel):
@@ -47,58 +199,95 @@ class OrderCreate(BaseModel):
     customer_phone: str
     delivery_address: str
     note: Optional[str] = None
+    quote_token: Optional[str] = None  # lấy từ POST /quote
+
+class QuoteCreate(BaseModel):
+    branch_id: int
+    items: List[OrderItemCreate]
+    coupon_code: Optional[str] = None
+    user_id: Optional[int] = None
 
 # --- API ---
 
 @app.post("/checkout")
-async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(
+    payload: OrderCreate,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # Gửi lại cùng Idempotency-Key -> trả lại đúng đơn đã tạo, không gọi restaurant_service / tạo đơn mới
+    return await idempotency.run(
+        f"checkout:{payload.user_id}", idempotency_key, fingerprint(payload),
+        lambda: place_order(payload, db),
+    )
+
+async def price_cart(branch_id: int, items: List[OrderItemCreate], coupon_code: Optional[str]):
+    """Tính tiền giỏ hàng -> (các dòng món, tổng trước giảm, tiền giảm coupon, thành tiền)."""
     total_price = 0
     order_items_data = []
 
-    async with httpx.AsyncClient() as client:
-        # 1. Tính tiền & Lấy thông tin món
-        for item in payload.items:
-            try:
-                # Gọi sang Restaurant Service để lấy giá và ảnh
-                resp = await client.get(f"{RESTAURANT_SERVICE_URL}/foods/{item.food_id}")
-                if resp.status_code != 200:
-                    print(f"Lỗi lấy món ID {item.food_id}")
-                    continue 
-                
-                food_data = resp.json()
-                # Tính giá sau giảm (nếu món đó có giảm giá riêng)
-                discount = food_data.get('discount', 0) or 0
-                final_item_price = food_data['price'] * (1 - discount/100)
-                total_price += final_item_price * item.quantity
-
-                order_items_data.append({
-                    "food_id": item.food_id,
-                    "food_name": food_data['name'],
-                    "price": final_item_price,
-                    "quantity": item.quantity,
-                    "image_url": food_data.get('image_url', '') # Lưu ảnh để hiện ở lịch sử/dashboard
-                })
-            except Exception as e:
-                print(f"Lỗi kết nối Restaurant Service: {e}")
-                # Nếu lỗi kết nối, tạm thời bỏ qua món đó hoặc raise lỗi tùy bạn
-                # raise HTTPException(status_code=503, detail="Lỗi kết nối Restaurant Service")
-
-        # 2. Xử lý Coupon (Mã giảm giá đơn hàng)
-        discount_amount = 0
-        if payload.coupon_code:
-            try:
-                coupon_resp = await client.get(
-                    f"{RESTAURANT_SERVICE_URL}/coupons/verify", 
-                    params={"code": payload.coupon_code, "branch_id": payload.branch_id}
-                )
-                if coupon_resp.status_code == 200:
-                    data = coupon_resp.json()
-                    discount_amount = (total_price * data['discount_percent']) / 100
-            except: pass
-
-        final_price = max(0, total_price - discount_amount)
-
-    # 3. Lưu Order vào DB
+    # 1. Giá món + coupon: từ price_cache, chỉ gọi restaurant_service khi cache thiếu / quá cũ
+    food_ids = sorted({item.food_id for item in items})
+    foods_by_id, coupon = await load_prices(food_ids, branch_id, coupon_code)
+
+    # 2. Tính tiền & Lấy thông tin món
+    for item in items:
+        food_data = foods_by_id[item.food_id]
+
+        # Tính giá sau giảm (nếu món đó có giảm giá riêng)
+        discount = food_data.get('discount', 0) or 0
+        final_item_price = food_data['price'] * (1 - discount/100)
+        total_price += final_item_price * item.quantity
+
+        order_items_data.append({
+            "food_id": item.food_id,
+            "food_name": food_data['name'],
+            "price": final_item_price,
+            "quantity": item.quantity,
+            "image_url": food_data.get('image_url', '') # Lưu ảnh để hiện ở lịch sử/dashboard
+        })
+
+    # 3. Xử lý Coupon (Mã giảm giá đơn hàng)
+    discount_amount = 0
+    if coupon is not None:
+        discount_amount = (total_price * coupon['discount_percent']) / 100
+
+    final_price = max(0, total_price - discount_amount)
+    return order_items_data, total_price, discount_amount, final_price
+
+# Báo giá: Frontend gọi 1 lần trước khi checkout, gửi lại quote_token trong /checkout
+@app.post("/quote")
+async def create_quote(payload: QuoteCreate):
+    order_items_data, total_price, discount_amount, final_price = await price_cart(
+        payload.branch_id, payload.items, payload.coupon_code
+    )
+    quote = {
+        "user_id": payload.user_id,
+        "branch_id": payload.branch_id,
+        "coupon_code": payload.coupon_code,
+        "items": order_items_data,
+        "sub_total": total_price,
+        "discount_amount": discount_amount,
+        "total_price": final_price,
+    }
+    token = quotes.sign_quote(quote)
+    quote_stats["issued"] += 1
+    return {**quote, "quote_token": token, "expires_in": quotes.QUOTE_TTL_SECONDS}
+
+async def place_order(payload: OrderCreate, db: AsyncSession):
+    # Token báo giá còn hạn + đúng giỏ hàng -> dùng giá đã ký, không tính lại
+    quote = quotes.verify_quote(payload.quote_token) if payload.quote_token else None
+    if quote is not None and quotes.matches(quote, payload.user_id, payload.branch_id, payload.items, payload.coupon_code):
+        order_items_data, discount_amount, final_price = quote["items"], quote["discount_amount"], quote["total_price"]
+        quote_stats["used"] += 1
+    else:
+        # Không có token / hết hạn / giỏ hàng đã đổi -> tính lại như cũ
+        order_items_data, _, discount_amount, final_price = await price_cart(
+            payload.branch_id, payload.items, payload.coupon_code
+        )
+        quote_stats["repriced"] += 1
+
+    # 4. Lưu Order vào DB
     new_order = models.Order(
         user_id=payload.user_id,
         user_name=payload.customer_name,
@@ -113,8 +302,7 @@ async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    await db.flush()  # lấy new_order.id, chưa commit
 
     # Lưu chi tiết món ăn
     for item in order_items_data:
@@ -127,47 +315,182 @@ async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
             image_url=item['image_url']
         )
         db.add(new_item)
-    
-    db.commit()
 
-    # 4. Gửi thông báo (Tùy chọn)
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(f"{NOTIFICATION_SERVICE_URL}/notify", json={
-                "branch_id": payload.branch_id,
-                "message": "NEW_ORDER" 
-            })
-    except: pass
+    # 5. Event OrderCreated vào outbox, CÙNG transaction với đơn hàng
+    #    (notification_service nhận qua broker -> không gọi /notify trên đường checkout nữa)
+    add_event(db, models.OutboxEvent, ORDER_CREATED, {
+        "order_id": new_order.id,
+        "user_id": new_order.user_id,
+        "branch_id": new_order.branch_id,
+        "total_price": final_price,
+    }, aggregate_id=new_order.id)
+
+    # 6. Commit đơn TRƯỚC rồi mới ghi lượt dùng mã qua mạng: không giữ transaction + connection DB
+    #    trong lúc chờ restaurant_service (breaker / retry có thể mất vài giây).
+    #    Không ghi được lượt (hết lượt / restaurant_service lỗi) -> hủy đơn vừa tạo
+    await db.commit()
+    if payload.coupon_code:
+        try:
+            await redeem_coupon(new_order, payload.coupon_code)
+        except BaseException:
+            await asyncio.shield(cancel_unredeemed_order(new_order.id))
+            raise
+    relay.wake()
+    notifier.notify(new_order.user_id)
 
     return {"order_id": new_order.id, "total_price": final_price, "status": "PENDING"}
 
 # --- API LẤY ĐƠN HÀNG (SỬA LẠI ĐỂ KHỚP FRONTEND) ---
+# Phân trang keyset: mỗi trang tối đa `limit` đơn, mới nhất trước.
+# Trang kế tiếp: gửi lại before_created_at/before_id lấy từ header X-Next-Before-Created-At / X-Next-Before-Id
+class OrderPage:
+    def __init__(
+        self,
+        limit: int = Query(50, ge=1, le=200),
+        before_created_at: Optional[datetime] = None,
+        before_id: Optional[int] = None,
+        status: Optional[str] = None,  # 1 hoặc nhiều trạng thái, cách nhau bởi dấu phẩy
+    ):
+        self.limit = limit
+        self.before_created_at = before_created_at
+        self.before_id = before_id
+        self.statuses = [s.strip() for s in status.split(",") if s.strip()] if status else []
+        if before_id is not None and before_created_at is None:
+            # Chỉ có before_id thì không biết vị trí trang (sắp theo created_at) -> báo lỗi, không lặng lẽ bỏ qua
+            raise HTTPException(status_code=400, detail="before_id requires before_created_at")
+
+def paginate_orders(q, page: OrderPage, response: Response):
+    if page.statuses:
+        q = q.filter(models.Order.status.in_(page.statuses))
+    if page.before_created_at is not None:
+        if page.before_id is not None:
+            q = q.filter(or_(
+                models.Order.created_at < page.before_created_at,
+                and_(models.Order.created_at == page.before_created_at, models.Order.id < page.before_id),
+            ))
+        else:
+            q = q.filter(models.Order.created_at < page.before_created_at)
+
+    # selectinload: 1 query IN (...) cho items thay vì JOIN nhân bản từng dòng order
+    orders = q.options(selectinload(models.Order.items))\
+              .order_by(models.Order.created_at.desc(), models.Order.id.desc())\
+              .limit(page.limit).all()
+
+    if len(orders) == page.limit:
+        last = orders[-1]
+        response.headers["X-Next-Before-Created-At"] = last.created_at.isoformat()
+        response.headers["X-Next-Before-Id"] = str(last.id)
+    return orders
 
 # 1. API cũ của bạn (giữ nguyên để không ảnh hưởng cái khác)
 @app.get("/orders")
-def get_orders(branch_id: Optional[int] = None, db: Session = Depends(get_db)):
-    q = db.query(models.Order).options(joinedload(models.Order.items))
+def get_orders(response: Response, branch_id: Optional[int] = None, page: OrderPage = Depends(), db: Session = Depends(get_db)):
+    q = db.query(models.Order)
     if branch_id:
         q = q.filter(models.Order.branch_id == branch_id)
-    return q.order_by(models.Order.created_at.desc()).all()
+    return paginate_orders(q, page, response)
 
 # 2. [QUAN TRỌNG] API MỚI CHO FRONTEND REACT GỌI
 @app.get("/orders/branch/{branch_id}")
-def get_orders_by_branch(branch_id: int, db: Session = Depends(get_db)):
+def get_orders_by_branch(branch_id: int, response: Response, page: OrderPage = Depends(), db: Session = Depends(get_db)):
     # Frontend gọi: api.get(`/orders/branch/${branchId}`)
-    orders = db.query(models.Order)\
-               .options(joinedload(models.Order.items))\
-               .filter(models.Order.branch_id == branch_id)\
-               .order_by(models.Order.created_at.desc())\
-               .all()
-    return orders
+    q = db.query(models.Order).filter(models.Order.branch_id == branch_id)
+    return paginate_orders(q, page, response)
 
 @app.get("/orders/my-orders")
-def get_my_orders(user_id: int, db: Session = Depends(get_db)):
-    orders = db.query(models.Order).options(joinedload(models.Order.items))\
-                .filter(models.Order.user_id == user_id)\
-                .order_by(models.Order.created_at.desc()).all()
-    return orders
+def get_my_orders(user_id: int, response: Response, page: OrderPage = Depends(), db: Session = Depends(get_db)):
+    q = db.query(models.Order).filter(models.Order.user_id == user_id)
+    return paginate_orders(q, page, response)
+
+# --- CHANGE FEED: chỉ trả các đơn đã thay đổi kể từ cursor ---
+# Thay cho việc Frontend tải lại toàn bộ /orders/my-orders mỗi 5 giây.
+# Không có `since` -> chỉ trả cursor hiện tại. `wait` > 0 -> long-poll tối đa `wait` giây.
+CHANGES_RECHECK_SECONDS = float(os.getenv("ORDER_CHANGES_RECHECK_SECONDS", 10))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("ORDER_SSE_KEEPALIVE_SECONDS", 10))
+
+def latest_cursor(user_id: int) -> str:
+    db = SessionLocal()
+    try:
+        last = db.query(models.Order.updated_at, models.Order.id)\
+                 .filter(models.Order.user_id == user_id)\
+                 .order_by(models.Order.updated_at.desc(), models.Order.id.desc()).first()
+        if last is None or last.updated_at is None:
+            return "0"
+        # Các đơn trong cửa sổ chồng lấn coi như client đã có (vừa tải /orders/my-orders)
+        cursor = advance(None, [(last.updated_at, last.id)])
+        recent = db.query(models.Order.updated_at, models.Order.id)\
+                   .filter(models.Order.user_id == user_id, models.Order.updated_at >= cursor.floor).all()
+        cursor = advance(cursor, [(r.updated_at, r.id) for r in recent])
+        return encode_cursor(cursor.updated_at, cursor.order_id, cursor.seen)
+    finally:
+        db.close()
+
+def load_changes(user_id: int, after, limit: int):
+    """-> (đơn dạng JSON, [(updated_at, id)] của các đơn đó)."""
+    db = SessionLocal()
+    try:
+        q = db.query(models.Order).options(selectinload(models.Order.items))\
+              .filter(models.Order.user_id == user_id)
+        if after is not None:
+            # Đọc lùi cả cửa sổ chồng lấn: đơn commit muộn có updated_at < cursor vẫn được gửi,
+            # đơn đã gửi (after.seen) thì bỏ qua theo id + updated_at
+            q = q.filter(models.Order.updated_at >= after.floor)
+        orders = q.order_by(models.Order.updated_at.asc(), models.Order.id.asc())\
+                  .limit(limit + (len(after.seen) if after is not None else 0)).all()
+        if after is not None:
+            orders = [o for o in orders if (o.id, o.updated_at) not in after.seen][:limit]
+        return jsonable_encoder(orders), [(o.updated_at, o.id) for o in orders]
+    finally:
+        db.close()
+
+async def wait_for_changes(user_id: int, since: str, wait: float, limit: int):
+    after = decode_cursor(since)
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        seen = notifier.seq(user_id)
+        orders, marks = await run_in_threadpool(load_changes, user_id, after, limit)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if orders or remaining <= 0:
+            break
+        # Chờ được đánh thức bởi thay đổi trong process này, hoặc kiểm tra lại DB
+        # sau CHANGES_RECHECK_SECONDS (thay đổi đến từ replica khác)
+        await notifier.wait(user_id, seen, min(remaining, CHANGES_RECHECK_SECONDS))
+    if not orders:
+        return orders, since
+    cursor = advance(after, marks)
+    return orders, encode_cursor(cursor.updated_at, cursor.order_id, cursor.seen)
+
+@app.get("/orders/changes")
+async def get_order_changes(
+    user_id: int,
+    since: Optional[str] = None,
+    wait: float = Query(0, ge=0, le=25),
+    limit: int = Query(100, ge=1, le=500),
+):
+    if since is None:
+        return {"orders": [], "cursor": await run_in_threadpool(latest_cursor, user_id)}
+    orders, cursor = await wait_for_changes(user_id, since, wait, limit)
+    return {"orders": orders, "cursor": cursor}
+
+# Biến thể Server-Sent Events: giữ 1 kết nối, server đẩy event "orders" mỗi khi có thay đổi
+@app.get("/orders/changes/stream")
+async def stream_order_changes(user_id: int, request: Request, since: Optional[str] = None):
+    since = request.headers.get("last-event-id") or since
+    if since is None:
+        since = await run_in_threadpool(latest_cursor, user_id)
+    decode_cursor(since)  # cursor sai -> 400 trước khi mở stream
+
+    async def events():
+        cursor = since
+        yield f"event: cursor\nid: {cursor}\ndata: {json.dumps({'cursor': cursor})}\n\n"
+        while not await request.is_disconnected():
+            orders, cursor = await wait_for_changes(user_id, cursor, SSE_KEEPALIVE_SECONDS, 100)
+            if orders:
+                yield f"event: orders\nid: {cursor}\ndata: {json.dumps(orders)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/orders/{order_id}")
 def get_order_detail(order_id: int, db: Session = Depends(get_db)):
@@ -182,7 +505,10 @@ def mark_paid(order_id: int, db: Session = Depends(get_db)):
     order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if order:
         order.status = "PAID"
+        add_order_status_event(db, order)
         db.commit()
+        notifier.notify(order.user_id)
+        relay.wake()
     return {"status": "updated"}
 
 @app.put("/orders/{order_id}/status")
@@ -190,5 +516,27 @@ def update_status(order_id: int, status: str, db: Session = Depends(get_db)):
     order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not order: raise HTTPException(status_code=404, detail="Order not found")
     order.status = status
+    add_order_status_event(db, order)
     db.commit()
-    return {"message": f"Updated to {status}"}
\ No newline at end of file
+    notifier.notify(order.user_id)
+    relay.wake()
+    return {"message": f"Updated to {status}"}
+# Số liệu pool kết nối DB
+@app.get("/metrics/db")
+def db_metrics(): return database.stats()
+
+# Outbox relay + consumer PaymentSucceeded
+@app.get("/metrics/events")
+async def event_metrics():
+    return {"outbox": await relay.stats(), "consumer": await consumer.stats()}
+
+@app.get("/metrics/idempotency")
+def idempotency_metrics(): return idempotency.stats()
+
+# Breaker / retry / độ trễ các lần gọi restaurant_service, user_service
+@app.get("/metrics/resilience")
+def resilience_metrics(): return resilience.stats()
+
+# Cache giá: số món / coupon, tuổi snapshot, event FoodChanged đã áp dụng, báo giá
+@app.get("/metrics/prices")
+async def price_metrics(): return {**price_cache.stats(), "consumer": await price_consumer.stats(), "quotes": quote_stats}
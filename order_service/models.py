@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Index, exc, func, inspect, text
 from sqlalchemy.orm import relationship
 from database import Base
+from common.outbox import outbox_model, processed_event_model
+from sqlalchemy.dialects import mysql
 import datetime
 
+# DATETIME(6) trên MySQL: cần độ chính xác micro giây để cursor của change feed không trùng
+PreciseDateTime = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -23,14 +28,64 @@ class Order(Base):
     discount_amount = Column(Float, default=0)
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Đổi mỗi khi đơn thay đổi (tạo mới / đổi trạng thái) -> dùng cho /orders/changes
+    # DB cũ: upgrade_schema() thêm cột lúc start, tương đương
+    #   ALTER TABLE orders ADD COLUMN updated_at DATETIME(6) NULL;
+    #   UPDATE orders SET updated_at = COALESCE(created_at, UTC_TIMESTAMP(6)) WHERE updated_at IS NULL;
+    #   CREATE INDEX ix_orders_user_updated ON orders (user_id, updated_at, id);
+    updated_at = Column(PreciseDateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    # Index phục vụ phân trang keyset (ORDER BY created_at DESC, id DESC) theo quán / theo khách
+    # DB cũ (create_all không sửa bảng đã có): upgrade_schema() tạo lúc start, tương đương
+    #   CREATE INDEX ix_orders_branch_created ON orders (branch_id, created_at, id);
+    #   CREATE INDEX ix_orders_user_created ON orders (user_id, created_at, id);
+    #   CREATE INDEX ix_orders_created ON orders (created_at, id);
+    __table_args__ = (
+        Index("ix_orders_branch_created", "branch_id", "created_at", "id"),
+        Index("ix_orders_user_created", "user_id", "created_at", "id"),
+        Index("ix_orders_created", "created_at", "id"),
+        Index("ix_orders_user_updated", "user_id", "updated_at", "id"),
+    )
+
+def upgrade_schema(engine):
+    """Bảng orders có từ trước -> thêm cột updated_at + các index còn thiếu (gọi sau create_all,
+    chạy lại nhiều lần không sao). Bảng lớn: MySQL 8 thêm cột / index online (không khóa ghi)
+    nhưng vẫn tốn thời gian lúc start lần đầu."""
+    table = Order.__table__
+    columns = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    if "updated_at" not in columns:
+        column_type = table.c.updated_at.type.compile(dialect=engine.dialect)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN updated_at {column_type} NULL"))
+            print("🗂️ Đã thêm cột orders.updated_at")
+        except exc.DBAPIError as e:
+            print(f"⚠️ Không thêm được cột orders.updated_at: {e}")  # replica khác vừa thêm (Duplicate column)
+        # Đơn cũ chưa có updated_at -> lấy created_at, không thì change feed không bao giờ thấy
+        with engine.begin() as conn:
+            filled = conn.execute(
+                table.update().where(table.c.updated_at.is_(None))
+                .values(updated_at=func.coalesce(table.c.created_at, datetime.datetime.utcnow()))
+            ).rowcount
+        print(f"🗂️ Backfill orders.updated_at: {filled} đơn")
+    existing = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        try:
+            index.create(bind=engine)
+            print(f"🗂️ Đã tạo index {index.name}")
+        except exc.DBAPIError as e:
+            # Replica khác vừa tạo cùng lúc (Duplicate key name) -> bỏ qua
+            print(f"⚠️ Không tạo được index {index.name}: {e}")
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     
     food_id = Column(Integer)
     food_name = Column(String(100))
@@ -40,4 +95,8 @@ class OrderItem(Base):
     price = Column(Float)
     quantity = Column(Integer)
 
-    order = relationship("Order", back_populates="items")
\ No newline at end of file
+    order = relationship("Order", back_populates="items")
+
+# Outbox (event chờ gửi lên broker) + event đã xử lý (chống trùng khi broker giao lại)
+OutboxEvent = outbox_model(Base)
+ProcessedEvent = processed_event_model(Base)
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from common.resilience import ResilientClient
+
+# --- CẤU HÌNH ---
+# Giá món + coupon của restaurant_service giữ ngay trong order_service:
+# cập nhật tức thì qua event FoodChanged, tải lại toàn bộ (/catalog/snapshot) mỗi ORDER_PRICE_REFRESH_SECONDS.
+ORDER_PRICE_REFRESH_SECONDS = float(os.getenv("ORDER_PRICE_REFRESH_SECONDS", 60))
+# Snapshot gần nhất không cũ hơn mức này -> checkout tính tiền từ cache, không gọi restaurant_service
+ORDER_PRICE_MAX_STALENESS = float(os.getenv("ORDER_PRICE_MAX_STALENESS", 300))
+# restaurant_service lỗi / chậm -> vẫn tính tiền từ cache nếu snapshot không cũ hơn mức này
+ORDER_PRICE_MAX_STALE_ON_ERROR = float(os.getenv("ORDER_PRICE_MAX_STALE_ON_ERROR", 3600))
+
+
+def _parse_date(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class PriceCache:
+    """Cache giá theo version: food_id -> dữ liệu món (kèm version), (branch_id, code) -> coupon (kèm version).
+
+    Event đến trễ / giao lại có version <= version đang giữ thì bỏ qua;
+    món bị xóa giữ lại dạng {"deleted": True, "version": ...} để event cũ không "hồi sinh" món.
+    """
+
+    def __init__(self, client: ResilientClient, refresh_seconds: float = ORDER_PRICE_REFRESH_SECONDS):
+        self.client = client
+        self.refresh_seconds = refresh_seconds
+        self.foods: Dict[int, dict] = {}
+        self.coupons: Dict[Tuple[int, str], dict] = {}
+        self.coupons_by_id: Dict[int, dict] = {}
+        self.synced_at: Optional[float] = None  # monotonic, lần tải snapshot thành công gần nhất
+        self._touched: Set[int] = set()  # món đổi qua event trong lúc đang tải snapshot
+        self._touched_coupons: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.events_applied = 0
+        self.events_ignored = 0
+
+    # --- CẬP NHẬT ---
+    def apply_food(self, food_id: int, version: int, food: Optional[dict]) -> bool:
+        current = self.foods.get(food_id)
+        if current is not None and current["version"] >= version:
+            return False
+        self.foods[food_id] = {**food, "version": version} if food else {"id": food_id, "version": version, "deleted": True}
+        self._touched.add(food_id)
+        return True
+
+    async def on_food_changed(self, event: dict):
+        p = event["payload"]
+        if self.apply_food(p["food_id"], p["version"], None if p.get("deleted") else p["food"]):
+            self.events_applied += 1
+        else:
+            self.events_ignored += 1
+
+    def apply_coupon(self, coupon_id: int, version: int, coupon: Optional[dict]) -> bool:
+        current = self.coupons_by_id.get(coupon_id)
+        if current is not None:
+            if current["version"] >= version:
+                return False
+            if not current.get("deleted"):
+                self.coupons.pop((current["branch_id"], current["code"].upper()), None)
+        self._touched_coupons.add(coupon_id)
+        if coupon is None:
+            # Giữ lại dạng đã xóa để event cũ không "hồi sinh" mã
+            self.coupons_by_id[coupon_id] = {"id": coupon_id, "version": version, "deleted": True}
+            return True
+        coupon = {
+            **coupon, "version": version,
+            "start_date": _parse_date(coupon.get("start_date")), "end_date": _parse_date(coupon.get("end_date")),
+        }
+        self.coupons_by_id[coupon_id] = coupon
+        self.coupons[(coupon["branch_id"], coupon["code"].upper())] = coupon
+        return True
+
+    async def on_coupon_changed(self, event: dict):
+        p = event["payload"]
+        if self.apply_coupon(p["coupon_id"], p["version"], None if p.get("deleted") else p["coupon"]):
+            self.events_applied += 1
+        else:
+            self.events_ignored += 1
+
+    async def refresh(self):
+        self._touched, self._touched_coupons = set(), set()
+        res = await self.client.get("/catalog/snapshot")
+        res.raise_for_status()
+        data = res.json()
+        foods = {}
+        for food in data["foods"]:
+            current = self.foods.get(food["id"])
+            # Event đến trong lúc tải có thể mới hơn snapshot
+            keep = current is not None and current["version"] > food.get("version", 1)
+            foods[food["id"]] = current if keep else {**food, "version": food.get("version", 1)}
+        for food_id in self._touched:
+            if food_id not in foods:
+                foods[food_id] = self.foods[food_id]  # món mới tạo / vừa xóa sau thời điểm snapshot
+        self.foods = foods
+        coupons_by_id = {}
+        for c in data["coupons"]:
+            current = self.coupons_by_id.get(c["id"])
+            if current is not None and current["version"] > c.get("version", 1):
+                coupons_by_id[c["id"]] = current  # CouponChanged mới hơn snapshot
+            else:
+                coupons_by_id[c["id"]] = {
+                    **c, "version": c.get("version", 1),
+                    "start_date": _parse_date(c.get("start_date")), "end_date": _parse_date(c.get("end_date")),
+                }
+        for coupon_id in self._touched_coupons:
+            if coupon_id not in coupons_by_id:
+                coupons_by_id[coupon_id] = self.coupons_by_id[coupon_id]  # mã mới tạo / vừa xóa sau snapshot
+        self.coupons_by_id = coupons_by_id
+        self.coupons = {
+            (c["branch_id"], c["code"].upper()): c
+            for c in coupons_by_id.values() if not c.get("deleted") and c.get("code")
+        }
+        self.synced_at = time.monotonic()
+        self.refreshes += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"[price_cache] Lỗi tải snapshot giá: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- ĐỌC ---
+    def age(self) -> Optional[float]:
+        return None if self.synced_at is None else time.monotonic() - self.synced_at
+
+    def usable(self, max_age: float) -> bool:
+        age = self.age()
+        return age is not None and age <= max_age
+
+    def lookup(self, food_ids: Iterable[int]) -> Tuple[Dict[int, dict], List[int], List[int]]:
+        """-> (món tìm thấy, món đã bị xóa, món cache chưa biết)."""
+        found, deleted, unknown = {}, [], []
+        for food_id in food_ids:
+            food = self.foods.get(food_id)
+            if food is None:
+                unknown.append(food_id)
+            elif food.get("deleted"):
+                deleted.append(food_id)
+            else:
+                found[food_id] = food
+        return found, deleted, unknown
+
+    def coupon(self, branch_id: int, code: str) -> Optional[dict]:
+        """Coupon còn hiệu lực (is_active + trong khoảng start_date..end_date), không có -> None.
+        Lượt dùng còn lại do restaurant_service quyết định lúc redeem."""
+        coupon = self.coupons.get((branch_id, code.strip().upper()))
+        if coupon is None or not coupon.get("is_active"):
+            return None
+        now = datetime.utcnow()
+        if coupon["start_date"] and now < coupon["start_date"]:
+            return None
+        if coupon["end_date"] and now > coupon["end_date"]:
+            return None
+        return coupon
+
+    def stats(self) -> dict:
+        age = self.age()
+        return {
+            "foods": len(self.foods),
+            "coupons": len(self.coupons),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "max_staleness": ORDER_PRICE_MAX_STALENESS,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "events_applied": self.events_applied,
+            "events_ignored": self.events_ignored,
+        }
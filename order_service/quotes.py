@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from common.settings import require_secret
+
+# --- BÁO GIÁ CÓ CHỮ KÝ ---
+# POST /quote tính giá giỏ hàng 1 lần -> token "<payload base64>.<HMAC-SHA256>".
+# /checkout nhận lại token còn hạn + đúng giỏ hàng -> dùng luôn giá trong token, không tính lại.
+# Khóa ký riêng (khác SECRET_KEY của JWT), thiếu thì service không chạy
+QUOTE_SECRET = require_secret("QUOTE_SECRET")
+QUOTE_TTL_SECONDS = int(os.getenv("QUOTE_TTL_SECONDS", 600))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(QUOTE_SECRET.encode(), body.encode("ascii"), hashlib.sha256).digest())
+
+
+def sign_quote(quote: dict, ttl: int = QUOTE_TTL_SECONDS) -> str:
+    body = _b64encode(json.dumps({**quote, "exp": int(time.time()) + ttl}, separators=(",", ":")).encode())
+    return f"{body}.{_sign(body)}"
+
+
+def verify_quote(token: str) -> Optional[dict]:
+    """Chữ ký sai -> 400; hết hạn -> None (checkout tự tính lại giá)."""
+    try:
+        body, signature = token.split(".", 1)
+        # Ký tự ngoài ASCII: encode("ascii") / compare_digest(str) raise -> cũng là token sai
+        if not hmac.compare_digest(signature.encode("ascii"), _sign(body).encode("ascii")):
+            raise ValueError("bad signature")
+        quote = json.loads(_b64decode(body))
+    except (ValueError, TypeError):  # UnicodeError, JSONDecodeError, binascii.Error đều là ValueError
+        raise HTTPException(400, "Invalid quote token")
+    if quote.get("exp", 0) < time.time():
+        return None
+    return quote
+
+
+def cart_key(items) -> Dict[int, int]:
+    """food_id -> tổng số lượng (giỏ gửi 2 dòng cùng món vẫn so khớp được)."""
+    result: Dict[int, int] = {}
+    for item in items:
+        food_id = item["food_id"] if isinstance(item, dict) else item.food_id
+        quantity = item["quantity"] if isinstance(item, dict) else item.quantity
+        result[food_id] = result.get(food_id, 0) + quantity
+    return result
+
+
+def matches(quote: dict, user_id: Optional[int], branch_id: int, items, coupon_code: Optional[str]) -> bool:
+    """Token chỉ dùng được cho đúng user / quán / giỏ hàng / mã giảm giá lúc báo giá."""
+    return (
+        quote.get("user_id") == user_id
+        and quote.get("branch_id") == branch_id
+        and (quote.get("coupon_code") or "").upper() == (coupon_code or "").upper()
+        and cart_key(quote.get("items", [])) == cart_key(items)
+    )
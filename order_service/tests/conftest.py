@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.testing import reset_tables, run_async, setup_service  # noqa: E402
+
+setup_service(__file__, "ORDER")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("INTERNAL_TOKEN", "test-internal-token")
+os.environ.setdefault("QUOTE_SECRET", "test-quote-secret")
+
+from database import Base, engine, async_engine  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    reset_tables(Base, engine)
+
+
+@pytest.fixture
+def run():
+    return lambda coro: run_async(coro, async_engine)
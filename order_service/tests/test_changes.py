@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from changes import CHANGES_OVERLAP_SECONDS, advance, decode_cursor, encode_cursor
+from database import SessionLocal
+import main
+import models
+
+client = TestClient(main.app)
+NOW = datetime(2026, 1, 1, 12, 0, 0, 500)
+
+
+def add_order(updated_at: datetime, user_id: int = 1) -> int:
+    db = SessionLocal()
+    try:
+        order = models.Order(user_id=user_id, branch_id=1, status="PAID", total_price=10,
+                             created_at=updated_at, updated_at=updated_at)
+        db.add(order)
+        db.commit()
+        return order.id
+    finally:
+        db.close()
+
+
+def touch(order_id: int, updated_at: datetime):
+    db = SessionLocal()
+    try:
+        db.get(models.Order, order_id).updated_at = updated_at
+        db.commit()
+    finally:
+        db.close()
+
+
+def poll(cursor: str):
+    body = client.get("/orders/changes", params={"user_id": 1, "since": cursor}).json()
+    return [o["id"] for o in body["orders"]], body["cursor"]
+
+
+# --- cursor ---
+def test_cursor_roundtrip():
+    cursor = advance(None, [(NOW, 3), (NOW - timedelta(seconds=2), 1)])
+    encoded = encode_cursor(cursor.updated_at, cursor.order_id, cursor.seen)
+    assert decode_cursor(encoded) == cursor
+    assert decode_cursor("0") is None
+    assert encode_cursor(None, 0) == "0"
+
+
+@pytest.mark.parametrize("cursor", ["abc", "2026-01-01T00:00:00_x", "2026-01-01T00:00:00_1~1.x", "2026-13-01T00:00:00_1"])
+def test_bad_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def test_advance_keeps_latest_version_inside_window():
+    old = NOW - timedelta(seconds=CHANGES_OVERLAP_SECONDS + 1)
+    cursor = advance(None, [(old, 1), (NOW - timedelta(seconds=1), 2)])
+    cursor = advance(cursor, [(NOW, 2), (NOW, 3)])
+    assert (cursor.updated_at, cursor.order_id) == (NOW, 3)
+    # đơn 1 đã ra khỏi cửa sổ, đơn 2 chỉ giữ bản mới nhất
+    assert cursor.seen == {(2, NOW), (3, NOW)}
+
+
+# --- feed ---
+def test_without_since_returns_only_a_cursor():
+    add_order(NOW)
+    body = client.get("/orders/changes", params={"user_id": 1}).json()
+    assert body["orders"] == [] and body["cursor"] != "0"
+    assert poll(body["cursor"])[0] == []
+
+
+def test_late_commit_behind_cursor_is_delivered_once():
+    add_order(NOW - timedelta(seconds=1))
+    add_order(NOW)
+    cursor = client.get("/orders/changes", params={"user_id": 1}).json()["cursor"]
+    # transaction bắt đầu trước nhưng commit sau -> updated_at nhỏ hơn cursor
+    late = add_order(NOW - timedelta(seconds=2))
+    ids, cursor = poll(cursor)
+    assert ids == [late]
+    assert poll(cursor) == ([], cursor)
+
+
+def test_updates_are_delivered_in_order():
+    first = add_order(NOW)
+    second = add_order(NOW)
+    ids, cursor = poll("0")
+    assert ids == [first, second]
+    touch(first, NOW + timedelta(seconds=1))
+    ids, cursor = poll(cursor)
+    assert ids == [first]
+    assert poll(cursor) == ([], cursor)
+
+
+def test_limit_pages_through_changes_without_gaps():
+    created = [add_order(NOW + timedelta(milliseconds=i)) for i in range(5)]
+    seen, cursor = [], "0"
+    for _ in range(5):
+        body = client.get("/orders/changes", params={"user_id": 1, "since": cursor, "limit": 2}).json()
+        seen += [o["id"] for o in body["orders"]]
+        cursor = body["cursor"]
+    assert seen == created
+
+
+def test_other_users_orders_are_not_included():
+    add_order(NOW, user_id=2)
+    assert poll("0")[0] == []
+
+
+def test_upgrade_schema_adds_updated_at_and_backfills(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INT, user_name TEXT, branch_id INT, total_price FLOAT,"
+            " status TEXT, customer_name TEXT, customer_phone TEXT, delivery_address TEXT, note TEXT,"
+            " coupon_code TEXT, discount_amount FLOAT, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO orders (user_id, branch_id, created_at) VALUES (1, 1, '2026-01-01 10:00:00.000000')"))
+    models.upgrade_schema(legacy)
+    models.upgrade_schema(legacy)
+    assert "updated_at" in {c["name"] for c in inspect(legacy).get_columns("orders")}
+    assert "ix_orders_user_updated" in {ix["name"] for ix in inspect(legacy).get_indexes("orders")}
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT updated_at FROM orders")).scalar().startswith("2026-01-01 10:00:00")
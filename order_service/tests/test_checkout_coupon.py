@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from database import SessionLocal, async_engine
+import main
+import models
+
+ORDER = {
+    "branch_id": 7, "items": [{"food_id": 1, "quantity": 2}], "coupon_code": "GIAM10", "user_id": 3,
+    "customer_name": "An", "customer_phone": "0900000000", "delivery_address": "1 Lê Lợi",
+}
+REQUEST = httpx.Request("POST", "http://restaurant/coupons/redeem")
+
+
+@pytest.fixture
+def restaurant(monkeypatch):
+    """Giả restaurant_service: redeem trả `redeem_status`, ghi lại các lần gọi + số connection DB đang mượn."""
+    state = {"redeem_status": 200, "redeem_error": None, "calls": [], "checked_out": []}
+
+    async def load_prices(food_ids, branch_id, coupon_code):
+        return {1: {"id": 1, "name": "Phở", "price": 50, "discount": 0}}, {"discount_percent": 10}
+
+    async def post(url, **kwargs):
+        state["calls"].append(("POST", url))
+        state["checked_out"].append(async_engine.pool.checkedout())
+        if state["redeem_error"] is not None:
+            raise state["redeem_error"]
+        return httpx.Response(state["redeem_status"], json={"detail": "Mã giảm giá đã hết lượt sử dụng"}, request=REQUEST)
+
+    async def request(method, url, **kwargs):
+        state["calls"].append((method, url))
+        return httpx.Response(200, json={"released": False}, request=REQUEST)
+
+    monkeypatch.setattr(main, "load_prices", load_prices)
+    monkeypatch.setattr(main.restaurant, "post", post)
+    monkeypatch.setattr(main.restaurant, "request", request)
+    yield state
+    asyncio.run(async_engine.dispose())
+
+
+def checkout():
+    return TestClient(main.app).post("/checkout", json=ORDER)  # không chạy lifespan (relay, consumer...)
+
+
+def saved_order():
+    db = SessionLocal()
+    try:
+        order = db.query(models.Order).one()
+        events = [e.event_type for e in db.scalars(select(models.OutboxEvent).order_by(models.OutboxEvent.id))]
+        return order.status, order.total_price, events
+    finally:
+        db.close()
+
+
+def test_redeem_runs_after_commit_without_holding_a_db_connection(restaurant):
+    response = checkout()
+    assert response.status_code == 200 and response.json()["total_price"] == 90
+    assert restaurant["calls"] == [("POST", "/coupons/redeem")]
+    assert restaurant["checked_out"] == [0]
+    assert saved_order() == ("PENDING", 90, ["OrderCreated"])
+
+
+def test_coupon_limit_reached_cancels_the_order(restaurant):
+    restaurant["redeem_status"] = 409
+    response = checkout()
+    assert response.status_code == 400
+    assert saved_order() == ("CANCELLED", 90, ["OrderCreated", "OrderStatusChanged"])
+    assert restaurant["calls"][-1][0] == "DELETE"  # trả lại lượt nếu thực ra đã ghi
+
+
+def test_restaurant_down_for_limited_coupon_cancels_the_order(restaurant):
+    restaurant["redeem_error"] = httpx.ConnectError("refused")
+    response = checkout()
+    assert response.status_code == 503
+    assert saved_order()[0] == "CANCELLED"
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from database import SessionLocal
+import main
+import models
+
+client = TestClient(main.app)
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def orders():
+    """10 đơn của user 1 ở quán 1 (2 đơn / mốc created_at để thử trùng thời điểm) + 3 đơn quán 2."""
+    db = SessionLocal()
+    try:
+        for i in range(10):
+            db.add(models.Order(user_id=1, branch_id=1, status="PAID" if i % 2 else "PENDING_PAYMENT",
+                                total_price=10, created_at=T0 + timedelta(minutes=i // 2)))
+        for i in range(3):
+            db.add(models.Order(user_id=2, branch_id=2, status="PAID", total_price=10, created_at=T0))
+        db.commit()
+        return [o.id for o in db.query(models.Order).filter(models.Order.branch_id == 1)
+                .order_by(models.Order.created_at.desc(), models.Order.id.desc())]
+    finally:
+        db.close()
+
+
+def walk(url: str, **params):
+    """Đi hết các trang theo header X-Next-Before-*; -> [[id, ...] mỗi trang]."""
+    pages = []
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append([o["id"] for o in response.json()])
+        if "X-Next-Before-Id" not in response.headers:
+            return pages
+        params["before_created_at"] = response.headers["X-Next-Before-Created-At"]
+        params["before_id"] = response.headers["X-Next-Before-Id"]
+
+
+def test_pages_cover_every_order_once_newest_first(orders):
+    pages = walk("/orders/branch/1", limit=3)
+    assert [len(p) for p in pages] == [3, 3, 3, 1]
+    assert sum(pages, []) == orders
+
+
+def test_last_full_page_ends_with_empty_page(orders):
+    pages = walk("/orders/my-orders", user_id=1, limit=5)
+    assert sum(pages, []) == orders and pages[-1] == []
+
+
+def test_status_filter(orders):
+    ids = sum(walk("/orders", branch_id=1, status="PAID, CANCELLED", limit=2), [])
+    assert len(ids) == 5
+    assert ids == [i for i in orders if i in set(ids)]
+    response = client.get("/orders/branch/1", params={"status": "PAID"})
+    assert {o["status"] for o in response.json()} == {"PAID"}
+
+
+def test_items_are_included(orders):
+    db = SessionLocal()
+    try:
+        db.add(models.OrderItem(order_id=orders[0], food_id=1, food_name="Phở", price=10, quantity=2))
+        db.commit()
+    finally:
+        db.close()
+    first = client.get("/orders/branch/1", params={"limit": 1}).json()[0]
+    assert [(i["food_name"], i["quantity"]) for i in first["items"]] == [("Phở", 2)]
+
+
+def test_before_id_without_before_created_at_is_400(orders):
+    response = client.get("/orders/my-orders", params={"user_id": 1, "before_id": orders[2]})
+    assert response.status_code == 400
+
+
+def test_limit_is_bounded():
+    assert client.get("/orders", params={"limit": 0}).status_code == 422
+    assert client.get("/orders", params={"limit": 201}).status_code == 422
+
+
+def test_upgrade_schema_creates_missing_indexes(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INT, user_name TEXT, branch_id INT, total_price FLOAT,"
+            " status TEXT, customer_name TEXT, customer_phone TEXT, delivery_address TEXT, note TEXT,"
+            " coupon_code TEXT, discount_amount FLOAT, created_at DATETIME, updated_at DATETIME)"
+        ))
+    models.upgrade_schema(legacy)
+    models.upgrade_schema(legacy)  # chạy lại không lỗi
+    names = {ix["name"] for ix in inspect(legacy).get_indexes("orders")}
+    assert {"ix_orders_branch_created", "ix_orders_user_created", "ix_orders_created"} <= names
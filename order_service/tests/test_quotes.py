@@ -0,0 +1,61 @@
+import pytest
+from fastapi import HTTPException
+
+import quotes
+
+QUOTE = {"user_id": 1, "branch_id": 2, "coupon_code": "giam10", "items": [{"food_id": 5, "quantity": 2}], "total": 90.0}
+
+
+def rejected(token: str) -> bool:
+    with pytest.raises(HTTPException) as e:
+        quotes.verify_quote(token)
+    return e.value.status_code == 400
+
+
+def test_sign_and_verify_roundtrip():
+    quote = quotes.verify_quote(quotes.sign_quote(QUOTE))
+    assert {k: quote[k] for k in QUOTE} == QUOTE
+
+
+def test_expired_quote_returns_none():
+    assert quotes.verify_quote(quotes.sign_quote(QUOTE, ttl=-1)) is None
+
+
+def test_tampered_body_is_rejected():
+    body, signature = quotes.sign_quote(QUOTE).split(".")
+    forged = quotes._b64encode(b'{"user_id":1,"branch_id":2,"items":[],"total":0,"exp":9999999999}')
+    assert rejected(f"{forged}.{signature}")
+    assert rejected(f"{body[:-2]}{'A' if body[-2] != 'A' else 'B'}{body[-1]}.{signature}")
+
+
+def test_tampered_signature_is_rejected():
+    body, signature = quotes.sign_quote(QUOTE).split(".")
+    assert rejected(f"{body}.{signature[::-1]}")
+    assert rejected(f"{body}.")
+
+
+def test_other_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(quotes, "QUOTE_SECRET", "khoa-khac")
+    token = quotes.sign_quote(QUOTE)
+    monkeypatch.undo()
+    assert rejected(token)
+
+
+@pytest.mark.parametrize("token", ["", "khong-co-dau-cham", "abc.déf", "ábc.def", "!!!.???"])
+def test_malformed_token_is_400(token):
+    assert rejected(token)
+
+
+def test_valid_signature_with_bad_payload_is_400():
+    body = quotes._b64encode(b"not json")
+    assert rejected(f"{body}.{quotes._sign(body)}")
+
+
+def test_matches_checks_user_branch_coupon_and_cart():
+    quote = quotes.verify_quote(quotes.sign_quote(QUOTE))
+    items = [{"food_id": 5, "quantity": 1}, {"food_id": 5, "quantity": 1}]  # cùng món tách 2 dòng vẫn khớp
+    assert quotes.matches(quote, 1, 2, items, "GIAM10")
+    assert not quotes.matches(quote, 9, 2, items, "GIAM10")
+    assert not quotes.matches(quote, 1, 3, items, "GIAM10")
+    assert not quotes.matches(quote, 1, 2, items, None)
+    assert not quotes.matches(quote, 1, 2, [{"food_id": 5, "quantity": 3}], "GIAM10")
@@ -1,35 +1,40 @@
-import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import database, get_db, get_async_db, AsyncSessionLocal, engine, Base
+from common.auth import verify_request
+from common.lifespan import service_lifespan
+from common.resilience import resilience
+from common.broker import create_broker
+from common.events import PAYMENT_SUCCEEDED
+from common.outbox import OutboxRelay, add_event
+from common.idempotency import create_idempotency_store, fingerprint
 import models
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import uuid
 
 # Tạo bảng
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# --- EVENT: outbox -> broker, order_service tự chuyển đơn sang PAID khi nhận PaymentSucceeded ---
+broker = create_broker()
+relay = OutboxRelay(AsyncSessionLocal, models.OutboxEvent, broker, source="payment_service")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Idempotency-Key cho /pay: gửi lại không tạo Payment / transaction_id mới
+idempotency = create_idempotency_store()
+
+app = FastAPI(lifespan=service_lifespan(
+    database,
+    on_startup=[relay.start],
+    on_shutdown=[broker.close, relay.stop],
+))
 
 # --- HÀM MỚI: XÁC THỰC USER (Để biết thẻ của ai) ---
 async def verify_user(request: Request):
-    token = request.headers.get("Authorization")
-    if not token: raise HTTPException(401, "Missing Token")
-    try:
-        async with httpx.AsyncClient() as client:
-            # Gọi User Service để check token
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200: raise HTTPException(401, "Invalid Token")
-            return res.json()
-    except Exception as e: raise HTTPException(401, str(e))
+    # Giải mã JWT tại chỗ bằng SECRET_KEY chung, không tốn round trip sang User Service
+    return await verify_request(request)
 
 # --- INPUT MODEL ---
 class PaymentRequest(BaseModel):
@@ -52,7 +57,14 @@ class CardResponse(CardCreate):
 # API THANH TOÁN (GIỮ NGUYÊN NHƯ BẠN GỬI)
 # ==========================================
 @app.post("/pay")
-async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)):
+async def process_payment(
+    payload: PaymentRequest,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    return await idempotency.run("pay", idempotency_key, fingerprint(payload), lambda: record_payment(payload, db))
+
+async def record_payment(payload: PaymentRequest, db: AsyncSession):
     # 1. Giả lập thành công
     
     # 2. Tạo mã giao dịch duy nhất
@@ -66,21 +78,18 @@ async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)
         status="SUCCESS"
     )
     db.add(new_payment)
-    db.commit()
-    
-    # 4. GỌI SANG ORDER SERVICE ĐỂ CONFIRM
-    order_service_url = f"http://order_service:8003/orders/{payload.order_id}/paid"
+    await db.flush()
     
-    async with httpx.AsyncClient() as client:
-        try:
-            # Gọi API nội bộ của Order Service
-            res = await client.put(order_service_url)
-            
-            if res.status_code != 200:
-                raise HTTPException(status_code=500, detail="Thanh toán thành công nhưng lỗi cập nhật đơn hàng")
-                
-        except Exception as e:
-             raise HTTPException(status_code=500, detail=f"Lỗi kết nối Order Service: {str(e)}")
+    # 4. BÁO ORDER SERVICE QUA EVENT (cùng transaction với payment)
+    #    -> order_service chậm/chết không làm hỏng thanh toán, relay gửi lại tới khi thành công
+    add_event(db, models.OutboxEvent, PAYMENT_SUCCEEDED, {
+        "payment_id": new_payment.id,
+        "order_id": payload.order_id,
+        "amount": payload.amount,
+        "transaction_id": trans_id,
+    }, aggregate_id=payload.order_id)
+    await db.commit()
+    relay.wake()
 
     return {
         "message": "Thanh toán thành công",
@@ -97,12 +106,12 @@ def get_history(db: Session = Depends(get_db)):
 # API QUẢN LÝ THẺ (MỚI)
 # ==========================================
 @app.get("/payment-methods", response_model=List[CardResponse])
-async def get_my_cards(request: Request, db: Session = Depends(get_db)):
+async def get_my_cards(request: Request, db: AsyncSession = Depends(get_async_db)):
     user = await verify_user(request)
-    return db.query(models.PaymentMethod).filter(models.PaymentMethod.user_id == user['id']).all()
+    return (await db.scalars(select(models.PaymentMethod).where(models.PaymentMethod.user_id == user['id']))).all()
 
 @app.post("/payment-methods", response_model=CardResponse)
-async def add_card(card: CardCreate, request: Request, db: Session = Depends(get_db)):
+async def add_card(card: CardCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
     user = await verify_user(request)
     
     new_card = models.PaymentMethod(
@@ -113,6 +122,21 @@ async def add_card(card: CardCreate, request: Request, db: Session = Depends(get
         bank_name=card.bank_name
     )
     db.add(new_card)
-    db.commit()
-    db.refresh(new_card)
-    return new_card
\ No newline at end of file
+    await db.commit()
+    await db.refresh(new_card)
+    return new_card
+
+# Số liệu pool kết nối DB
+@app.get("/metrics/db")
+def db_metrics(): return database.stats()
+
+# Outbox relay (PaymentSucceeded chờ gửi / đã gửi)
+@app.get("/metrics/events")
+async def event_metrics(): return {"outbox": await relay.stats()}
+
+@app.get("/metrics/idempotency")
+def idempotency_metrics(): return idempotency.stats()
+
+# Breaker / retry / độ trễ khi hỏi user_service (AUTH_REMOTE_VERIFY=1)
+@app.get("/metrics/resilience")
+def resilience_metrics(): return resilience.stats()
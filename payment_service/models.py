@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime
 from database import Base
+from common.outbox import outbox_model
 import datetime
 
 class Payment(Base):
@@ -25,4 +26,7 @@ class PaymentMethod(Base):
     card_number = Column(String(20)) # Lưu số thẻ
     card_holder = Column(String(100)) # Tên chủ thẻ
     expiry_date = Column(String(10))  # MM/YY
-    bank_name = Column(String(50))    # Tên ngân hàng
\ No newline at end of file
+    bank_name = Column(String(50))    # Tên ngân hàng
+
+# Outbox: PaymentSucceeded ghi cùng transaction với payment, relay gửi lên broker sau
+OutboxEvent = outbox_model(Base)
@@ -0,0 +1,62 @@
+"""Sinh ảnh thumb / card / full (WebP) cho các ảnh đã upload trước khi có image_variants.py.
+
+Chạy trong container restaurant_service (cùng biến môi trường DB / IMAGE_*):
+    python backfill_variants.py                 # chỉ ảnh còn thiếu variant
+    python backfill_variants.py --force         # sinh lại tất cả (đổi VARIANTS / chất lượng)
+    python backfill_variants.py --workers 4
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from database import SessionLocal
+from image_store import create_storage, name_from_url
+from image_variants import IMAGE_VARIANT_WORKERS, ImageVariants, render_variants, variant_name
+import models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="sinh lại cả ảnh đã có variant")
+    parser.add_argument("--workers", type=int, default=IMAGE_VARIANT_WORKERS)
+    args = parser.parse_args()
+
+    variants = ImageVariants(create_storage())
+    db = SessionLocal()
+    try:
+        # Ảnh đang được món nào đó dùng (cả tên cũ static/<uuid>.<ext> chưa chạy dedupe_images.py)
+        names = {name_from_url(url) for (url,) in db.query(models.Food.image_url).distinct()}
+        names.discard(None)
+    finally:
+        db.close()
+
+    todo = []
+    for name in sorted(names):
+        if not variants.storage.exists(name):
+            print(f"   ⚠️ Thiếu ảnh gốc {name}")
+        elif args.force or variants._missing(name):
+            todo.append(name)
+    print(f"🖼️ {len(names)} ảnh, cần sinh variant: {len(todo)}")
+
+    done = failed = saved = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(render_variants, variants._read(name)): name for name in todo}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+                continue
+            for size, content in result.items():
+                variants._write(variant_name(name, size), content)
+            done += 1
+            original = variants.storage.local_path(name)
+            if original is not None:
+                saved += os.path.getsize(original) - len(result["card"])
+    print(f"✅ Xong {done} ảnh, lỗi {failed}" + (f", ảnh card nhẹ hơn gốc tổng {saved / 1024:.0f} KB" if saved else ""))
+
+
+if __name__ == "__main__":
+    main()
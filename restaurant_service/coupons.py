@@ -0,0 +1,208 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, or_, select, update
+
+# --- CẤU HÌNH ---
+# Index coupon nằm trong RAM từng replica: ghi ở replica này -> cập nhật ngay,
+# replica khác nhận qua event CouponChanged + tải lại toàn bộ mỗi COUPON_INDEX_REFRESH_SECONDS
+COUPON_INDEX_REFRESH_SECONDS = float(os.getenv("COUPON_INDEX_REFRESH_SECONDS", 60))
+
+
+def normalize_code(code: str) -> str:
+    return (code or "").strip().upper()
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Frontend gửi ISO có 'Z' -> bỏ timezone, DB lưu giờ UTC không timezone."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def coupon_to_dict(c) -> dict:
+    return {
+        "id": c.id,
+        "code": c.code,
+        "branch_id": c.branch_id,
+        "discount_percent": c.discount_percent,
+        "start_date": c.start_date,
+        "end_date": c.end_date,
+        "is_active": c.is_active,
+        "usage_limit": c.usage_limit,
+        "per_user_limit": c.per_user_limit,
+        "used_count": c.used_count or 0,
+        "version": c.version or 1,
+    }
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class CouponIndex:
+    """(branch_id, CODE) -> coupon: /coupons/verify chỉ tra dict, không chạm DB.
+
+    Theo version như cache giá bên order_service: event cũ / đến trễ bị bỏ qua.
+    used_count trong index chỉ để từ chối sớm mã đã hết lượt; redeem() mới là chỗ quyết định.
+    """
+
+    def __init__(self, session_factory, model, refresh_seconds: float = COUPON_INDEX_REFRESH_SECONDS):
+        self.session_factory = session_factory  # SessionLocal
+        self.model = model  # models.Coupon
+        self.refresh_seconds = refresh_seconds
+        self._by_key: Dict[Tuple[int, str], dict] = {}
+        self._by_id: Dict[int, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # --- CẬP NHẬT ---
+    def load(self):
+        db = self.session_factory()
+        try:
+            coupons = [coupon_to_dict(c) for c in db.query(self.model).all()]
+        finally:
+            db.close()
+        by_id = {}
+        for c in coupons:
+            current = self._by_id.get(c["id"])
+            # Ghi / event đến trong lúc đang đọc DB có thể mới hơn
+            by_id[c["id"]] = current if current is not None and current["version"] > c["version"] else c
+        self._by_id = by_id
+        self._by_key = {(c["branch_id"], normalize_code(c["code"])): c for c in by_id.values()}
+        self.reloads += 1
+
+    def apply(self, coupon_id: int, version: int, coupon: Optional[dict]) -> bool:
+        current = self._by_id.get(coupon_id)
+        if current is not None:
+            if current["version"] >= version:
+                return False
+            self._by_key.pop((current["branch_id"], normalize_code(current["code"])), None)
+        if coupon is None:
+            self._by_id.pop(coupon_id, None)
+            return True
+        coupon = {**coupon, "start_date": _parse_date(coupon["start_date"]), "end_date": _parse_date(coupon["end_date"])}
+        self._by_id[coupon_id] = coupon
+        self._by_key[(coupon["branch_id"], normalize_code(coupon["code"]))] = coupon
+        return True
+
+    async def on_coupon_changed(self, event: dict):
+        p = event["payload"]
+        self.apply(p["coupon_id"], p["version"], None if p.get("deleted") else p["coupon"])
+
+    def note_used(self, coupon_id: int, used_count: int):
+        coupon = self._by_id.get(coupon_id)
+        if coupon is not None:
+            coupon["used_count"] = used_count
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await run_in_threadpool(self.load)
+            except Exception as e:
+                print(f"[coupons] Lỗi tải lại index coupon: {e}")
+
+    async def start(self):
+        await run_in_threadpool(self.load)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- ĐỌC ---
+    def verify(self, branch_id: int, code: str) -> Optional[dict]:
+        """Coupon còn hiệu lực (is_active, trong start_date..end_date, còn lượt), không có -> None."""
+        coupon = self._by_key.get((branch_id, normalize_code(code)))
+        now = datetime.utcnow()
+        valid = (
+            coupon is not None
+            and coupon["is_active"]
+            and (coupon["start_date"] is None or now >= coupon["start_date"])
+            and (coupon["end_date"] is None or now <= coupon["end_date"])
+            and (coupon["usage_limit"] is None or coupon["used_count"] < coupon["usage_limit"])
+        )
+        if not valid:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return coupon
+
+    def stats(self) -> dict:
+        return {"coupons": len(self._by_id), "hits": self.hits, "misses": self.misses, "reloads": self.reloads}
+
+
+# ==========================================
+# REDEEM: đếm lượt dùng bằng UPDATE có điều kiện (nguyên tử, không COUNT(*))
+# ==========================================
+class CouponLimitReached(Exception):
+    pass
+
+
+def _insert_ignore(dialect: str, model, values: dict):
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(model).values(**values).prefix_with("IGNORE")
+    from sqlalchemy.dialects.sqlite import insert
+    return insert(model).values(**values).on_conflict_do_nothing()
+
+
+async def _take_user_slot(db, counter_model, coupon, user_id: int):
+    """+1 lượt cho user nếu còn dưới per_user_limit. Chưa có dòng đếm -> INSERT, 2 request
+    cùng INSERT thì request thua UPDATE lại 1 lần (vẫn đúng giới hạn)."""
+    C = counter_model
+    cond = [C.coupon_id == coupon.id, C.user_id == user_id]
+    if coupon.per_user_limit is not None:
+        cond.append(C.count < coupon.per_user_limit)
+    stmt = update(C).where(*cond).values(count=C.count + 1)
+    if (await db.execute(stmt)).rowcount:
+        return
+    if coupon.per_user_limit is None or coupon.per_user_limit > 0:
+        inserted = await db.execute(_insert_ignore(db.bind.dialect.name, C, {
+            "coupon_id": coupon.id, "user_id": user_id, "count": 1,
+        }))
+        if inserted.rowcount:
+            return
+        if (await db.execute(stmt)).rowcount:
+            return
+    raise CouponLimitReached("Bạn đã dùng hết lượt của mã giảm giá này")
+
+
+async def redeem(db, models, coupon, user_id: Optional[int], order_id: int) -> int:
+    """Ghi 1 lượt dùng (gọi trong transaction của endpoint). -> used_count mới.
+    Hết lượt -> CouponLimitReached, endpoint rollback để không giữ lượt đã tăng dở."""
+    M = models.Coupon
+    if user_id is not None:
+        await _take_user_slot(db, models.CouponUserCount, coupon, user_id)
+    taken = await db.execute(
+        update(M).where(M.id == coupon.id, or_(M.usage_limit.is_(None), M.used_count < M.usage_limit))
+        .values(used_count=M.used_count + 1)
+    )
+    if not taken.rowcount:
+        raise CouponLimitReached("Mã giảm giá đã hết lượt sử dụng")
+    db.add(models.CouponUsage(coupon_id=coupon.id, user_id=user_id, order_id=order_id))
+    return await db.scalar(select(M.used_count).where(M.id == coupon.id))
+
+
+async def release(db, models, usage) -> int:
+    """Trả lại lượt của 1 đơn (đơn không tạo được / bị hủy). -> used_count mới."""
+    M, C = models.Coupon, models.CouponUserCount
+    await db.execute(update(M).where(M.id == usage.coupon_id, M.used_count > 0).values(used_count=M.used_count - 1))
+    if usage.user_id is not None:
+        await db.execute(
+            update(C).where(C.coupon_id == usage.coupon_id, C.user_id == usage.user_id, C.count > 0)
+            .values(count=C.count - 1)
+        )
+    await db.execute(delete(models.CouponUsage).where(models.CouponUsage.id == usage.id))
+    return await db.scalar(select(M.used_count).where(M.id == usage.coupon_id))
@@ -0,0 +1,111 @@
+"""Chuyển ảnh cũ (static/<uuid>.<ext>) sang kho ảnh theo nội dung, gộp các file trùng nhau.
+
+Chạy trong container restaurant_service (cùng biến môi trường DB / IMAGE_*):
+    python dedupe_images.py                         # chỉ xem trước, không đổi gì
+    python dedupe_images.py --apply                 # đổi foods.image_url + đếm lại image_blobs.ref_count
+    python dedupe_images.py --apply --delete-old    # xóa luôn file cũ không còn món nào dùng
+Sau khi --apply nên restart restaurant_service (search index / menu cache còn giữ image_url cũ).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+from database import SessionLocal, engine, Base
+from image_store import CONTENT_ADDRESSED, CONTENT_TYPES, IMAGE_DIR, IMAGE_URL_PREFIX, create_storage, hash_file, name_from_url, sniff
+import models
+
+
+def legacy_target(path: str):
+    """-> (tên mới "<sha256>.<ext>", số byte, content-type)"""
+    with open(path, "rb") as f:
+        digest, size, head = hash_file(f)
+    kind = sniff(head)
+    if kind is None:  # file hỏng / không nhận dạng được -> giữ đuôi cũ
+        ext = os.path.splitext(path)[1].lstrip(".").lower() or "bin"
+        kind = (ext, CONTENT_TYPES.get(ext, "application/octet-stream"))
+    return f"{digest}.{kind[0]}", size, kind[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="ghi thay đổi (mặc định chỉ xem trước)")
+    parser.add_argument("--delete-old", action="store_true", help="xóa file cũ không còn món nào dùng")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    storage = create_storage()
+    db = SessionLocal()
+    try:
+        foods = db.query(models.Food).all()
+        converted = {}  # tên file cũ -> (tên mới, size, content-type)
+        refs = Counter()
+        info = {}
+        legacy_bytes = 0
+
+        for food in foods:
+            name = name_from_url(food.image_url)
+            if name is None:
+                continue
+            if CONTENT_ADDRESSED.match(name):
+                refs[name] += 1
+                continue
+            if name not in converted:
+                path = os.path.join(IMAGE_DIR, name)
+                if not os.path.exists(path):
+                    print(f"   ⚠️ Món {food.id}: thiếu file {path}")
+                    continue
+                converted[name] = legacy_target(path)
+                legacy_bytes += converted[name][1]
+            target, size, content_type = converted[name]
+            refs[target] += 1
+            info[target] = (size, content_type)
+            if args.apply:
+                if not storage.exists(target):
+                    # put() có thể move file -> đưa bản sao vào kho, file cũ để riêng
+                    fd, tmp_path = tempfile.mkstemp(dir=storage.tmp_dir, suffix=".part")
+                    os.close(fd)
+                    shutil.copyfile(os.path.join(IMAGE_DIR, name), tmp_path)
+                    storage.put(target, tmp_path, content_type)
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                food.image_url = IMAGE_URL_PREFIX + target
+
+        unique_bytes = sum(size for size, _ in info.values())
+        print(f"📦 {len(converted)} file cũ ({legacy_bytes / 1024:.0f} KB) -> {len(info)} file theo nội dung ({unique_bytes / 1024:.0f} KB)")
+        print(f"🔗 {sum(refs.values())} món dùng {len(refs)} ảnh")
+        if not args.apply:
+            print("(xem trước - thêm --apply để ghi)")
+            return
+
+        # Đếm lại ref_count từ bảng foods (nguồn sự thật), ảnh không ai dùng -> 0 để gc() dọn
+        now = datetime.utcnow()
+        blobs = {b.name: b for b in db.query(models.ImageBlob).all()}
+        for name, blob in blobs.items():
+            if name not in refs and blob.ref_count:
+                blob.ref_count, blob.updated_at = 0, now
+        for name, count in refs.items():
+            blob = blobs.get(name)
+            if blob is None:
+                size, content_type = info.get(name, (None, CONTENT_TYPES.get(name.rsplit(".", 1)[-1])))
+                db.add(models.ImageBlob(name=name, size=size, content_type=content_type, ref_count=count, updated_at=now))
+            elif blob.ref_count != count:
+                blob.ref_count, blob.updated_at = count, now
+        db.commit()
+        print("✅ Đã cập nhật image_url + ref_count")
+
+        if args.delete_old:
+            removed = 0
+            for entry in os.scandir(IMAGE_DIR):
+                if entry.is_file() and not CONTENT_ADDRESSED.match(entry.name) and not entry.name.startswith("."):
+                    os.remove(entry.path)
+                    removed += 1
+            print(f"🗑️ Đã xóa {removed} file cũ")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import asyncio
+import os
+from typing import Optional, Set
+
+import httpx
+
+from common.resilience import resilience
+from common.settings import require_secret
+
+# --- CẤU HÌNH ---
+# Gateway cache response GET của /foods, /branches, /coupons, /reviews (gateway_service/response_cache.py).
+# Dữ liệu đổi ở đây -> báo cho MỌI replica gateway xóa cache (danh sách URL cách nhau dấu phẩy).
+GATEWAY_CACHE_URLS = [
+    url.strip() for url in
+    os.getenv("GATEWAY_CACHE_URLS", os.getenv("GATEWAY_SERVICE_URL", "http://gateway_service:8000")).split(",")
+    if url.strip()
+]
+# Token cho API nội bộ (gateway /internal/cache, /coupons/redeem): bắt buộc, khác SECRET_KEY
+INTERNAL_TOKEN = require_secret("INTERNAL_TOKEN")
+# Gộp các thay đổi liên tiếp (vd: init_data tạo 50 món) thành 1 lần gọi
+GATEWAY_CACHE_INVALIDATE_DELAY = float(os.getenv("GATEWAY_CACHE_INVALIDATE_DELAY", 0.05))
+
+
+class GatewayCache:
+    """Gửi POST /internal/cache/invalidate tới gateway, chạy nền, không làm chậm request ghi.
+
+    Gọi lỗi thì chỉ log: cache ở gateway vẫn tự hết hạn theo TTL của từng nhóm route.
+    """
+
+    def __init__(self, urls=GATEWAY_CACHE_URLS, token: str = INTERNAL_TOKEN):
+        self.urls = list(urls)
+        self.token = token
+        self._pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+
+    def invalidate(self, *prefixes: str):
+        if not self.urls:
+            return
+        self._pending.update(prefixes)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(GATEWAY_CACHE_INVALIDATE_DELAY)
+        prefixes, self._pending = sorted(self._pending), set()
+        for i, url in enumerate(self.urls):
+            client = resilience.client(f"gateway_cache_{i}", url, timeout=2.0)
+            try:
+                res = await client.post(
+                    "/internal/cache/invalidate",
+                    json={"prefixes": prefixes},
+                    headers={"X-Internal-Token": self.token},
+                    idempotent=True,  # xóa 2 lần cũng như 1 -> retry được
+                )
+                res.raise_for_status()
+                self.sent += 1
+            except httpx.HTTPError as e:
+                self.failed += 1
+                print(f"[gateway_cache] Không xóa được cache {prefixes} ở {url}: {e}")
+
+    def stats(self) -> dict:
+        return {"urls": self.urls, "sent": self.sent, "failed": self.failed, "pending": sorted(self._pending)}
+
+
+gateway_cache = GatewayCache()
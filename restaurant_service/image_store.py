@@ -0,0 +1,509 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+
+# --- CẤU HÌNH ---
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "local")  # local | s3 | fake-s3
+IMAGE_DIR = os.getenv("IMAGE_DIR", "static")  # thư mục ảnh (local) / nơi fake-s3 lưu object
+IMAGE_URL_PREFIX = "/static/"
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 5 * 1024 * 1024))
+# Ảnh hết người dùng (ref_count = 0) quá IMAGE_GC_GRACE giây mới bị xóa file
+IMAGE_GC_GRACE = float(os.getenv("IMAGE_GC_GRACE", 60))
+IMAGE_GC_INTERVAL = float(os.getenv("IMAGE_GC_INTERVAL", 300))
+# Quét cả kho tìm file không có dòng image_blobs (upload lỗi giữa chừng) - liệt kê S3 tốn nên thưa hơn gc
+IMAGE_ORPHAN_SCAN_INTERVAL = float(os.getenv("IMAGE_ORPHAN_SCAN_INTERVAL", 3600))
+S3_BUCKET = os.getenv("S3_BUCKET", "food-images")
+S3_PREFIX = os.getenv("S3_PREFIX", "images/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # MinIO / S3-compatible khác
+
+CHUNK_SIZE = 64 * 1024
+# Tên file theo nội dung: "<sha256>.<ext>" (ảnh gốc) hoặc "<sha256>.<size>.webp" (image_variants.py)
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.[a-z]+)+$")
+
+# Nhận dạng ảnh theo vài byte đầu (không tin đuôi file client gửi lên)
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+]
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+
+def sniff(head: bytes) -> Optional[Tuple[str, str]]:
+    """-> (đuôi file, content-type) hoặc None nếu không phải ảnh hỗ trợ."""
+    for magic, ext, content_type in _SIGNATURES:
+        if head.startswith(magic):
+            return ext, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def name_from_url(image_url: Optional[str]) -> Optional[str]:
+    if not image_url or not image_url.startswith(IMAGE_URL_PREFIX):
+        return None
+    return image_url[len(IMAGE_URL_PREFIX):].split("?", 1)[0] or None
+
+
+# ==========================================
+# STORAGE BACKEND (local FS / S3-compatible)
+# ==========================================
+class StorageBackend:
+    """Nơi chứa file ảnh. Tên file = "<sha256>.<ext>" nên 1 nội dung chỉ lưu 1 lần.
+
+    Các hàm đều blocking (I/O), gọi qua run_in_threadpool.
+    """
+
+    tmp_dir: Optional[str] = None  # nơi ghi file tạm khi upload
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, name: str, src_path: str, content_type: str):
+        """Đưa file tạm vào kho (file tạm có thể bị move đi)."""
+        raise NotImplementedError
+
+    def open(self, name: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def delete(self, name: str):
+        raise NotImplementedError
+
+    def scan(self) -> Iterator[Tuple[str, int, datetime]]:
+        """Mọi file trong kho: (tên, số byte, lần sửa cuối - giờ UTC không timezone)."""
+        raise NotImplementedError
+
+    def local_path(self, name: str) -> Optional[str]:
+        """Đường dẫn trên đĩa nếu backend là local (để serve thẳng bằng FileResponse)."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str = IMAGE_DIR):
+        self.root = root
+        self.tmp_dir = os.path.join(root, ".tmp")  # cùng ổ đĩa -> os.replace là atomic
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def local_path(self, name: str) -> str:
+        return os.path.join(self.root, os.path.basename(name))
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.local_path(name))
+
+    def put(self, name: str, src_path: str, content_type: str):
+        os.replace(src_path, self.local_path(name))
+
+    def open(self, name: str) -> BinaryIO:
+        return open(self.local_path(name), "rb")
+
+    def delete(self, name: str):
+        try:
+            os.remove(self.local_path(name))
+        except FileNotFoundError:
+            pass
+
+    def scan(self) -> Iterator[Tuple[str, int, datetime]]:
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    st = entry.stat()
+                    yield entry.name, st.st_size, datetime.utcfromtimestamp(st.st_mtime)
+
+
+class S3Storage(StorageBackend):
+    """`client` có API như boto3 S3 client (head_object, upload_file, get_object, delete_object)."""
+
+    def __init__(self, client, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, name: str, src_path: str, content_type: str):
+        self.client.upload_file(src_path, self.bucket, self._key(name), ExtraArgs={"ContentType": content_type})
+
+    def open(self, name: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"]
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def scan(self) -> Iterator[Tuple[str, int, datetime]]:
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            for obj in page.get("Contents", ()):
+                modified = obj["LastModified"]
+                if modified.tzinfo is not None:
+                    modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+                yield obj["Key"][len(self.prefix):], obj["Size"], modified
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """Giả lập (một phần) boto3 S3 client bằng thư mục local, dùng cho test / chạy không có S3."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise FakeS3Error("404")
+        return {"ContentLength": os.path.getsize(path)}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[dict] = None):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise FakeS3Error("NoSuchKey")
+        return {"Body": open(path, "rb")}
+
+    def delete_object(self, Bucket: str, Key: str):
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", **kwargs) -> dict:
+        root = self._path(Bucket, "")
+        contents = []
+        for dirpath, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, root).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    st = os.stat(path)
+                    contents.append({
+                        "Key": key, "Size": st.st_size,
+                        "LastModified": datetime.fromtimestamp(st.st_mtime, timezone.utc),
+                    })
+        return {"Contents": contents, "IsTruncated": False}
+
+
+def create_storage(kind: str = IMAGE_STORAGE) -> StorageBackend:
+    if kind == "s3":
+        import boto3  # chỉ cần cài khi dùng backend s3
+        return S3Storage(boto3.client("s3", endpoint_url=S3_ENDPOINT_URL))
+    if kind == "fake-s3":
+        return S3Storage(FakeS3Client(os.path.join(IMAGE_DIR, ".s3")))
+    return LocalStorage(IMAGE_DIR)
+
+
+# ==========================================
+# KHO ẢNH: upload (hash + dedupe) + đếm tham chiếu
+# ==========================================
+class StoredImage(NamedTuple):
+    name: str
+    size: int
+    content_type: str
+    tmp_path: Optional[str] = None  # ảnh trùng: giữ file tạm tới acquire() phòng gc vừa xóa file trong kho
+
+    @property
+    def url(self) -> str:
+        return IMAGE_URL_PREFIX + self.name
+
+
+def hash_file(src: BinaryIO, out: Optional[BinaryIO] = None, max_bytes: Optional[int] = None) -> Tuple[str, int, bytes]:
+    """Đọc từng chunk: tính sha256 (+ chép sang `out`). -> (hex digest, số byte, vài byte đầu)."""
+    digest = hashlib.sha256()
+    size, head = 0, b""
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest(), size, head
+        if len(head) < 16:
+            head += chunk[:16 - len(head)]
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise HTTPException(413, f"Ảnh quá lớn (tối đa {max_bytes // (1024 * 1024)}MB)")
+        digest.update(chunk)
+        if out is not None:
+            out.write(chunk)
+
+
+def iter_file(f: BinaryIO) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+class ImageStore:
+    """Ảnh món ăn lưu theo nội dung: "<sha256>.<ext>", ảnh giống hệt nhau chỉ lưu 1 file.
+
+    - save_upload(): đọc/hash/ghi file trong threadpool (không chặn event loop), giới hạn IMAGE_MAX_BYTES
+    - acquire()/release(): +/-1 ref_count trong bảng image_blobs, CÙNG transaction với thay đổi Food
+    - gc(): xóa file có ref_count = 0 quá IMAGE_GC_GRACE (chạy nền mỗi IMAGE_GC_INTERVAL), file trong kho
+      không có dòng image_blobs (upload lỗi trước acquire) được thêm dòng ref_count = 0 rồi dọn như trên
+    - variants (image_variants.py): sinh thumb/card/full lúc upload, xóa cùng ảnh gốc
+    """
+
+    def __init__(self, storage: StorageBackend, session_factory, model, variants=None,
+                 max_bytes: int = IMAGE_MAX_BYTES, gc_grace: float = IMAGE_GC_GRACE,
+                 gc_interval: float = IMAGE_GC_INTERVAL, orphan_scan_interval: float = IMAGE_ORPHAN_SCAN_INTERVAL):
+        self.storage = storage
+        self.variants = variants
+        self.session_factory = session_factory  # AsyncSessionLocal
+        self.model = model  # models.ImageBlob
+        self.max_bytes = max_bytes
+        self.gc_grace = timedelta(seconds=gc_grace)
+        self.gc_interval = gc_interval
+        self.orphan_scan_interval = orphan_scan_interval
+        self._last_scan = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.restored = 0
+        self.reclaimed = 0
+        self.orphan_files = 0
+
+    # --- UPLOAD ---
+    def _spool(self, src: BinaryIO) -> Tuple[str, str, int, Tuple[str, str]]:
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage.tmp_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                digest, size, head = hash_file(src, out, self.max_bytes)
+            kind = sniff(head)
+            if kind is None:
+                raise HTTPException(400, "Chỉ nhận ảnh JPG, PNG, GIF hoặc WEBP")
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest, size, kind
+
+    @staticmethod
+    def _discard(tmp_path: Optional[str]):
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def _store(self, src: BinaryIO) -> StoredImage:
+        tmp_path, digest, size, (ext, content_type) = self._spool(src)
+        name = f"{digest}.{ext}"
+        try:
+            if self.storage.exists(name):
+                self.deduplicated += 1
+                return StoredImage(name, size, content_type, tmp_path)
+            self.storage.put(name, tmp_path, content_type)
+            self.stored += 1
+        except BaseException:
+            self._discard(tmp_path)
+            raise
+        self._discard(tmp_path)
+        return StoredImage(name, size, content_type)
+
+    async def save_upload(self, upload: UploadFile) -> StoredImage:
+        if upload.size is not None and upload.size > self.max_bytes:
+            raise HTTPException(413, f"Ảnh quá lớn (tối đa {self.max_bytes // (1024 * 1024)}MB)")
+        image = await run_in_threadpool(self._store, upload.file)
+        if self.variants is not None:
+            await self.variants.ensure(image.name)
+        return image
+
+    # --- ĐẾM THAM CHIẾU (gọi trong transaction của endpoint, commit cùng Food) ---
+    def _upsert_stmt(self, dialect: str, values: dict):
+        M = self.model
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(M).values(**values)
+            return stmt.on_duplicate_key_update(ref_count=M.ref_count + 1, updated_at=stmt.inserted.updated_at)
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(M).values(**values)
+        return stmt.on_conflict_do_update(
+            index_elements=["name"], set_={"ref_count": M.ref_count + 1, "updated_at": stmt.excluded.updated_at}
+        )
+
+    def _ensure_file(self, image: StoredImage) -> bool:
+        """-> True nếu phải ghi lại file từ bản tạm."""
+        try:
+            if self.storage.exists(image.name):
+                return False
+            if image.tmp_path is None or not os.path.exists(image.tmp_path):
+                raise HTTPException(503, "Ảnh vừa bị dọn khỏi kho, vui lòng tải lên lại")
+            self.storage.put(image.name, image.tmp_path, image.content_type)
+            return True
+        finally:
+            self._discard(image.tmp_path)
+
+    async def acquire(self, db, image: StoredImage):
+        await db.execute(self._upsert_stmt(db.bind.dialect.name, {
+            "name": image.name, "size": image.size, "content_type": image.content_type,
+            "ref_count": 1, "updated_at": datetime.utcnow(),
+        }))
+        # Dòng đã bị khóa tới lúc commit -> gc() không xóa file được nữa. Kiểm tra lại file SAU upsert:
+        # gc có thể vừa xóa dòng + file ngay trước đó (upload thấy file còn nên không ghi) -> ghi lại từ bản tạm
+        if await run_in_threadpool(self._ensure_file, image):
+            self.restored += 1
+            if self.variants is not None:
+                self.variants.forget(image.name)
+
+    async def release(self, db, image_url: Optional[str]):
+        # Ảnh cũ (trước khi có image_blobs) không có dòng nào -> bỏ qua, dedupe_images.py sẽ xử lý
+        name = name_from_url(image_url)
+        if name:
+            M = self.model
+            await db.execute(
+                update(M).where(M.name == name, M.ref_count > 0)
+                .values(ref_count=M.ref_count - 1, updated_at=datetime.utcnow())
+            )
+
+    # --- DỌN ẢNH MỒ CÔI ---
+    def _delete_file(self, name: str):
+        self.storage.delete(name)
+        if self.variants is not None:
+            self.variants.delete(name)
+
+    def _old_files(self, cutoff: datetime) -> List[Tuple[str, int]]:
+        """Ảnh gốc trong kho sửa lần cuối trước cutoff (+ xóa file tạm .part bị bỏ lại)."""
+        if self.storage.tmp_dir and os.path.isdir(self.storage.tmp_dir):
+            for entry in os.scandir(self.storage.tmp_dir):
+                if entry.is_file() and datetime.utcfromtimestamp(entry.stat().st_mtime) < cutoff:
+                    self._discard(entry.path)
+        return [
+            (name, size) for name, size, modified in self.storage.scan()
+            if modified < cutoff and CONTENT_ADDRESSED.match(name) and name.count(".") == 1
+        ]
+
+    async def adopt_orphans(self, batch: int = 500) -> int:
+        """File không có dòng image_blobs -> thêm dòng ref_count = 0 (INSERT bỏ qua nếu đã có),
+        gc() xóa sau đó theo đúng đường có khóa dòng. acquire() chen vào thì ref_count thành 1, file được giữ."""
+        M = self.model
+        cutoff = datetime.utcnow() - self.gc_grace
+        files = await run_in_threadpool(self._old_files, cutoff)
+        adopted = 0
+        async with self.session_factory() as db:
+            dialect = db.bind.dialect.name
+            for i in range(0, len(files), batch):
+                chunk = dict(files[i:i + batch])
+                known = set((await db.scalars(select(M.name).where(M.name.in_(list(chunk))))).all())
+                for name, size in chunk.items():
+                    if name in known:
+                        continue
+                    values = {
+                        "name": name, "size": size, "ref_count": 0, "updated_at": cutoff,
+                        "content_type": CONTENT_TYPES.get(name.rsplit(".", 1)[-1], "application/octet-stream"),
+                    }
+                    if dialect == "mysql":
+                        from sqlalchemy.dialects.mysql import insert
+                        stmt = insert(M).values(**values).prefix_with("IGNORE")
+                    else:
+                        from sqlalchemy.dialects.sqlite import insert
+                        stmt = insert(M).values(**values).on_conflict_do_nothing()
+                    adopted += (await db.execute(stmt)).rowcount or 0
+                await db.commit()
+        self.orphan_files += adopted
+        return adopted
+
+    async def gc(self, limit: int = 500) -> int:
+        M = self.model
+        cutoff = datetime.utcnow() - self.gc_grace
+        reclaimed = 0
+        async with self.session_factory() as db:
+            names = (await db.scalars(
+                select(M.name).where(M.ref_count <= 0, M.updated_at < cutoff).limit(limit)
+            )).all()
+            for name in names:
+                # Xóa dòng (có điều kiện) rồi xóa file TRƯỚC khi commit: acquire() cùng ảnh phải chờ khóa dòng,
+                # xong thì thấy dòng đã mất -> tạo dòng mới + ghi lại file. Ai vừa acquire trước -> rowcount = 0, giữ file
+                result = await db.execute(delete(M).where(M.name == name, M.ref_count <= 0, M.updated_at < cutoff))
+                if not result.rowcount:
+                    await db.rollback()
+                    continue
+                try:
+                    await run_in_threadpool(self._delete_file, name)
+                except BaseException:
+                    await db.rollback()
+                    raise
+                await db.commit()
+                reclaimed += 1
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def start(self):
+        if self.variants is not None:
+            self.variants.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.variants is not None:
+            self.variants.stop()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                if time.monotonic() - self._last_scan >= self.orphan_scan_interval:
+                    self._last_scan = time.monotonic()
+                    await self.adopt_orphans()
+                await self.gc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[image_store] Lỗi dọn ảnh: {e}")
+
+    async def stats(self) -> dict:
+        from sqlalchemy import case, func
+        M = self.model
+        async with self.session_factory() as db:
+            blobs, total_bytes, orphans = (await db.execute(
+                select(func.count(M.name), func.sum(M.size), func.sum(case((M.ref_count <= 0, 1), else_=0)))
+            )).one()
+        return {
+            "storage": type(self.storage).__name__,
+            "blobs": blobs,
+            "bytes": int(total_bytes or 0),
+            "orphans": int(orphans or 0),
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "restored": self.restored,
+            "reclaimed": self.reclaimed,
+            "orphan_files": self.orphan_files,
+        }
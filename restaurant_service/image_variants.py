@@ -0,0 +1,131 @@
+import asyncio
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+# --- CẤU HÌNH ---
+# Các cỡ ảnh sinh sẵn: cạnh dài tối đa (px). Ảnh gốc nhỏ hơn thì giữ nguyên kích thước.
+VARIANTS = {"thumb": 160, "card": 480, "full": 1280}
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", 80))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", 2))
+
+
+def variant_name(name: str, size: str) -> str:
+    """"<sha256>.jpg" + "card" -> "<sha256>.card.webp" """
+    return f"{name.rsplit('.', 1)[0]}.{size}.webp"
+
+
+def render_variants(data: bytes, quality: int = IMAGE_VARIANT_QUALITY) -> Dict[str, bytes]:
+    """Chạy trong process con (Pillow tốn CPU, giữ GIL): ảnh gốc -> {size: bytes WebP}."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)  # ảnh chụp điện thoại bị xoay
+        original = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+        result = {}
+        for size, max_side in VARIANTS.items():
+            img = original.copy()
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "WEBP", quality=quality, method=4)
+            result[size] = out.getvalue()
+        return result
+
+
+class ImageVariants:
+    """Sinh ảnh thumb / card / full (WebP) cho ảnh gốc trong kho, dùng ProcessPoolExecutor.
+
+    Mỗi ảnh gốc chỉ render 1 lần dù nhiều request cùng hỏi (gộp vào 1 future).
+    """
+
+    def __init__(self, storage, max_workers: int = IMAGE_VARIANT_WORKERS):
+        self.storage = storage
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._ready = set()  # ảnh gốc đã đủ variant -> khỏi hỏi storage mỗi request
+        self.rendered = 0
+        self.failed = 0
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _read(self, name: str) -> bytes:
+        f = self.storage.open(name)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def _write(self, name: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage.tmp_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        try:
+            self.storage.put(name, tmp_path, "image/webp")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _missing(self, name: str) -> bool:
+        return not all(self.storage.exists(variant_name(name, size)) for size in VARIANTS)
+
+    async def _render(self, name: str) -> bool:
+        try:
+            if not await run_in_threadpool(self.storage.exists, name):
+                return False  # không có ảnh gốc -> /static trả 404
+            if not await run_in_threadpool(self._missing, name):
+                return True
+            data = await run_in_threadpool(self._read, name)
+            self.start()
+            variants = await asyncio.get_running_loop().run_in_executor(self._pool, render_variants, data)
+            for size, content in variants.items():
+                await run_in_threadpool(self._write, variant_name(name, size), content)
+            self.rendered += 1
+            return True
+        except Exception as e:
+            # Ảnh hỏng / định dạng lạ -> không có variant, /static trả ảnh gốc
+            self.failed += 1
+            print(f"[image_variants] Lỗi tạo ảnh cỡ nhỏ cho {name}: {e}")
+            return False
+
+    async def ensure(self, name: str) -> bool:
+        """Đảm bảo đủ các cỡ cho ảnh gốc `name`. False nếu không tạo được."""
+        if name in self._ready:
+            return True
+        future = self._inflight.get(name)
+        if future is None:
+            future = asyncio.ensure_future(self._render(name))
+            self._inflight[name] = future
+            future.add_done_callback(lambda _: self._inflight.pop(name, None))
+        ok = await asyncio.shield(future)
+        if ok:
+            self._ready.add(name)
+        return ok
+
+    def forget(self, name: str):
+        """Ảnh gốc vừa được ghi lại -> lần sau ensure() kiểm tra / render lại variant."""
+        self._ready.discard(name)
+
+    def delete(self, name: str):
+        self.forget(name)
+        for size in VARIANTS:
+            self.storage.delete(variant_name(name, size))
+
+    def stats(self) -> dict:
+        return {
+            "sizes": VARIANTS,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "inflight": len(self._inflight),
+        }
@@ -1,20 +1,91 @@
 import httpx
-import shutil
+import hmac
 import os
-import uuid
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, Request, File, UploadFile, Form
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response, File, UploadFile, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware # <--- THÊM CÁI NÀY
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import database, SessionLocal, AsyncSessionLocal, get_db, get_async_db, engine, Base
+from common.auth import verify_request
+from common.lifespan import service_lifespan
+from common.broker import create_broker
+from common.events import EventConsumer, replica_group, COUPON_CHANGED, FOOD_CHANGED
+from common.outbox import OutboxRelay, add_event
+from common.resilience import resilience
+from search import search_index
+from menu_cache import menu_cache, food_to_dict
+from gateway_cache import INTERNAL_TOKEN, gateway_cache
+from ratings import RatingAggregates, summary_to_dict, valid_score, BRANCH, FOOD
+from coupons import CouponIndex, CouponLimitReached, coupon_to_dict, normalize_code, to_naive_utc
+import coupons
+from image_store import CONTENT_ADDRESSED, CONTENT_TYPES, ImageStore, create_storage, iter_file
+from image_variants import VARIANTS, ImageVariants, variant_name
 import models
 from typing import List, Optional
 from pydantic import BaseModel 
+from sqlalchemy import and_, delete, exc, select
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# Điểm đánh giá cộng dồn theo món / quán (ratings.py)
+rating_aggregates = RatingAggregates(models.RatingSummary)
+
+def build_search_index():
+    db = SessionLocal()
+    try:
+        foods = db.query(models.Food).all()
+        branch_names = {b.id: b.name for b in db.query(models.Branch).all()}
+        # DB cũ chưa có rating_summaries -> tính 1 lần từ food_ratings / order_reviews
+        rating_aggregates.backfill_if_empty(db, models.OrderReview, models.FoodRating)
+        # Đọc thẳng rating_summaries, không GROUP BY cả bảng food_ratings
+        search_index.build(foods, branch_names, rating_aggregates.load_food_ratings(db))
+        print(f"Search index: {len(foods)} món")
+    finally:
+        db.close()
+
+# Kho ảnh: tên file = sha256 nội dung, đếm tham chiếu trong image_blobs (xem image_store.py)
+# + ảnh cỡ nhỏ WebP (thumb/card/full) sinh trong process pool (xem image_variants.py)
+image_storage = create_storage()
+image_store = ImageStore(image_storage, AsyncSessionLocal, models.ImageBlob, variants=ImageVariants(image_storage))
+
+# --- EVENT: FoodChanged qua outbox -> broker (order_service giữ cache giá từ event này) ---
+broker = create_broker()
+relay = OutboxRelay(AsyncSessionLocal, models.OutboxEvent, broker, source="restaurant_service")
+
+def add_food_event(db, food, deleted: bool = False):
+    add_event(db, models.OutboxEvent, FOOD_CHANGED, {
+        "food_id": food.id,
+        "branch_id": food.branch_id,
+        "version": food.version,
+        "deleted": deleted,
+        "food": None if deleted else food_to_dict(food),
+    }, aggregate_id=food.id)
+
+# --- COUPON: index (branch_id, code) trong RAM, đếm lượt dùng nguyên tử (xem coupons.py) ---
+# Mỗi replica 1 consumer group riêng (theo REPLICA_ID) -> replica nào cũng nhận đủ CouponChanged.
+# Group mới bắt đầu từ "$" (index tải từ DB lúc start), group của replica đã bỏ được dọn dần
+coupon_index = CouponIndex(SessionLocal, models.Coupon)
+coupon_consumer = EventConsumer(broker, replica_group("restaurant_coupons"), {COUPON_CHANGED: coupon_index.on_coupon_changed},
+                                start_id="$", stale_prefix="restaurant_coupons-")
+
+def add_coupon_event(db, coupon, deleted: bool = False):
+    add_event(db, models.OutboxEvent, COUPON_CHANGED, {
+        "coupon_id": coupon.id,
+        "branch_id": coupon.branch_id,
+        "version": coupon.version,
+        "deleted": deleted,
+        "coupon": None if deleted else coupon_to_dict(coupon),
+    }, aggregate_id=f"coupon:{coupon.id}")
+
+app = FastAPI(lifespan=service_lifespan(
+    database,
+    # coupon_consumer trước coupon_index: group tạo xong rồi mới tải index -> không lỡ event nào ở giữa
+    on_startup=[build_search_index, image_store.start, relay.start, coupon_consumer.start, coupon_index.start],
+    on_shutdown=[image_store.stop, broker.close, relay.stop, coupon_index.stop, coupon_consumer.stop],
+))
 
 # --- 1. CẤU HÌNH CORS (BẮT BUỘC ĐỂ FRONTEND GỌI ĐƯỢC) ---
 app.add_middleware(
@@ -25,31 +96,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- CẤU HÌNH THƯ MỤC ẢNH ---
-os.makedirs("static", exist_ok=True)
-# Mount đường dẫn /static để xem ảnh
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# --- ẢNH MÓN ĂN: /static/<tên file>?size=thumb|card|full ---
+# Tên file = hash nội dung -> không bao giờ đổi -> cache vĩnh viễn ở trình duyệt / gateway
+IMMUTABLE = "public, max-age=31536000, immutable"
 
-def get_db():
-    db = SessionLocal()
+async def serve_image(name: str, request: Request):
+    etag = f'"{name}"'
+    headers = {"Cache-Control": IMMUTABLE if CONTENT_ADDRESSED.match(name) else "public, max-age=86400", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    media_type = CONTENT_TYPES.get(name.rsplit(".", 1)[-1], "application/octet-stream")
+
+    path = image_storage.local_path(name)
+    if path is not None:
+        if not await run_in_threadpool(os.path.isfile, path):
+            raise HTTPException(404, "Not found")
+        return FileResponse(path, media_type=media_type, headers=headers)
+    # Ảnh nằm trên S3 -> đọc qua backend rồi stream về
     try:
-        yield db
-    finally:
-        db.close()
+        f = await run_in_threadpool(image_storage.open, name)
+    except Exception:
+        raise HTTPException(404, "Not found")
+    return StreamingResponse(iter_file(f), media_type=media_type, headers=headers)
+
+@app.get("/static/{name}")
+async def get_image(name: str, request: Request, size: Optional[str] = None):
+    name = os.path.basename(name)
+    # size chỉ áp dụng cho ảnh gốc ("<tên>.<ext>"), không có variant thì trả ảnh gốc
+    if size is not None and name.count(".") == 1:
+        if size not in VARIANTS:
+            raise HTTPException(400, f"size phải là một trong: {', '.join(VARIANTS)}")
+        if await image_store.variants.ensure(name):
+            name = variant_name(name, size)
+    return await serve_image(name, request)
 
 async def verify_user(request: Request):
-    token = request.headers.get("Authorization")
-    if not token: raise HTTPException(401, "Missing Token")
-    try:
-        async with httpx.AsyncClient() as client:
-            # Lưu ý: Nếu chạy local không qua docker thì sửa thành localhost:8001
-            # Nếu chạy Docker thì giữ nguyên user_service:8001
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200: raise HTTPException(401, "Invalid Token")
-            return res.json()
-    except Exception as e: 
-        print(f"Lỗi verify user: {e}")
-        raise HTTPException(401, "Token verification failed")
+    # Xác thực JWT tại chỗ (common/auth.py), chỉ hỏi User Service khi bật AUTH_REMOTE_VERIFY
+    return await verify_request(request)
 
 # --- API MÓN ĂN ---
 @app.post("/foods")
@@ -60,33 +143,37 @@ async def create_food(
     discount: int = Form(0),
     branch_id: int = Form(...), # Nhận thêm branch_id từ form cho chắc
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     user = await verify_user(request)
     if user['role'] != 'seller': raise HTTPException(403, "Only Seller")
     
-    # Logic lưu ảnh
+    # Logic lưu ảnh (hash + ghi file trong threadpool; ảnh trùng nội dung dùng lại file cũ)
     image_url = ""
     if image:
-        file_extension = image.filename.split(".")[-1]
-        file_name = f"{uuid.uuid4()}.{file_extension}"
-        file_path = f"static/{file_name}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        stored = await image_store.save_upload(image)
+        await image_store.acquire(db, stored)
         # Lưu đường dẫn tương đối
-        image_url = f"/static/{file_name}"
+        image_url = stored.url
 
     new_food = models.Food(
         name=name, 
         price=price, 
         branch_id=branch_id, # Dùng branch_id gửi lên hoặc từ user
         discount=discount,
-        image_url=image_url,
-        is_active=True
+        image_url=image_url
     )
     db.add(new_food)
-    db.commit()
-    db.refresh(new_food)
+    await db.flush()  # lấy id cho event, chưa commit
+    add_food_event(db, new_food)
+    await db.commit()
+    await db.refresh(new_food)
+    relay.wake()
+
+    branch = await db.get(models.Branch, new_food.branch_id)
+    search_index.upsert(new_food, branch.name if branch else None)
+    menu_cache.invalidate_food(new_food.id, new_food.branch_id)
+    gateway_cache.invalidate("/foods")
     return new_food
 
 @app.put("/foods/{food_id}")
@@ -97,11 +184,11 @@ async def update_food(
     price: float = Form(...),
     discount: int = Form(0),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     user = await verify_user(request)
     
-    food = db.query(models.Food).filter(models.Food.id == food_id).first()
+    food = await db.get(models.Food, food_id)
     if not food: raise HTTPException(404, "Food not found")
     
     # Cập nhật thông tin
@@ -110,37 +197,386 @@ async def update_food(
     food.discount = discount
 
     if image:
-        file_extension = image.filename.split(".")[-1]
-        file_name = f"{uuid.uuid4()}.{file_extension}"
-        file_path = f"static/{file_name}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        food.image_url = f"/static/{file_name}"
-    
-    db.commit()
-    db.refresh(food)
+        stored = await image_store.save_upload(image)
+        await image_store.acquire(db, stored)
+        await image_store.release(db, food.image_url)
+        food.image_url = stored.url
+
+    # Tăng version bằng SQL (2 lần sửa song song không ra cùng 1 version)
+    food.version = models.Food.version + 1
+    await db.flush()
+    await db.refresh(food)
+    add_food_event(db, food)
+    await db.commit()
+    await db.refresh(food)
+    relay.wake()
+    search_index.upsert(food)
+    menu_cache.invalidate_food(food.id, food.branch_id)
+    gateway_cache.invalidate("/foods")
     return food
 
 @app.delete("/foods/{food_id}")
-async def delete_food(food_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_food(food_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     user = await verify_user(request)
-    item = db.query(models.Food).filter(models.Food.id == food_id).first()
+    item = await db.get(models.Food, food_id)
     if not item: raise HTTPException(404, "Not found")
-    db.delete(item)
-    db.commit()
+    branch_id = item.branch_id
+    # Ảnh không còn món nào dùng sẽ được image_store.gc() xóa
+    await image_store.release(db, item.image_url)
+    item.version += 1
+    add_food_event(db, item, deleted=True)
+    await db.delete(item)
+    await db.commit()
+    relay.wake()
+    search_index.remove(food_id)
+    menu_cache.invalidate_food(food_id, branch_id)
+    gateway_cache.invalidate("/foods")
     return {"message": "Deleted"}
 
 # --- API LẤY MÓN ĂN (QUAN TRỌNG: PHẢI CÓ GET BY BRANCH) ---
+# Đọc qua menu_cache (xem menu_cache.py); có ETag/Last-Modified nên gateway/trình duyệt nhận được 304
+def load_food_dicts(db: Session, *conditions) -> List[dict]:
+    """Món kèm avg_rating / rating_count: LEFT JOIN rating_summaries theo khóa chính (không aggregate food_ratings).
+    Review mới -> POST /reviews xóa cache của các món được chấm."""
+    S = models.RatingSummary
+    rows = db.query(models.Food, S.count, S.score_sum)\
+             .outerjoin(S, and_(S.kind == FOOD, S.subject_id == models.Food.id))\
+             .filter(*conditions).all()
+    return [food_to_dict(f, (count or 0, score_sum or 0)) for f, count, score_sum in rows]
+
 @app.get("/foods/branch/{branch_id}")
-def get_foods_by_branch(branch_id: int, db: Session = Depends(get_db)):
-    foods = db.query(models.Food).filter(models.Food.branch_id == branch_id).all()
-    return foods
+def get_foods_by_branch(branch_id: int, request: Request, db: Session = Depends(get_db)):
+    def load():
+        return load_food_dicts(db, models.Food.branch_id == branch_id)
+    return menu_cache.branch_menu(branch_id, load).response(request)
+
+# --- TÌM KIẾM (inverted index trong RAM, xem search.py) ---
+# Kết quả gom theo tên món; tổng số nhóm trả về qua header X-Total-Count
+@app.get("/foods/search")
+def search_foods(
+    response: Response,
+    q: str = "",
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=100),
+):
+    results, total = search_index.search(q, page, size)
+    response.headers["X-Total-Count"] = str(total)
+    return results
+
+# Các quán đang bán 1 món (Shop -> bấm vào món để chọn quán)
+@app.get("/foods/options")
+def get_food_options(name: str):
+    return search_index.options(name)
+
+# Lấy nhiều món trong 1 query: /foods/batch?ids=1,2,3 (hoặc ?ids=1&ids=2)
+# Phải khai báo TRƯỚC /foods/{food_id} để "batch" không bị hiểu là food_id
+@app.get("/foods/batch")
+def get_foods_batch(ids: List[str] = Query(...), db: Session = Depends(get_db)):
+    try:
+        food_ids = {int(x) for raw in ids for x in raw.split(",") if x.strip()}
+    except ValueError:
+        raise HTTPException(400, "ids must be integers")
+    if not food_ids: return []
+    if len(food_ids) > 200: raise HTTPException(400, "Too many ids (max 200)")
+
+    def load(missing_ids):
+        return load_food_dicts(db, models.Food.id.in_(missing_ids))
+    return menu_cache.foods(sorted(food_ids), load)
 
 @app.get("/foods/{food_id}")
-def get_food_detail(food_id: int, db: Session = Depends(get_db)):
-    food = db.query(models.Food).filter(models.Food.id == food_id).first()
-    if not food: raise HTTPException(404, "Not found")
-    return food
+def get_food_detail(food_id: int, request: Request, db: Session = Depends(get_db)):
+    def load():
+        foods = load_food_dicts(db, models.Food.id == food_id)
+        return foods[0] if foods else None
+    entry = menu_cache.food(food_id, load)
+    if not entry: raise HTTPException(404, "Not found")
+    return entry.response(request)
+
+# Số ảnh / dung lượng / số lần upload trùng nội dung / số ảnh đã sinh variant
+@app.get("/metrics/images")
+async def image_metrics(): return {**await image_store.stats(), "variants": image_store.variants.stats()}
+
+# --- SNAPSHOT GIÁ MÓN + COUPON: order_service tải định kỳ để tính tiền không cần gọi lại (price_cache.py) ---
+@app.get("/catalog/snapshot")
+def get_catalog_snapshot(db: Session = Depends(get_db)):
+    foods = db.query(models.Food).all()
+    return {
+        "foods": [food_to_dict(f) for f in foods],
+        "coupons": [coupon_to_dict(c) for c in db.query(models.Coupon).all()],
+    }
+
+# --- API COUPON ---
+class CouponIn(BaseModel):
+    code: str
+    discount_percent: int
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    is_active: bool = True
+    usage_limit: Optional[int] = None     # tổng số lượt, None = không giới hạn
+    per_user_limit: Optional[int] = None  # số lượt mỗi user, None = không giới hạn
+    branch_id: Optional[int] = None       # SellerDashboard gửi qua query ?branch_id=
+
+def apply_coupon_fields(coupon, body: CouponIn):
+    if not body.code.strip(): raise HTTPException(400, "Thiếu mã giảm giá")
+    if not 0 < body.discount_percent <= 100: raise HTTPException(400, "discount_percent phải trong khoảng 1..100")
+    coupon.code = normalize_code(body.code)
+    coupon.discount_percent = body.discount_percent
+    coupon.start_date = to_naive_utc(body.start_date) or coupon.start_date or datetime.utcnow()
+    coupon.end_date = to_naive_utc(body.end_date)
+    coupon.is_active = body.is_active
+    coupon.usage_limit = body.usage_limit
+    coupon.per_user_limit = body.per_user_limit
+
+async def commit_coupon(db: AsyncSession, coupon, deleted: bool = False):
+    add_coupon_event(db, coupon, deleted=deleted)
+    try:
+        await db.commit()
+    except exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Mã giảm giá đã tồn tại ở chi nhánh này")
+    relay.wake()
+    gateway_cache.invalidate("/coupons")
+
+@app.get("/coupons")
+def get_coupons(branch_id: Optional[int] = None, db: Session = Depends(get_db)):
+    q = db.query(models.Coupon)
+    if branch_id is not None:
+        q = q.filter(models.Coupon.branch_id == branch_id)
+    return [coupon_to_dict(c) for c in q.order_by(models.Coupon.id.desc()).all()]
+
+# Kiểm tra mã: chỉ tra index trong RAM (Cart.jsx, order_service khi cache giá thiếu)
+@app.get("/coupons/verify")
+async def verify_coupon(code: str, branch_id: int):
+    coupon = coupon_index.verify(branch_id, code)
+    if coupon is None: raise HTTPException(404, "Mã giảm giá không hợp lệ hoặc đã hết hạn")
+    return coupon
+
+@app.post("/coupons")
+async def create_coupon(body: CouponIn, request: Request, branch_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    user = await verify_user(request)
+    if user['role'] != 'seller': raise HTTPException(403, "Only Seller")
+    branch_id = body.branch_id or branch_id
+    if branch_id is None: raise HTTPException(400, "Thiếu branch_id")
+
+    coupon = models.Coupon(branch_id=branch_id, used_count=0, version=1)
+    apply_coupon_fields(coupon, body)
+    db.add(coupon)
+    try:
+        await db.flush()  # lấy id cho event, chưa commit
+    except exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Mã giảm giá đã tồn tại ở chi nhánh này")
+    await commit_coupon(db, coupon)
+    coupon_index.apply(coupon.id, coupon.version, coupon_to_dict(coupon))
+    return coupon_to_dict(coupon)
+
+@app.put("/coupons/{coupon_id}")
+async def update_coupon(coupon_id: int, body: CouponIn, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await verify_user(request)
+    if user['role'] != 'seller': raise HTTPException(403, "Only Seller")
+    coupon = await db.get(models.Coupon, coupon_id)
+    if not coupon: raise HTTPException(404, "Coupon not found")
+
+    apply_coupon_fields(coupon, body)
+    coupon.version = models.Coupon.version + 1
+    try:
+        await db.flush()
+    except exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Mã giảm giá đã tồn tại ở chi nhánh này")
+    await db.refresh(coupon)
+    await commit_coupon(db, coupon)
+    coupon_index.apply(coupon.id, coupon.version, coupon_to_dict(coupon))
+    return coupon_to_dict(coupon)
+
+@app.delete("/coupons/{coupon_id}")
+async def delete_coupon(coupon_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await verify_user(request)
+    if user['role'] != 'seller': raise HTTPException(403, "Only Seller")
+    coupon = await db.get(models.Coupon, coupon_id)
+    if not coupon: raise HTTPException(404, "Coupon not found")
+
+    coupon.version += 1
+    # Lịch sử dùng mã đi cùng mã (khóa ngoại tới coupons)
+    await db.execute(delete(models.CouponUserCount).where(models.CouponUserCount.coupon_id == coupon_id))
+    await db.execute(delete(models.CouponUsage).where(models.CouponUsage.coupon_id == coupon_id))
+    await db.delete(coupon)
+    await commit_coupon(db, coupon, deleted=True)
+    coupon_index.apply(coupon_id, coupon.version, None)
+    return {"message": "Deleted"}
+
+# --- REDEEM: order_service gọi lúc checkout (không đi qua gateway) ---
+class RedeemIn(BaseModel):
+    code: str
+    branch_id: int
+    order_id: int
+    user_id: Optional[int] = None
+
+def require_internal(x_internal_token: str = Header("", alias="X-Internal-Token")):
+    if not INTERNAL_TOKEN or not hmac.compare_digest(x_internal_token, INTERNAL_TOKEN):
+        raise HTTPException(403, "Forbidden")
+
+@app.post("/coupons/redeem", dependencies=[Depends(require_internal)])
+async def redeem_coupon(body: RedeemIn, db: AsyncSession = Depends(get_async_db)):
+    # Gửi lại cùng order_id (retry) -> trả lại lượt đã ghi, không tính thêm
+    usage = await db.scalar(select(models.CouponUsage).where(models.CouponUsage.order_id == body.order_id))
+    if usage is not None:
+        return {"coupon_id": usage.coupon_id, "order_id": body.order_id, "already_redeemed": True}
+
+    cached = coupon_index.verify(body.branch_id, body.code)
+    if cached is None: raise HTTPException(409, "Mã giảm giá không hợp lệ, đã hết hạn hoặc hết lượt")
+    coupon = await db.get(models.Coupon, cached["id"])
+    if coupon is None: raise HTTPException(409, "Mã giảm giá không hợp lệ, đã hết hạn hoặc hết lượt")
+    try:
+        used_count = await coupons.redeem(db, models, coupon, body.user_id, body.order_id)
+        await db.commit()
+    except CouponLimitReached as e:
+        await db.rollback()
+        raise HTTPException(409, str(e))
+    except exc.IntegrityError:
+        await db.rollback()  # request khác cùng order_id vừa ghi xong
+        return {"coupon_id": cached["id"], "order_id": body.order_id, "already_redeemed": True}
+    coupon_index.note_used(coupon.id, used_count)
+    return {"coupon_id": coupon.id, "order_id": body.order_id, "used_count": used_count}
+
+# Trả lượt khi đơn không tạo được / bị hủy
+@app.delete("/coupons/redemptions/{order_id}", dependencies=[Depends(require_internal)])
+async def release_coupon(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    usage = await db.scalar(select(models.CouponUsage).where(models.CouponUsage.order_id == order_id))
+    if usage is None:
+        return {"released": False}
+    used_count = await coupons.release(db, models, usage)
+    await db.commit()
+    coupon_index.note_used(usage.coupon_id, used_count)
+    return {"released": True}
+
+# --- API ĐÁNH GIÁ ---
+class FoodScoreIn(BaseModel):
+    food_id: int
+    score: int
+
+class ReviewIn(BaseModel):
+    order_id: int
+    rating_general: int
+    comment: Optional[str] = None
+    branch_id: Optional[int] = None  # không gửi -> lấy theo quán của món
+    items: List[FoodScoreIn] = []
+
+@app.post("/reviews")
+async def create_review(body: ReviewIn, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await verify_user(request)
+    if not valid_score(body.rating_general) or not all(valid_score(i.score) for i in body.items):
+        raise HTTPException(400, "Điểm đánh giá phải từ 1 đến 5")
+
+    food_ids = sorted({i.food_id for i in body.items})
+    branch_of = dict((await db.execute(
+        select(models.Food.id, models.Food.branch_id).where(models.Food.id.in_(food_ids))
+    )).all()) if food_ids else {}
+    branch_id = body.branch_id or next(iter(branch_of.values()), None)
+    if branch_id is None: raise HTTPException(400, "Thiếu branch_id")
+    # Món đã bị xóa khỏi menu thì bỏ qua điểm món, vẫn giữ điểm chung của đơn
+    scores = [(i.food_id, i.score) for i in body.items if i.food_id in branch_of]
+
+    review = models.OrderReview(
+        user_id=user.get('id'),
+        user_name=(user.get('sub') or '').split('@')[0],  # sub = email, không lộ email ra API công khai
+        order_id=body.order_id,
+        branch_id=branch_id,
+        rating_general=body.rating_general,
+        comment=(body.comment or "")[:500],
+        details=[models.FoodRating(food_id=food_id, score=score) for food_id, score in scores],
+    )
+    db.add(review)
+    try:
+        await db.flush()
+    except exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Đơn hàng này đã được đánh giá")
+    # Cộng dồn điểm CÙNG transaction với review
+    await rating_aggregates.add(db, branch_id, body.rating_general, scores)
+    await db.commit()
+
+    for row in await rating_aggregates.get_many(db, FOOD, sorted({food_id for food_id, _ in scores})):
+        search_index.set_rating(row.subject_id, float(row.score_sum), row.count)
+    # Menu / chi tiết món mang avg_rating -> xóa cache các món vừa được chấm
+    for food_id in sorted({food_id for food_id, _ in scores}):
+        menu_cache.invalidate_food(food_id, branch_of[food_id])
+    gateway_cache.invalidate("/reviews")
+    if scores:
+        gateway_cache.invalidate("/foods")
+    return {"id": review.id, "order_id": review.order_id, "branch_id": branch_id}
+
+def review_page(q, limit: int, before_id: Optional[int], id_column):
+    if before_id is not None:
+        q = q.filter(id_column < before_id)
+    return q.order_by(id_column.desc()).limit(limit).all()
+
+# Điểm tổng hợp + các review mới nhất của quán (trang tiếp: before_id = id nhỏ nhất đã nhận)
+@app.get("/reviews/branch/{branch_id}")
+def get_branch_reviews(
+    branch_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    q = db.query(models.OrderReview).filter(models.OrderReview.branch_id == branch_id)
+    reviews = review_page(q, limit, before_id, models.OrderReview.id)
+    return {
+        "summary": summary_to_dict(db.get(models.RatingSummary, (BRANCH, branch_id))),
+        "reviews": [
+            {"id": r.id, "order_id": r.order_id, "user_name": r.user_name, "rating_general": r.rating_general,
+             "comment": r.comment, "created_at": r.created_at}
+            for r in reviews
+        ],
+    }
+
+# Điểm tổng hợp từng món của 1 quán (menu), 1 query theo khóa chính
+@app.get("/reviews/branch/{branch_id}/foods")
+def get_branch_food_ratings(branch_id: int, db: Session = Depends(get_db)):
+    S = models.RatingSummary
+    rows = db.query(S).join(models.Food, and_(S.kind == FOOD, S.subject_id == models.Food.id))\
+             .filter(models.Food.branch_id == branch_id).all()
+    return {str(row.subject_id): summary_to_dict(row) for row in rows}
+
+@app.get("/reviews/food/{food_id}")
+def get_food_reviews(
+    food_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    q = db.query(models.FoodRating, models.OrderReview)\
+          .join(models.OrderReview, models.FoodRating.review_id == models.OrderReview.id)\
+          .filter(models.FoodRating.food_id == food_id)
+    rows = review_page(q, limit, before_id, models.FoodRating.id)
+    return {
+        "summary": summary_to_dict(db.get(models.RatingSummary, (FOOD, food_id))),
+        "ratings": [
+            {"id": rating.id, "score": rating.score, "user_name": review.user_name,
+             "comment": review.comment, "created_at": review.created_at}
+            for rating, review in rows
+        ],
+    }
+
+# Outbox relay (FoodChanged / CouponChanged chờ gửi / đã gửi) + consumer CouponChanged của index
+@app.get("/metrics/events")
+async def event_metrics(): return {"outbox": await relay.stats(), "coupon_consumer": await coupon_consumer.stats()}
+
+# Index coupon: số mã, verify trúng / trượt, số lần tải lại
+@app.get("/metrics/coupons")
+def coupon_metrics(): return coupon_index.stats()
+
+# Số liệu hit/miss của menu cache (+ số lần báo gateway xóa cache)
+@app.get("/metrics/menu-cache")
+def menu_cache_metrics(): return {**menu_cache.stats(), "gateway": gateway_cache.stats()}
+
+# Số liệu pool kết nối DB
+@app.get("/metrics/db")
+def db_metrics(): return database.stats()
+
+# Breaker / retry / độ trễ các lần gọi gateway (xóa cache), user_service
+@app.get("/metrics/resilience")
+def resilience_metrics(): return resilience.stats()
 
 # --- CÁC API KHÁC GIỮ NGUYÊN (Search, Options, Branch...) ---
 # (Bạn giữ lại phần code Search, Options, Coupon bên dưới của file cũ nhé, 
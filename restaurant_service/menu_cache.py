@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Request, Response
+
+# --- CẤU HÌNH ---
+MENU_CACHE_BACKEND = os.getenv("MENU_CACHE_BACKEND", "memory")  # memory | redis | fake-redis
+MENU_CACHE_TTL = int(os.getenv("MENU_CACHE_TTL", 300))
+MENU_CACHE_MAX_SIZE = int(os.getenv("MENU_CACHE_MAX_SIZE", 5000))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+
+# ==========================================
+# BACKEND (chung 1 interface: get / get_many / set / delete)
+# ==========================================
+class CacheBackend:
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: str, ttl: int):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Bộ đếm không hết hạn / không bị LRU bỏ (generation của key cache, xem MenuCache)."""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU + TTL trong RAM của process."""
+
+    def __init__(self, max_size: int = MENU_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}  # 1 số / món hoặc quán, không tính vào max_size
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None:
+                return str(counter)
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisCacheBackend(CacheBackend):
+    """Dùng chung cache giữa nhiều replica. `client` là redis.Redis(decode_responses=True) hoặc FakeRedis."""
+
+    def __init__(self, client, prefix: str = "menu:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(self.prefix + key)
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set(self, key: str, value: str, ttl: int):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+
+def create_backend(kind: str = MENU_CACHE_BACKEND) -> CacheBackend:
+    if kind == "redis":
+        import redis  # chỉ cần cài khi dùng backend redis
+        return RedisCacheBackend(redis.Redis.from_url(REDIS_URL, decode_responses=True))
+    if kind == "fake-redis":
+        from common.fakeredis import FakeRedis
+        return RedisCacheBackend(FakeRedis())
+    return MemoryCacheBackend()
+
+
+# ==========================================
+# MENU CACHE
+# ==========================================
+def food_to_dict(food, rating: Optional[tuple] = None) -> dict:
+    """rating = (số lượt, tổng điểm) từ rating_summaries -> thêm avg_rating / rating_count (menu, chi tiết món)."""
+    data = {
+        "id": food.id,
+        "name": food.name,
+        "price": food.price,
+        "discount": food.discount,
+        "image_url": food.image_url,
+        "branch_id": food.branch_id,
+        "version": food.version,
+    }
+    if rating is not None:
+        count, score_sum = rating
+        data["avg_rating"] = round(score_sum / count, 1) if count else 0
+        data["rating_count"] = count
+    return data
+
+
+class CachedBody:
+    """Body JSON đã serialize sẵn + ETag/Last-Modified để trả 304."""
+
+    def __init__(self, body: str, etag: str, last_modified: float, generation: Optional[str] = None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.generation = generation  # generation của key lúc BẮT ĐẦU đọc DB
+
+    @classmethod
+    def from_data(cls, data, generation: Optional[str] = None) -> "CachedBody":
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+        return cls(body, etag, int(time.time()), generation)
+
+    def dumps(self) -> str:
+        return json.dumps({"b": self.body, "e": self.etag, "m": self.last_modified, "g": self.generation})
+
+    @classmethod
+    def loads(cls, raw: str) -> "CachedBody":
+        data = json.loads(raw)
+        return cls(data["b"], data["e"], data["m"], data.get("g"))
+
+    def response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Cache-Control": "public, max-age=0, must-revalidate",
+        }
+        if self._not_modified(request):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+    def _not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class MenuCache:
+    """Read-through cache cho menu theo chi nhánh và từng món; xóa đúng key khi món thay đổi.
+
+    Chống ghi đè dữ liệu cũ: mỗi key có 1 generation ("gen:<key>"), invalidate tăng generation.
+    Reader đọc generation CÙNG LÚC với giá trị (trước khi vào DB) và gắn nó vào body khi set;
+    body mang generation cũ (đọc DB trước khi món đổi, set sau khi đã invalidate) bị coi như miss.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = MENU_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @staticmethod
+    def branch_key(branch_id: int) -> str:
+        return f"branch:{branch_id}"
+
+    @staticmethod
+    def food_key(food_id: int) -> str:
+        return f"food:{food_id}"
+
+    @staticmethod
+    def _gen_key(key: str) -> str:
+        return f"gen:{key}"
+
+    def _lookup(self, keys: List[str]) -> List[tuple]:
+        """1 lần MGET cả giá trị lẫn generation -> [(CachedBody còn dùng được hoặc None, generation)]."""
+        raws = self.backend.get_many(keys + [self._gen_key(key) for key in keys])
+        result = []
+        for raw, generation in zip(raws[:len(keys)], raws[len(keys):]):
+            entry = CachedBody.loads(raw) if raw is not None else None
+            if entry is not None and entry.generation != generation:
+                self.stale += 1
+                entry = None
+            result.append((entry, generation))
+        return result
+
+    def _read_through(self, key: str, loader) -> Optional[CachedBody]:
+        [(entry, generation)] = self._lookup([key])
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        data = loader()
+        if data is None:
+            return None
+        entry = CachedBody.from_data(data, generation)
+        self.backend.set(key, entry.dumps(), self.ttl)
+        return entry
+
+    def branch_menu(self, branch_id: int, loader) -> CachedBody:
+        return self._read_through(self.branch_key(branch_id), loader)
+
+    def food(self, food_id: int, loader) -> Optional[CachedBody]:
+        return self._read_through(self.food_key(food_id), loader)
+
+    def foods(self, food_ids: Iterable[int], loader) -> List[dict]:
+        """Nhiều món 1 lúc: lấy từ cache, món thiếu thì load 1 lần bằng loader(ids_thiếu)."""
+        food_ids = list(food_ids)
+        found: Dict[int, dict] = {}
+        missing: Dict[int, Optional[str]] = {}  # food_id -> generation lúc đọc
+        for food_id, (entry, generation) in zip(food_ids, self._lookup([self.food_key(i) for i in food_ids])):
+            if entry is None:
+                missing[food_id] = generation
+            else:
+                found[food_id] = json.loads(entry.body)
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            for data in loader(list(missing)):
+                entry = CachedBody.from_data(data, missing.get(data["id"]))
+                self.backend.set(self.food_key(data["id"]), entry.dumps(), self.ttl)
+                found[data["id"]] = data
+        return [found[i] for i in food_ids if i in found]
+
+    def invalidate_food(self, food_id: int, branch_id: Optional[int] = None):
+        keys = [self.food_key(food_id)]
+        if branch_id is not None:
+            keys.append(self.branch_key(branch_id))
+        # Tăng generation trước: reader đang đọc DB dở sẽ không set được bản cũ đè lên
+        for key in keys:
+            self.backend.incr(self._gen_key(key))
+        self.backend.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                "stale": self.stale}
+
+
+menu_cache = MenuCache(create_backend())
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from database import Base
+from common.outbox import outbox_model
 import datetime
 
 class Branch(Base):
@@ -21,6 +22,11 @@ class Food(Base):
     discount = Column(Integer, default=0)
     
     image_url = Column(String(500), nullable=True) 
+
+    # Tăng mỗi lần sửa -> cache giá ở order_service bỏ qua event cũ / đến trễ
+    # DB cũ (create_all không sửa bảng đã có):
+    #   ALTER TABLE foods ADD COLUMN version INT NOT NULL DEFAULT 1;
+    version = Column(Integer, default=1, nullable=False)
     
     branch_id = Column(Integer, ForeignKey("branches.id"))
     branch = relationship("Branch", back_populates="foods")
@@ -39,6 +45,20 @@ class Coupon(Base):
     
     is_active = Column(Boolean, default=True)
 
+    # --- GIỚI HẠN LƯỢT DÙNG (NULL = không giới hạn) ---
+    # used_count tăng bằng UPDATE có điều kiện khi redeem (xem coupons.py), không COUNT(*) coupon_usages
+    # DB cũ (create_all không sửa bảng đã có):
+    #   ALTER TABLE coupons ADD COLUMN usage_limit INT NULL, ADD COLUMN per_user_limit INT NULL,
+    #     ADD COLUMN used_count INT NOT NULL DEFAULT 0, ADD COLUMN version INT NOT NULL DEFAULT 1;
+    #   CREATE UNIQUE INDEX ix_coupons_branch_code ON coupons (branch_id, code);
+    usage_limit = Column(Integer, nullable=True)
+    per_user_limit = Column(Integer, nullable=True)
+    used_count = Column(Integer, default=0, nullable=False)
+    # Tăng mỗi lần sửa -> index coupon ở các replica / cache giá order_service bỏ qua event cũ
+    version = Column(Integer, default=1, nullable=False)
+
+    __table_args__ = (Index("ix_coupons_branch_code", "branch_id", "code", unique=True),)
+
     branch = relationship("Branch", back_populates="coupons")
     # Quan hệ với bảng lịch sử dùng
     usages = relationship("CouponUsage", back_populates="coupon")
@@ -49,10 +69,23 @@ class CouponUsage(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True) # ID của User bên user_service
     coupon_id = Column(Integer, ForeignKey("coupons.id"))
+    # 1 đơn chỉ dùng 1 mã -> unique: order_service gửi lại redeem cùng order_id không bị tính 2 lần
+    #   ALTER TABLE coupon_usages ADD COLUMN order_id INT NULL, ADD UNIQUE INDEX ix_coupon_usages_order_id (order_id);
+    #   CREATE INDEX ix_coupon_usages_coupon_user ON coupon_usages (coupon_id, user_id);
+    order_id = Column(Integer, nullable=True, unique=True, index=True)
     used_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (Index("ix_coupon_usages_coupon_user", "coupon_id", "user_id"),)
     
     coupon = relationship("Coupon", back_populates="usages")
 
+# Bộ đếm lượt dùng theo user: 1 dòng / (coupon, user), tăng bằng UPDATE có điều kiện
+class CouponUserCount(Base):
+    __tablename__ = "coupon_user_counts"
+    coupon_id = Column(Integer, ForeignKey("coupons.id"), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
 # --- CÁC BẢNG REVIEW ---
 class OrderReview(Base):
     __tablename__ = "order_reviews"
@@ -75,10 +108,44 @@ class FoodRating(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     
-    review_id = Column(Integer, ForeignKey("order_reviews.id"))
+    # Index cho /reviews/food/{id} và rebuild_ratings.py
+    #   CREATE INDEX ix_food_ratings_review_id ON food_ratings (review_id);
+    #   CREATE INDEX ix_food_ratings_food_id ON food_ratings (food_id);
+    review_id = Column(Integer, ForeignKey("order_reviews.id"), index=True)
     parent_review = relationship("OrderReview", back_populates="details")
     
-    food_id = Column(Integer, ForeignKey("foods.id"))
+    food_id = Column(Integer, ForeignKey("foods.id"), index=True)
     score = Column(Integer)
     
-    food = relationship("Food", back_populates="reviews")
\ No newline at end of file
+    food = relationship("Food", back_populates="reviews")
+
+# --- TỔNG HỢP ĐÁNH GIÁ (cộng dồn cùng transaction với review, xem ratings.py) ---
+# 1 dòng / món (kind="food") hoặc / quán (kind="branch"): đọc điểm trung bình không cần quét food_ratings
+class RatingSummary(Base):
+    __tablename__ = "rating_summaries"
+
+    kind = Column(String(10), primary_key=True)  # "food" | "branch"
+    subject_id = Column(Integer, primary_key=True)  # food_id / branch_id
+    count = Column(Integer, default=0, nullable=False)
+    score_sum = Column(Integer, default=0, nullable=False)
+    # Phân bố số sao
+    star_1 = Column(Integer, default=0, nullable=False)
+    star_2 = Column(Integer, default=0, nullable=False)
+    star_3 = Column(Integer, default=0, nullable=False)
+    star_4 = Column(Integer, default=0, nullable=False)
+    star_5 = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# --- ẢNH MÓN ĂN (lưu theo nội dung, xem image_store.py) ---
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    name = Column(String(100), primary_key=True)  # "<sha256>.<ext>" = tên file trong kho ảnh
+    size = Column(Integer)
+    content_type = Column(String(50))
+    ref_count = Column(Integer, default=0, nullable=False)  # số món đang dùng ảnh này
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# --- EVENT: FoodChanged ghi CÙNG transaction với món, relay gửi lên broker (common/outbox.py) ---
+OutboxEvent = outbox_model(Base)
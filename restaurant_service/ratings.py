@@ -0,0 +1,125 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, exc, func, insert, select
+
+# --- ĐIỂM ĐÁNH GIÁ ---
+# rating_summaries giữ count / tổng điểm / số lượt theo từng mức sao cho mỗi món và mỗi quán,
+# cộng dồn CÙNG transaction với review -> điểm trung bình đọc 1 dòng theo khóa chính.
+# Lệch với food_ratings / order_reviews (sửa tay DB, import dữ liệu cũ) -> chạy rebuild_ratings.py
+FOOD = "food"
+BRANCH = "branch"
+STARS = (1, 2, 3, 4, 5)
+
+
+def valid_score(score) -> bool:
+    return isinstance(score, int) and score in STARS
+
+
+def summary_to_dict(row) -> dict:
+    count = row.count if row is not None else 0
+    score_sum = row.score_sum if row is not None else 0
+    return {
+        "count": count,
+        "avg_rating": round(score_sum / count, 1) if count else 0,
+        "histogram": {str(s): (getattr(row, f"star_{s}") if row is not None else 0) for s in STARS},
+    }
+
+
+class RatingAggregates:
+    """Cộng điểm vào rating_summaries bằng upsert (INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT)."""
+
+    def __init__(self, model):
+        self.model = model  # models.RatingSummary
+
+    def _upsert_stmt(self, dialect: str, kind: str, subject_id: int, scores: Counter):
+        M = self.model
+        values = {
+            "kind": kind, "subject_id": subject_id, "updated_at": datetime.utcnow(),
+            "count": sum(scores.values()), "score_sum": sum(s * n for s, n in scores.items()),
+            **{f"star_{s}": scores.get(s, 0) for s in STARS},
+        }
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert as dialect_insert
+            stmt = dialect_insert(M).values(**values)
+            new = stmt.inserted
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(M).values(**values)
+            new = stmt.excluded
+        inc = {
+            "count": M.count + new.count,
+            "score_sum": M.score_sum + new.score_sum,
+            "updated_at": new.updated_at,
+            **{f"star_{s}": getattr(M, f"star_{s}") + getattr(new, f"star_{s}") for s in STARS},
+        }
+        if dialect == "mysql":
+            return stmt.on_duplicate_key_update(**inc)
+        return stmt.on_conflict_do_update(index_elements=["kind", "subject_id"], set_=inc)
+
+    async def add(self, db, branch_id: Optional[int], branch_score: int, food_scores: Iterable[Tuple[int, int]]):
+        """Gọi trong transaction của POST /reviews: 1 upsert / quán + 1 upsert / món."""
+        dialect = db.bind.dialect.name
+        per_food: Dict[int, Counter] = {}
+        for food_id, score in food_scores:
+            per_food.setdefault(food_id, Counter())[score] += 1
+        if branch_id is not None:
+            await db.execute(self._upsert_stmt(dialect, BRANCH, branch_id, Counter({branch_score: 1})))
+        # Thứ tự khóa cố định -> 2 review song song không deadlock
+        for food_id in sorted(per_food):
+            await db.execute(self._upsert_stmt(dialect, FOOD, food_id, per_food[food_id]))
+
+    async def get_many(self, db, kind: str, subject_ids: List[int]):
+        if not subject_ids:
+            return []
+        M = self.model
+        stmt = select(M).where(M.kind == kind, M.subject_id.in_(subject_ids))\
+                        .execution_options(populate_existing=True)
+        return (await db.execute(stmt)).scalars().all()
+
+    def load_food_ratings(self, db) -> Dict[int, Tuple[float, int]]:
+        """food_id -> (tổng điểm, số lượt) cho search index (sync Session)."""
+        M = self.model
+        return {
+            subject_id: (float(score_sum), count)
+            for subject_id, score_sum, count in db.query(M.subject_id, M.score_sum, M.count).filter(M.kind == FOOD)
+        }
+
+    def rebuild(self, db, review_model, food_rating_model) -> Tuple[int, int]:
+        """Tính lại toàn bộ từ order_reviews / food_ratings (sync Session, người gọi commit). -> (số món, số quán)."""
+        M, R, F = self.model, review_model, food_rating_model
+        stars = [func.sum(case((F.score == s, 1), else_=0)) for s in STARS]
+        food_rows = db.query(F.food_id, func.count(F.id), func.sum(F.score), *stars)\
+                      .filter(F.food_id.isnot(None), F.score.in_(STARS)).group_by(F.food_id).all()
+        stars = [func.sum(case((R.rating_general == s, 1), else_=0)) for s in STARS]
+        branch_rows = db.query(R.branch_id, func.count(R.id), func.sum(R.rating_general), *stars)\
+                        .filter(R.branch_id.isnot(None), R.rating_general.in_(STARS)).group_by(R.branch_id).all()
+
+        now = datetime.utcnow()
+        rows = [
+            {"kind": kind, "subject_id": row[0], "count": row[1], "score_sum": int(row[2] or 0), "updated_at": now,
+             **{f"star_{s}": int(row[2 + s] or 0) for s in STARS}}
+            for kind, result in ((FOOD, food_rows), (BRANCH, branch_rows)) for row in result
+        ]
+        db.execute(delete(M))
+        if rows:
+            db.execute(insert(M), rows)
+        return len(food_rows), len(branch_rows)
+
+    def backfill_if_empty(self, db, review_model, food_rating_model) -> bool:
+        """DB có từ trước khi có rating_summaries: bảng rỗng nhưng đã có review -> rebuild 1 lần lúc start
+        (không thì mọi điểm trung bình về 0). -> True nếu đã backfill."""
+        M, R, F = self.model, review_model, food_rating_model
+        if db.query(M.kind).first() is not None:
+            return False
+        if db.query(F.id).first() is None and db.query(R.id).filter(R.branch_id.isnot(None)).first() is None:
+            return False
+        try:
+            foods, branches = self.rebuild(db, R, F)
+            db.commit()
+        except exc.IntegrityError:
+            db.rollback()  # replica khác vừa backfill xong
+            return False
+        print(f"⭐ Backfill rating_summaries: {foods} món, {branches} quán")
+        return True
@@ -0,0 +1,49 @@
+"""Tính lại rating_summaries (điểm tổng hợp theo món / quán) từ order_reviews + food_ratings.
+
+Chạy trong container restaurant_service (cùng biến môi trường DB):
+    python rebuild_ratings.py            # chỉ so sánh, không đổi gì
+    python rebuild_ratings.py --apply    # xóa + ghi lại toàn bộ rating_summaries
+
+Dùng sau khi import dữ liệu cũ / sửa tay bảng review. Review gửi vào đúng lúc đang ghi lại
+có thể bị tính thiếu -> nên chạy lúc ít người dùng. Sau khi --apply nên restart
+restaurant_service (search index còn giữ điểm cũ).
+"""
+import argparse
+
+from database import SessionLocal, engine, Base
+from ratings import BRANCH, FOOD, RatingAggregates
+import models
+
+
+def snapshot(db):
+    S = models.RatingSummary
+    return {(r.kind, r.subject_id): (r.count, r.score_sum) for r in db.query(S).all()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="ghi thay đổi (mặc định chỉ so sánh)")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        before = snapshot(db)
+        foods, branches = RatingAggregates(models.RatingSummary).rebuild(db, models.OrderReview, models.FoodRating)
+        after = snapshot(db)
+        if args.apply:
+            db.commit()
+        else:
+            db.rollback()
+        changed = [key for key in before.keys() | after.keys() if before.get(key) != after.get(key)]
+        print(f"⭐ {foods} món, {branches} quán có đánh giá; lệch so với hiện tại: {len(changed)}")
+        for kind, subject_id in sorted(changed)[:20]:
+            label = "Món" if kind == FOOD else "Quán" if kind == BRANCH else kind
+            print(f"   {label} {subject_id}: {before.get((kind, subject_id))} -> {after.get((kind, subject_id))}")
+        print("✅ Đã ghi lại rating_summaries" if args.apply else "ℹ️ Chạy lại với --apply để ghi")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Dict, List, Optional, Set, Tuple
+
+# --- CHUẨN HÓA TIẾNG VIỆT ---
+# "Phở Bò Đặc Biệt" -> "pho bo dac biet" để tìm không dấu vẫn ra
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Từ khóa ngắn hơn mức này chỉ khớp nguyên từ (tránh "b" bung ra gần như toàn bộ index)
+MIN_PREFIX_LEN = 2
+
+
+def normalize(text: str) -> str:
+    text = (text or "").lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    return normalize(text).split()
+
+
+class FoodDoc:
+    __slots__ = ("id", "name", "price", "discount", "final_price",
+                 "branch_id", "image_url")
+
+    def __init__(self, food):
+        self.id = food.id
+        self.name = food.name or ""
+        self.price = food.price or 0
+        self.discount = food.discount or 0
+        self.final_price = self.price * (1 - self.discount / 100)
+        self.branch_id = food.branch_id
+        self.image_url = food.image_url
+
+
+class FoodGroup:
+    """Các món cùng tên ở nhiều quán = 1 dòng trên màn hình Shop."""
+
+    __slots__ = ("name", "key", "tokens", "food_ids", "min_price", "max_price",
+                 "image_url", "branch_count", "rating_sum", "rating_count", "order")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key = normalize(name)
+        self.tokens = set(self.key.split())
+        self.food_ids: Set[int] = set()
+
+    def refresh(self, docs: Dict[int, FoodDoc], ratings: Dict[int, Tuple[float, int]]):
+        members = [docs[fid] for fid in self.food_ids]
+        self.min_price = min(d.final_price for d in members)
+        self.max_price = max(d.final_price for d in members)
+        self.image_url = next((d.image_url for d in members if d.image_url), None)
+        self.branch_count = len({d.branch_id for d in members})
+        self.rating_sum = sum(ratings.get(d.id, (0.0, 0))[0] for d in members)
+        self.rating_count = sum(ratings.get(d.id, (0.0, 0))[1] for d in members)
+        # Khóa sắp xếp phụ (sau độ khớp): rating cao trước, rẻ trước, rồi theo tên
+        self.order = (-self.avg_rating, self.min_price, self.name)
+
+    @property
+    def avg_rating(self) -> float:
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0
+
+    def to_dict(self, score: float) -> dict:
+        return {
+            "name": self.name,
+            "image_url": self.image_url,
+            "score": score,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "avg_rating": self.avg_rating,
+            "review_count": self.rating_count,
+            "branch_count": self.branch_count,
+        }
+
+
+class FoodSearchIndex:
+    """Inverted index trong RAM cho tên món ăn.
+
+    - index theo nhóm tên món (giống màn hình Shop): token -> tập tên món,
+      cộng danh sách token đã sắp xếp để tìm theo tiền tố (typeahead)
+    - build 1 lần lúc startup, sau đó cập nhật từng món khi create/update/delete
+    - xếp hạng theo độ khớp, rating rồi giá; chỉ sắp xếp đủ số dòng của trang cần lấy
+    """
+
+    def __init__(self, result_cache_size: int = 256):
+        self._lock = threading.RLock()
+        self.docs: Dict[int, FoodDoc] = {}
+        self.groups: Dict[str, FoodGroup] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.sorted_tokens: List[str] = []
+        self.branch_names: Dict[int, str] = {}
+        self.ratings: Dict[int, Tuple[float, int]] = {}  # food_id -> (tổng điểm, số lượt)
+        self.version = 0
+        self._result_cache: "OrderedDict[Tuple[str, int], Tuple[int, list, int]]" = OrderedDict()
+        self._result_cache_size = result_cache_size
+
+    # --- GHI ---
+    def build(self, foods, branch_names: Dict[int, str], ratings: Dict[int, Tuple[float, int]]):
+        with self._lock:
+            self.docs.clear()
+            self.groups.clear()
+            self.postings.clear()
+            self.sorted_tokens = []
+            self.branch_names = dict(branch_names)
+            self.ratings = dict(ratings)
+            touched = set()
+            for food in foods:
+                touched.add(self._add(FoodDoc(food)))
+            for name in touched:
+                self.groups[name].refresh(self.docs, self.ratings)
+            self.sorted_tokens = sorted(self.postings)
+            self._changed()
+
+    def upsert(self, food, branch_name: Optional[str] = None):
+        with self._lock:
+            if branch_name is not None:
+                self.branch_names[food.branch_id] = branch_name
+            self._remove(food.id)
+            name = self._add(FoodDoc(food), keep_sorted=True)
+            self.groups[name].refresh(self.docs, self.ratings)
+            self._changed()
+
+    def remove(self, food_id: int):
+        with self._lock:
+            self._remove(food_id)
+            self._changed()
+
+    def set_rating(self, food_id: int, score_sum: float, count: int):
+        with self._lock:
+            self.ratings[food_id] = (score_sum, count)
+            doc = self.docs.get(food_id)
+            if doc is not None:
+                self.groups[doc.name].refresh(self.docs, self.ratings)
+            self._changed()
+
+    def _add(self, doc: FoodDoc, keep_sorted: bool = False) -> str:
+        self.docs[doc.id] = doc
+        group = self.groups.get(doc.name)
+        if group is None:
+            group = self.groups[doc.name] = FoodGroup(doc.name)
+            for token in group.tokens:
+                names = self.postings.get(token)
+                if names is None:
+                    names = self.postings[token] = set()
+                    if keep_sorted:
+                        insort(self.sorted_tokens, token)
+                names.add(doc.name)
+        group.food_ids.add(doc.id)
+        return doc.name
+
+    def _remove(self, food_id: int):
+        doc = self.docs.pop(food_id, None)
+        if doc is None:
+            return
+        group = self.groups[doc.name]
+        group.food_ids.discard(food_id)
+        if group.food_ids:
+            group.refresh(self.docs, self.ratings)
+            return
+        del self.groups[doc.name]
+        for token in group.tokens:
+            names = self.postings.get(token)
+            if names is None:
+                continue
+            names.discard(doc.name)
+            if not names:
+                del self.postings[token]
+                pos = bisect_left(self.sorted_tokens, token)
+                if pos < len(self.sorted_tokens) and self.sorted_tokens[pos] == token:
+                    self.sorted_tokens.pop(pos)
+
+    def _changed(self):
+        self.version += 1
+        self._result_cache.clear()
+
+    # --- ĐỌC ---
+    def _match_token(self, token: str) -> Dict[str, float]:
+        """tên món -> điểm: khớp nguyên từ = 2, khớp tiền tố = 1."""
+        scores: Dict[str, float] = {}
+        exact = self.postings.get(token)
+        if len(token) < MIN_PREFIX_LEN:
+            return dict.fromkeys(exact, 2.0) if exact else {}
+        pos = bisect_left(self.sorted_tokens, token)
+        while pos < len(self.sorted_tokens) and self.sorted_tokens[pos].startswith(token):
+            candidate = self.sorted_tokens[pos]
+            if candidate != token:
+                scores.update(dict.fromkeys(self.postings[candidate], 1.0))
+            pos += 1
+        if exact:
+            scores.update(dict.fromkeys(exact, 2.0))
+        return scores
+
+    def _relevance(self, tokens: List[str]) -> Dict[str, float]:
+        # AND: món phải khớp mọi từ trong câu tìm kiếm
+        relevance: Optional[Dict[str, float]] = None
+        for token in tokens:
+            matched = self._match_token(token)
+            if relevance is None:
+                relevance = matched
+            else:
+                relevance = {name: s + matched[name] for name, s in relevance.items() if name in matched}
+            if not relevance:
+                return {}
+        phrase = " ".join(tokens)
+        for name in relevance:
+            key = self.groups[name].key
+            if key == phrase:
+                relevance[name] += 4
+            elif key.startswith(phrase):
+                relevance[name] += 2
+        return relevance
+
+    def search(self, query: str, page: int = 1, size: int = 20) -> Tuple[list, int]:
+        tokens = tokenize(query)
+        limit = page * size
+        cache_key = (" ".join(tokens), limit)
+        with self._lock:
+            cached = self._result_cache.get(cache_key)
+            if cached is not None and cached[0] == self.version:
+                self._result_cache.move_to_end(cache_key)
+                _, top, total = cached
+            else:
+                groups = self.groups
+                if tokens:
+                    relevance = self._relevance(tokens)
+                    top = heapq.nsmallest(
+                        limit, relevance.items(),
+                        key=lambda item: (-item[1], groups[item[0]].order),
+                    )
+                    top = [groups[name].to_dict(score) for name, score in top]
+                    total = len(relevance)
+                else:
+                    # Không có từ khóa: chỉ xếp theo rating/giá
+                    top = heapq.nsmallest(limit, groups.values(), key=attrgetter("order"))
+                    top = [group.to_dict(0.0) for group in top]
+                    total = len(groups)
+                self._result_cache[cache_key] = (self.version, top, total)
+                if len(self._result_cache) > self._result_cache_size:
+                    self._result_cache.popitem(last=False)
+        return top[limit - size:], total
+
+    def options(self, name: str) -> list:
+        """Các quán đang bán món có tên `name` (so khớp không dấu)."""
+        key = normalize(name)
+        tokens = key.split()
+        with self._lock:
+            if not tokens:
+                return []
+            names = set(self.postings.get(tokens[0], ()))
+            for token in tokens[1:]:
+                names &= self.postings.get(token, set())
+            results = []
+            for group_name in names:
+                group = self.groups[group_name]
+                if group.key != key:
+                    continue
+                for food_id in group.food_ids:
+                    doc = self.docs[food_id]
+                    score_sum, count = self.ratings.get(food_id, (0.0, 0))
+                    results.append({
+                        "food_id": doc.id,
+                        "name": doc.name,
+                        "branch_id": doc.branch_id,
+                        "branch_name": self.branch_names.get(doc.branch_id, ""),
+                        "image_url": doc.image_url,
+                        "price": doc.price,
+                        "discount": doc.discount,
+                        "final_price": doc.final_price,
+                        "avg_rating": round(score_sum / count, 1) if count else 0,
+                        "review_count": count,
+                    })
+        results.sort(key=lambda o: (o["final_price"], -o["avg_rating"]))
+        return results
+
+
+search_index = FoodSearchIndex()
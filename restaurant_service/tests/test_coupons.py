@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from coupons import CouponLimitReached, redeem, release
+import models
+
+
+async def make_coupon(**limits) -> int:
+    async with AsyncSessionLocal() as db:
+        coupon = models.Coupon(code="GIAM10", discount_percent=10, branch_id=1, used_count=0, **limits)
+        db.add(coupon)
+        await db.commit()
+        return coupon.id
+
+
+async def try_redeem(coupon_id: int, user_id, order_id: int):
+    """Như endpoint /coupons/redeem: hết lượt -> rollback. -> used_count mới hoặc None."""
+    async with AsyncSessionLocal() as db:
+        coupon = await db.get(models.Coupon, coupon_id)
+        try:
+            used = await redeem(db, models, coupon, user_id, order_id)
+        except CouponLimitReached:
+            await db.rollback()
+            return None
+        await db.commit()
+        return used
+
+
+async def counters(coupon_id: int):
+    async with AsyncSessionLocal() as db:
+        used = await db.scalar(select(models.Coupon.used_count).where(models.Coupon.id == coupon_id))
+        per_user = dict((await db.execute(
+            select(models.CouponUserCount.user_id, models.CouponUserCount.count)
+            .where(models.CouponUserCount.coupon_id == coupon_id)
+        )).all())
+        usages = len((await db.scalars(
+            select(models.CouponUsage).where(models.CouponUsage.coupon_id == coupon_id)
+        )).all())
+    return used, per_user, usages
+
+
+def test_usage_limit(run):
+    async def scenario():
+        coupon_id = await make_coupon(usage_limit=2)
+        results = [await try_redeem(coupon_id, user_id, order_id) for order_id, user_id in enumerate((1, 2, 3), 1)]
+        return results, await counters(coupon_id)
+
+    results, (used, per_user, usages) = run(scenario())
+    assert results == [1, 2, None]
+    # Lượt bị từ chối không để lại dấu vết (kể cả bộ đếm của user 3 đã tăng dở)
+    assert (used, per_user, usages) == (2, {1: 1, 2: 1}, 2)
+
+
+def test_per_user_limit(run):
+    async def scenario():
+        coupon_id = await make_coupon(per_user_limit=2)
+        results = [await try_redeem(coupon_id, user_id, order_id) for order_id, user_id in enumerate((7, 7, 7, 8), 1)]
+        return results, await counters(coupon_id)
+
+    results, (used, per_user, usages) = run(scenario())
+    assert results == [1, 2, None, 3]
+    assert (used, per_user, usages) == (3, {7: 2, 8: 1}, 3)
+
+
+def test_per_user_limit_zero_rejects_everyone(run):
+    async def scenario():
+        coupon_id = await make_coupon(per_user_limit=0)
+        return await try_redeem(coupon_id, 1, 1), await counters(coupon_id)
+
+    assert run(scenario()) == (None, (0, {}, 0))
+
+
+def test_guest_redeem_skips_per_user_counter(run):
+    async def scenario():
+        coupon_id = await make_coupon(per_user_limit=1)
+        results = [await try_redeem(coupon_id, None, order_id) for order_id in (1, 2)]
+        return results, await counters(coupon_id)
+
+    assert run(scenario()) == ([1, 2], (2, {}, 2))
+
+
+def test_concurrent_redeems_never_exceed_limit(run):
+    async def scenario():
+        coupon_id = await make_coupon(usage_limit=3)
+        results = await asyncio.gather(*(try_redeem(coupon_id, user_id, user_id) for user_id in range(1, 11)))
+        return results, await counters(coupon_id)
+
+    results, (used, per_user, usages) = run(scenario())
+    assert sorted(r for r in results if r is not None) == [1, 2, 3]
+    assert used == 3 and usages == 3 and sum(per_user.values()) == 3
+
+
+def test_release_gives_back_both_counters(run):
+    async def scenario():
+        coupon_id = await make_coupon(usage_limit=1, per_user_limit=1)
+        await try_redeem(coupon_id, 5, 1)
+        async with AsyncSessionLocal() as db:
+            usage = await db.scalar(select(models.CouponUsage).where(models.CouponUsage.order_id == 1))
+            used = await release(db, models, usage)
+            await db.commit()
+        return used, await counters(coupon_id), await try_redeem(coupon_id, 5, 2)
+
+    used, after_release, redeemed_again = run(scenario())
+    assert used == 0
+    assert after_release == (0, {5: 0}, 0)
+    assert redeemed_again == 1
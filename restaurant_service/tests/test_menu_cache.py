@@ -0,0 +1,112 @@
+import pytest
+from starlette.requests import Request
+
+from common.fakeredis import FakeRedis
+from menu_cache import MemoryCacheBackend, MenuCache, RedisCacheBackend
+
+BACKENDS = {
+    "memory": lambda: MemoryCacheBackend(max_size=100),
+    "redis": lambda: RedisCacheBackend(FakeRedis()),
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def cache(request):
+    return MenuCache(BACKENDS[request.param](), ttl=300)
+
+
+class Db:
+    """Giả lập bảng foods: loader đếm số lần đọc, `during_load` chạy giữa lúc đang đọc (writer chen vào)."""
+
+    def __init__(self):
+        self.foods = {1: {"id": 1, "name": "Phở", "price": 40, "branch_id": 7}}
+        self.loads = 0
+        self.during_load = None
+
+    def food(self, food_id):
+        self.loads += 1
+        data = dict(self.foods[food_id]) if food_id in self.foods else None
+        if self.during_load is not None:
+            hook, self.during_load = self.during_load, None
+            hook()
+        return data
+
+    def menu(self, branch_id):
+        return [self.food(i) for i, f in sorted(self.foods.items()) if f["branch_id"] == branch_id]
+
+
+def update_price(db, cache, price):
+    db.foods[1]["price"] = price
+    cache.invalidate_food(1, 7)
+
+
+def request(**headers):
+    return Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_read_through_hits_after_first_load(cache):
+    db = Db()
+    assert cache.food(1, lambda: db.food(1)).body == cache.food(1, lambda: db.food(1)).body
+    assert db.loads == 1 and cache.hits == 1 and cache.misses == 1
+
+
+def test_missing_food_is_not_cached(cache):
+    db = Db()
+    assert cache.food(9, lambda: db.food(9)) is None
+    assert cache.food(9, lambda: db.food(9)) is None
+    assert db.loads == 2
+
+
+def test_invalidate_drops_food_and_branch_menu(cache):
+    db = Db()
+    cache.food(1, lambda: db.food(1))
+    cache.branch_menu(7, lambda: db.menu(7))
+    update_price(db, cache, 45)
+    assert '"price":45' in cache.food(1, lambda: db.food(1)).body
+    assert '"price":45' in cache.branch_menu(7, lambda: db.menu(7)).body
+
+
+def test_stale_load_racing_an_update_is_not_served(cache):
+    db = Db()
+    # Reader đọc giá cũ, writer commit + invalidate TRƯỚC khi reader kịp set vào cache
+    db.during_load = lambda: update_price(db, cache, 45)
+    assert '"price":40' in cache.food(1, lambda: db.food(1)).body
+    assert '"price":45' in cache.food(1, lambda: db.food(1)).body
+    assert cache.stale == 1
+
+    db.during_load = lambda: update_price(db, cache, 50)
+    cache.branch_menu(7, lambda: db.menu(7))
+    assert '"price":50' in cache.branch_menu(7, lambda: db.menu(7)).body
+
+
+def test_foods_batch_respects_generation(cache):
+    db = Db()
+    db.foods[2] = {"id": 2, "name": "Bún", "price": 30, "branch_id": 7}
+
+    def load(ids):
+        return [db.food(i) for i in ids]
+
+    db.during_load = lambda: update_price(db, cache, 45)
+    assert [f["price"] for f in cache.foods([1, 2], load)] == [40, 30]
+    assert [f["price"] for f in cache.foods([1, 2], load)] == [45, 30]
+    assert [f["price"] for f in cache.foods([1, 2], load)] == [45, 30]
+    assert db.loads == 3  # lần 2 chỉ đọc lại món 1, lần 3 toàn hit
+
+
+def test_etag_returns_304(cache):
+    db = Db()
+    entry = cache.food(1, lambda: db.food(1))
+    assert entry.response(request()).status_code == 200
+    assert entry.response(request(**{"If-None-Match": entry.etag})).status_code == 304
+    assert entry.response(request(**{"If-None-Match": '"khac"'})).status_code == 200
+
+
+def test_memory_generation_survives_lru_eviction():
+    cache = MenuCache(MemoryCacheBackend(max_size=1), ttl=300)
+    db = Db()
+    update_price(db, cache, 45)
+    for i in range(5):  # đẩy đầy LRU: generation không nằm trong LRU nên không bị bỏ theo
+        cache.backend.set(f"x:{i}", "{}", 300)
+    # Bản cũ đọc trước lúc invalidate (generation None) được set muộn -> vẫn bị coi là cũ
+    cache.backend.set(cache.food_key(1), '{"b":"{}","e":"","m":0,"g":null}', 300)
+    assert '"price":45' in cache.food(1, lambda: db.food(1)).body
@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from ratings import BRANCH, FOOD
+import main
+import models
+
+
+def seed():
+    with SessionLocal() as db:
+        db.add_all([
+            models.Food(id=1, name="Phở", price=50000, branch_id=1),
+            models.Food(id=2, name="Bún chả", price=45000, branch_id=1),
+            models.RatingSummary(kind=FOOD, subject_id=1, count=3, score_sum=13),
+            # Cùng subject_id nhưng là điểm quán -> không được lẫn vào món 1
+            models.RatingSummary(kind=BRANCH, subject_id=1, count=10, score_sum=20),
+        ])
+        db.commit()
+
+
+def test_food_dicts_carry_rating_summary():
+    seed()
+    with SessionLocal() as db:
+        foods = {f["id"]: f for f in main.load_food_dicts(db, models.Food.branch_id == 1)}
+    assert (foods[1]["avg_rating"], foods[1]["rating_count"]) == (4.3, 3)
+    # Chưa có review -> 0 chứ không thiếu key
+    assert (foods[2]["avg_rating"], foods[2]["rating_count"]) == (0, 0)
+
+
+def test_menu_and_detail_endpoints_expose_rating():
+    seed()
+    main.menu_cache.invalidate_food(1, 1)
+    main.menu_cache.invalidate_food(2, 1)
+    client = TestClient(main.app)
+
+    menu = {f["id"]: f for f in client.get("/foods/branch/1").json()}
+    assert menu[1]["rating_count"] == 3
+    assert client.get("/foods/1").json()["avg_rating"] == 4.3
+
+    # Review mới cộng vào summary -> sau invalidate menu thấy điểm mới
+    with SessionLocal() as db:
+        db.add(models.RatingSummary(kind=FOOD, subject_id=2, count=1, score_sum=5))
+        db.commit()
+    main.menu_cache.invalidate_food(2, 1)
+    menu = {f["id"]: f for f in client.get("/foods/branch/1").json()}
+    assert (menu[2]["avg_rating"], menu[2]["rating_count"]) == (5.0, 1)
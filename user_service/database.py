@@ -1,19 +1,12 @@
-import os
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from common.db import Database
 
-# Đọc cấu hình từ biến môi trường
-DB_USER = os.getenv("DB_ROOT_USER", "root")
-DB_PASS = os.getenv("DB_PASSWORD", "123456")
+# Engine/session + pool dựng ở common/db.py, cấu hình qua biến môi trường:
+#   USER_DB_HOST, USER_DATABASE_URL, USER_DB_POOL_SIZE, USER_DB_MAX_OVERFLOW, USER_DB_POOL_RECYCLE, ...
+database = Database("USER", "user_db")
 
-# QUAN TRỌNG: Mặc định trỏ về host 'db' (khớp với docker-compose.yml)
-DB_HOST = os.getenv("USER_DB_HOST", "db") 
-DB_NAME = "user_db"
-
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = database.engine
+SessionLocal = database.SessionLocal
+get_db = database.get_db
 
 Base = declarative_base()
\ No newline at end of file
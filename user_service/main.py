@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import database, get_db, engine, Base
+from common.lifespan import service_lifespan
 import models
 from passlib.context import CryptContext
 from jose import JWTError, jwt
@@ -16,16 +17,9 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+app = FastAPI(lifespan=service_lifespan(database))
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -212,4 +206,8 @@ def update_user_branch(user_id: int, branch_id: int, db: Session = Depends(get_d
     
     user.managed_branch_id = branch_id
     db.commit()
-    return {"message": "Updated managed_branch_id successfully"}
\ No newline at end of file
+    return {"message": "Updated managed_branch_id successfully"}
+
+# Số liệu pool kết nối DB
+@app.get("/metrics/db")
+def db_metrics(): return database.stats()